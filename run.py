@@ -3,6 +3,8 @@
 import sys
 import os
 from src.ingestion_scripts.file_iterator import extract_kg_from_doc
+from src.llms.basic_agent import BasicAgent
+from src.llms.response_cache import ResponseCache
 
 
 # nth
@@ -19,12 +21,25 @@ def ingest_kg_from_script():
     num_runs_per_function = 2  # Number of runs per function (N)
     overlap_tokens = 50  # Token overlap between windows (O)
     output_dir = "tmp_knowledge_graph"  # Directory to save the knowledge graph
+    entity_mode = "sequential"  # Phase 1 mode: "sequential" or "map" (concurrent windows)
+    pdf_workers = None  # Processes for PDF page extraction (None = in process)
+    phase2_mode = "chained"  # N=2 phase 2: "chained" or "independent" (parallel, merged)
+    llm_cache_path = "llm_cache/responses.sqlite"  # LLM response cache (None disables)
+    hedge_percentile = None  # e.g. 0.95: re-send slow calls to an equivalent deployment
+    pack_token_budget = None  # e.g. 16000: pack several phase 2 windows per request
+    stream_phase2 = False  # Merge phase 2 relations into the graph while they stream in
+    telemetry_path = "tmp_knowledge_graph/llm_telemetry"  # .jsonl and .prom exports (None disables)
 
     # Verify that the input file exists
     if not os.path.exists(file_path):
         print(f"Error: File not found: {file_path}")
         return 1
 
+    llm_agent = BasicAgent(
+        cache=ResponseCache(llm_cache_path) if llm_cache_path else None,
+        hedge_percentile=hedge_percentile,
+    )
+
     # Extract knowledge graph from the document
     knowledge_graph = extract_kg_from_doc(
         file_path=file_path,
@@ -34,12 +49,27 @@ def ingest_kg_from_script():
         num_runs_per_function=num_runs_per_function,
         overlap_tokens=overlap_tokens,
         output_dir=output_dir,
+        entity_mode=entity_mode,
+        pdf_workers=pdf_workers,
+        phase2_mode=phase2_mode,
+        llm_agent=llm_agent,
+        pack_token_budget=pack_token_budget,
+        stream_phase2=stream_phase2,
     )
 
+    if llm_agent.cache is not None:
+        print(f"LLM cache: {llm_agent.cache.stats()}")
+
+    if telemetry_path:
+        os.makedirs(os.path.dirname(telemetry_path) or ".", exist_ok=True)
+        llm_agent.telemetry.export_jsonl(f"{telemetry_path}.jsonl")
+        llm_agent.telemetry.export_prometheus(f"{telemetry_path}.prom")
+        print(f"LLM telemetry written to {telemetry_path}.jsonl and {telemetry_path}.prom")
+
     # Report success or failure
     if knowledge_graph:
-        num_entities = len(knowledge_graph.get("nodes", {}))
-        num_relations = len(knowledge_graph.get("edges", []))
+        num_entities = knowledge_graph.num_nodes
+        num_relations = knowledge_graph.num_edges
         print(
             f"\nSuccessfully extracted knowledge graph with {num_entities} entities and {num_relations} relations"
         )
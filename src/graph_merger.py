@@ -1,18 +1,54 @@
 import json
 import os
 import uuid
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
+from src.graphs.bulk_writer import DEFAULT_BATCH_SIZE, DEFAULT_BATCHES_PER_COMMIT, BulkGraphWriter
 from src.graphs.graph_client import Neo4jDriver
+from src.graphs.knowledge_graph import KnowledgeGraph
 from src.vectors.vector_client import DefaultEmbeddings, VectorStore
 from tqdm import tqdm  # Import tqdm for progress bars
 
+# Node contents sent per embedding request
+EMBEDDING_BATCH_SIZE = 256
+# Nearest stored nodes retrieved per node
+DEFAULT_TOP_K = 5
+
 class GraphMerger:
-    def __init__(self, vector_store_name="vector_database", similarity_threshold=0.85):  # Increased threshold for better matching
+    def __init__(self, vector_store_name="vector_database", similarity_threshold=0.85,  # Increased threshold for better matching
+                 embedding_batch_size=EMBEDDING_BATCH_SIZE, top_k=DEFAULT_TOP_K, flush_every=None,
+                 write_batch_size=DEFAULT_BATCH_SIZE, batches_per_commit=DEFAULT_BATCHES_PER_COMMIT,
+                 use_apoc=False):
+        """
+        :param vector_store_name: Directory of the FAISS vector store
+        :param similarity_threshold: Minimum similarity for a node to match an existing one
+        :param embedding_batch_size: Node contents sent per embedding request
+        :param top_k: Nearest stored nodes retrieved per node
+        :param flush_every: Save the vector store after this many new nodes
+            (None = only at the end of each merge)
+        :param write_batch_size: Nodes / relationships written to Neo4j per UNWIND batch
+        :param batches_per_commit: UNWIND batches committed per transaction
+        :param use_apoc: Merge relationships with apoc.merge.relationship
+        """
         self.vector_store_name = vector_store_name
         self.similarity_threshold = similarity_threshold
+        self.embedding_batch_size = embedding_batch_size
+        self.top_k = top_k
+        self.flush_every = flush_every
         self.embeddings = DefaultEmbeddings().set_embeddings()
         self.vector_store = VectorStore(self.vector_store_name)
+        # Kept open in memory for the whole session; new nodes are searchable
+        # at once and written to disk by flush()
         self.loaded_vector_store = self.vector_store.load_vector_store(self.embeddings)
+        self.unsaved_nodes = 0
+        # One Neo4j driver (connection pool) and bulk writer for the whole session
+        self.write_batch_size = write_batch_size
+        self.batches_per_commit = batches_per_commit
+        self.use_apoc = use_apoc
+        self.graph_driver = None
+        self.graph_writer = None
         # Track similarity scores for debugging
         self.similarity_scores = []
         
@@ -21,7 +57,12 @@ class GraphMerger:
         Merge nodes and relationships from a JSON file into the existing graph.
         For each node, check if a similar node already exists in the vector store.
         If it does, use that node's ID for creating relationships.
-        If not, create a new node and embed it.
+        If not, create a new node and embed it. The vector store is saved once at
+        the end (and every flush_every new nodes).
+        
+        All node contents are embedded in batches of embedding_batch_size and
+        searched with a single query matrix. A node without a match in the store
+        is also compared with the nodes already added from the same file.
         
         :param json_file_path: Path to the JSON file containing nodes and edges data
         :return: Summary of the merge operation
@@ -30,9 +71,8 @@ class GraphMerger:
             # Reset similarity scores
             self.similarity_scores = []
             
-            # Load JSON data
-            with open(json_file_path, 'r') as file:
-                data = json.load(file)
+            # Load JSON data (duplicate edges are dropped by the graph index)
+            graph = KnowledgeGraph.load_json(json_file_path)
             
             # Extract source_uri from JSON file
             json_source_uri = os.path.basename(json_file_path)
@@ -43,6 +83,7 @@ class GraphMerger:
                 'nodes_added': 0,
                 'nodes_matched': 0,
                 'edges_added': 0,
+                'edges_merged': 0,
                 'errors': []
             }
             
@@ -56,31 +97,52 @@ class GraphMerger:
                 print(f"Vector store loaded with similarity threshold: {self.similarity_threshold}")
             
             # Process nodes
-            if 'nodes' in data:
-                total_nodes = len(data['nodes'])
+            if graph.nodes:
+                total_nodes = graph.num_nodes
                 print(f"Processing {total_nodes} nodes from JSON...")
                 
-                # Use tqdm for progress bar
-                for node_name, node_data in tqdm(data.get('nodes', {}).items(), total=total_nodes, desc="Processing nodes"):
-                    # Set source_uri if not present
+                # Set source_uri if not present
+                for node_data in graph.nodes.values():
                     if 'source_uri' not in node_data:
                         node_data['source_uri'] = json_source_uri
+                
+                # Embed all nodes in a few batched requests and search them in one go
+                matches = self._match_nodes_batch(list(graph.nodes.items()))
+                
+                # Nodes added from this document, so later nodes can match them
+                batch_index = None
+                batch_ids = []
+                
+                # Use tqdm for progress bar
+                for match in tqdm(matches, total=total_nodes, desc="Processing nodes"):
+                    node_name = match['name']
+                    similar_node = match['match']
                     
-                    # Create node content for similarity comparison
-                    node_content = self._create_node_content(node_name, node_data)
-                    
-                    # Check if a similar node exists
-                    similar_node, similarity = self._find_similar_node(node_content)
+                    if similar_node is None and batch_ids:
+                        similar_id = self._find_in_batch(batch_index, batch_ids, match['vector'])
+                    else:
+                        similar_id = None
                     
                     if similar_node:
                         # Use the existing node's ID
                         node_id_map[node_name] = similar_node.metadata['my_id']
                         stats['nodes_matched'] += 1
+                    elif similar_id:
+                        # Same concept as a node added earlier from this document
+                        node_id_map[node_name] = similar_id
+                        stats['nodes_matched'] += 1
                     else:
-                        # Create a new node and embed it
-                        node_id = self._add_new_node(node_name, node_data)
+                        # Create a new node and embed it (reusing its vector)
+                        node_id = self._add_new_node(node_name, match['data'], vector=match['vector'])
                         node_id_map[node_name] = node_id
                         stats['nodes_added'] += 1
+                        if batch_index is None:
+                            batch_index = faiss.IndexFlatL2(len(match['vector']))
+                        batch_index.add(self._prepare_queries([match['vector']]))
+                        batch_ids.append(node_id)
+                
+                # Relationships are matched on the new nodes, so write them first
+                self._get_graph_writer().flush()
                 
                 # Print interim stats after node processing
                 print(f"\nNode processing complete:")
@@ -88,30 +150,41 @@ class GraphMerger:
                 print(f"- Nodes matched: {stats['nodes_matched']}")
             
             # Process edges
-            if 'edges' in data:
-                total_edges = len(data['edges'])
+            if graph.edges:
+                total_edges = graph.num_edges
                 print(f"\nProcessing {total_edges} relationships...")
+                graph_writer = self._get_graph_writer()
+                written_before = graph_writer.stats['relationships_written']
+                created_before = graph_writer.stats['relationships_created']
                 
-                for edge in tqdm(data.get('edges', []), total=total_edges, desc="Processing relationships"):
-                    source = edge.get('source')
-                    target = edge.get('target')
-                    relation = edge.get('relation')
+                for edge in tqdm(graph.edges, total=total_edges, desc="Processing relationships"):
+                    source = edge.source
+                    target = edge.target
+                    relation = edge.relation
                     # Use JSON filename as source_uri if not specified
-                    source_uri = edge.get('source_uri', json_source_uri)
+                    source_uri = edge.source_uri or json_source_uri
                     
                     if source in node_id_map and target in node_id_map:
-                        # Add relationship
-                        success = self._add_relationship(
+                        # Queue relationship
+                        self._add_relationship(
                             source_id=node_id_map[source],
                             target_id=node_id_map[target],
                             relation=relation,
                             source_uri=source_uri
                         )
-                        if success:
-                            stats['edges_added'] += 1
                     else:
                         error_msg = f"Could not create relationship: {source}-[{relation}]->{target}"
                         stats['errors'].append(error_msg)
+                
+                # Write the queued relationships in batches grouped by type
+                try:
+                    graph_writer.flush()
+                except Exception as e:
+                    print(f"Error adding relationships: {e}")
+                    stats['errors'].append(f"Error adding relationships: {e}")
+                # Edges already in the graph only have their provenance updated
+                stats['edges_merged'] = graph_writer.stats['relationships_written'] - written_before
+                stats['edges_added'] = graph_writer.stats['relationships_created'] - created_before
             
             # Debug: Analyze similarity scores
             if self.similarity_scores:
@@ -136,6 +209,12 @@ class GraphMerger:
                 'success': False,
                 'error': str(e)
             }
+        finally:
+            # Nodes added so far must be in Neo4j and findable by the next merge
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing merge session: {e}")
     
     def _create_node_content(self, node_name, node_data):
         """Create content string for a node to be used for similarity comparison"""
@@ -145,6 +224,98 @@ class GraphMerger:
         
         return f"{node_name}: {'; '.join(properties)}"
     
+    def _embed_contents(self, contents):
+        """
+        Embed node contents in batches of embedding_batch_size.
+        
+        :param contents: List of node content strings
+        :return: float32 matrix with one row per content
+        """
+        vectors = []
+        batch_starts = range(0, len(contents), self.embedding_batch_size)
+        for start in tqdm(batch_starts, desc="Embedding nodes", disable=len(batch_starts) < 2):
+            vectors.extend(
+                self.embeddings.embed_documents(contents[start:start + self.embedding_batch_size])
+            )
+        return np.asarray(vectors, dtype=np.float32)
+    
+    def _prepare_queries(self, vectors):
+        """Copy of the vectors as the vector store would search them (L2-normalized if it normalizes)"""
+        queries = np.array(vectors, dtype=np.float32)
+        if self.loaded_vector_store is not None and getattr(self.loaded_vector_store, '_normalize_L2', False):
+            faiss.normalize_L2(queries)
+        return queries
+    
+    def _search_vector_store(self, vectors, k):
+        """
+        Search the vector store for all vectors with a single index.search.
+        
+        :param vectors: Query matrix, one row per node
+        :param k: Number of nearest stored nodes per query
+        :return: For every query, a list of (document, similarity), most similar first
+        """
+        results = [[] for _ in range(len(vectors))]
+        store = self.loaded_vector_store
+        if store is None or len(vectors) == 0 or store.index.ntotal == 0:
+            return results
+        
+        scores, indices = store.index.search(self._prepare_queries(vectors), min(k, store.index.ntotal))
+        for row, (row_scores, row_indices) in enumerate(zip(scores, indices)):
+            for score, index in zip(row_scores, row_indices):
+                if index == -1:
+                    continue
+                doc = store.docstore.search(store.index_to_docstore_id[int(index)])
+                if isinstance(doc, Document):
+                    # Same distance-to-similarity conversion as _find_similar_node
+                    results[row].append((doc, 1.0 - float(score)))
+        return results
+    
+    def _match_nodes_batch(self, nodes):
+        """
+        Find the most similar stored node for every node of a document.
+        
+        Node contents are embedded in batches and searched with one query
+        matrix instead of one embedding call and one search per node.
+        
+        :param nodes: List of (node_name, node_data)
+        :return: One dict per node: name, data, vector, match (document above the
+            threshold or None), similarity and the top-k candidates
+        """
+        contents = [self._create_node_content(node_name, node_data) for node_name, node_data in nodes]
+        vectors = self._embed_contents(contents) if contents else np.zeros((0, 0), dtype=np.float32)
+        try:
+            candidates = self._search_vector_store(vectors, self.top_k)
+        except Exception as e:
+            print(f"Error in similarity search: {e}")
+            candidates = [[] for _ in nodes]
+        
+        matches = []
+        for (node_name, node_data), vector, node_candidates in zip(nodes, vectors, candidates):
+            match, similarity = None, 0.0
+            if node_candidates:
+                # Store similarity score for debugging
+                self.similarity_scores.append(node_candidates[0][1])
+                for doc, candidate_similarity in node_candidates:
+                    if candidate_similarity >= self.similarity_threshold and 'my_id' in doc.metadata:
+                        match, similarity = doc, candidate_similarity
+                        break
+            matches.append({
+                'name': node_name,
+                'data': node_data,
+                'vector': vector,
+                'match': match,
+                'similarity': similarity,
+                'candidates': node_candidates,
+            })
+        return matches
+    
+    def _find_in_batch(self, batch_index, batch_ids, vector):
+        """Return the id of a node added from the current document similar to vector, or None"""
+        scores, indices = batch_index.search(self._prepare_queries([vector]), 1)
+        if indices[0][0] != -1 and 1.0 - float(scores[0][0]) >= self.similarity_threshold:
+            return batch_ids[int(indices[0][0])]
+        return None
+    
     def _find_similar_node(self, node_content):
         """Find a similar node in the vector store using similarity search"""
         if not self.loaded_vector_store:
@@ -174,8 +345,8 @@ class GraphMerger:
             print(f"Error in similarity search: {e}")
             return None, 0.0
     
-    def _add_new_node(self, node_name, node_data):
-        """Add a new node to the graph database and embed it in the vector store"""
+    def _add_new_node(self, node_name, node_data, vector=None):
+        """Add a new node to the graph database and embed it in the vector store (vector: precomputed embedding)"""
         # Create a UUID for the new node
         node_id = str(uuid.uuid4())
         
@@ -201,62 +372,97 @@ class GraphMerger:
         # Merge all properties
         all_properties = {**base_properties, **attribute_properties}
         
-        # Create node in Neo4j using a simpler approach
-        with Neo4jDriver() as driver:
-            # Use Neo4j's UNWIND to set properties safely
-            query = (
-                "MERGE (n:Term {name: $name}) "
-                "SET n.uuid = $uuid, n.source_uri = $source_uri "
-            )
-            
-            # Set attributes separately to avoid query building issues
-            driver.run_query(query, parameters=base_properties)
-            
-            # Add each attribute property individually if there are any
-            if attribute_properties:
-                for key, value in attribute_properties.items():
-                    property_query = f"MATCH (n:Term {{name: $name}}) SET n.{key} = $value"
-                    driver.run_query(property_query, parameters={'name': node_name, 'value': value})
+        # Queue the node; it is written with the rest of its batch (one UNWIND transaction)
+        self._get_graph_writer().add_node(node_name, all_properties)
             
         # Embed the node in vector store with original property names
         node_content = self._create_node_content(node_name, node_data)
-        self._embed_node(node_name, node_content, node_id)
+        self._embed_node(node_name, node_content, node_id, vector=vector)
         
         return node_id
     
-    def _embed_node(self, node_name, node_content, node_id):
-        """Embed a node in the vector store"""
+    def _embed_node(self, node_name, node_content, node_id, vector=None):
+        """Embed a node in the vector store (vector: precomputed embedding, skips the embedding call)"""
         metadata = {
             'my_id': node_id,
             'name': node_name,
             'label': 'Term'  # Default label used in Neo4j
         }
         
-        document = Document(page_content=node_content, metadata=metadata)
+        if vector is None:
+            vector = self.embeddings.embed_documents([node_content])[0]
+        text_embeddings = [(node_content, list(map(float, vector)))]
         
         if self.loaded_vector_store:
-            # Update existing vector store
-            self.vector_store.save_or_update_vector_store([document], self.embeddings)
+            # Add to the in-memory vector store
+            self.loaded_vector_store.add_embeddings(text_embeddings, metadatas=[metadata])
         else:
-            # Create a new vector store
-            self.loaded_vector_store = self.vector_store.save_or_update_vector_store([document], self.embeddings)
+            # Create a new in-memory vector store
+            self.loaded_vector_store = FAISS.from_embeddings(text_embeddings, self.embeddings, metadatas=[metadata])
+        
+        self.unsaved_nodes += 1
+        if self.flush_every and self.unsaved_nodes >= self.flush_every:
+            self.flush()
+    
+    def _get_graph_writer(self):
+        """Bulk node writer over the session's Neo4j driver, created on first use"""
+        if self.graph_writer is None:
+            self.graph_driver = Neo4jDriver().__enter__()
+            self.graph_writer = BulkGraphWriter(
+                self.graph_driver,
+                batch_size=self.write_batch_size,
+                batches_per_commit=self.batches_per_commit,
+                use_apoc=self.use_apoc,
+            )
+            self.graph_writer.ensure_constraints()
+        return self.graph_writer
+    
+    def flush(self):
+        """
+        Write the queued nodes to Neo4j, then save the in-memory vector store
+        to disk if it has unsaved nodes (so it never points at unwritten nodes)
+        """
+        if self.graph_writer is not None:
+            self.graph_writer.flush_nodes()
+        if self.loaded_vector_store is None or not self.unsaved_nodes:
+            return
+        self.vector_store.save_vector_store(self.loaded_vector_store)
+        print(f"Saved vector store with {self.unsaved_nodes} new nodes")
+        self.unsaved_nodes = 0
+    
+    def close(self):
+        """Flush the session (including queued relationships) and close the Neo4j driver"""
+        try:
+            self.flush()
+            if self.graph_writer is not None:
+                self.graph_writer.flush()
+        finally:
+            if self.graph_driver is not None:
+                self.graph_driver.__exit__(None, None, None)
+            self.graph_driver = None
+            self.graph_writer = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
     
     def _add_relationship(self, source_id, target_id, relation, source_uri):
-        """Add a relationship between two nodes using their UUIDs"""
+        """
+        Queue a relationship between two nodes using their UUIDs (written by the
+        next flush of the writer). It is merged on (source, relation, target),
+        adding source_uri to its provenance if it already exists.
+        """
         try:
-            with Neo4jDriver() as driver:
-                # Create relationship with source_uri and uuid as properties
-                query = (
-                    f"MATCH (source:Term {{uuid: $source_id}}), (target:Term {{uuid: $target_id}}) "
-                    f"MERGE (source)-[r:`{relation}` {{source_uri: $source_uri, uuid: $uuid}}]->(target)"
-                )
-                driver.run_query(query, parameters={
-                    'source_id': source_id, 
-                    'target_id': target_id, 
-                    'source_uri': source_uri,
-                    'uuid': str(uuid.uuid4())  # Add UUID for the relationship
-                })
-                return True
+            self._get_graph_writer().add_relationship(
+                source_id,
+                relation,
+                target_id,
+                source_uri,
+                match_key='uuid',
+            )
+            return True
         except Exception as e:
             print(f"Error adding relationship: {e}")
             return False
@@ -271,27 +477,25 @@ class GraphMerger:
         :return: Analysis results
         """
         try:
-            with open(json_file_path, 'r') as file:
-                data = json.load(file)
+            graph = KnowledgeGraph.load_json(json_file_path)
             
             matched = 0
             would_add = 0
             similarity_data = []
             
-            if 'nodes' in data:
-                print(f"Analyzing {len(data['nodes'])} nodes with threshold {self.similarity_threshold}...")
+            if graph.nodes:
+                print(f"Analyzing {graph.num_nodes} nodes with threshold {self.similarity_threshold}...")
                 
-                # Add progress bar for analysis
-                for node_name, node_data in tqdm(data.get('nodes', {}).items(), desc="Analyzing nodes"):
-                    node_content = self._create_node_content(node_name, node_data)
-                    similar_node, similarity = self._find_similar_node(node_content)
+                # Embed and search all nodes in batches
+                for match in self._match_nodes_batch(list(graph.nodes.items())):
+                    similar_node = match['match']
                     
                     if similar_node:
                         matched += 1
                         similarity_data.append({
-                            'new_node': node_name, 
+                            'new_node': match['name'], 
                             'matched_node': similar_node.metadata.get('name'),
-                            'similarity': similarity
+                            'similarity': match['similarity']
                         })
                     else:
                         would_add += 1
@@ -352,6 +556,7 @@ if __name__ == "__main__":
             print(f"- Nodes added: {result.get('nodes_added', 0)}")
             print(f"- Nodes matched: {result.get('nodes_matched', 0)}")
             print(f"- Edges added: {result.get('edges_added', 0)}")
+            print(f"- Edges merged: {result.get('edges_merged', 0)}")
             
             if result.get('errors', []):
                 print("Errors:")
@@ -361,3 +566,5 @@ if __name__ == "__main__":
             print("Merge operation cancelled.")
     else:
         print(f"JSON file not found: {json_path}")
+    
+    merger.close()
@@ -0,0 +1,260 @@
+import uuid
+from functools import lru_cache
+
+# Rows written per UNWIND batch
+DEFAULT_BATCH_SIZE = 1000
+# UNWIND batches committed per transaction
+DEFAULT_BATCHES_PER_COMMIT = 1
+# Node properties relationships can be matched on
+MATCH_KEYS = ("name", "uuid")
+
+TERM_NAME_CONSTRAINT_QUERY = (
+    "CREATE CONSTRAINT unique_term_name IF NOT EXISTS FOR (n:Term) REQUIRE n.name IS UNIQUE"
+)
+TERM_UUID_INDEX_QUERY = "CREATE INDEX term_uuid IF NOT EXISTS FOR (n:Term) ON (n.uuid)"
+NODE_UPSERT_QUERY = (
+    "UNWIND $rows AS row "
+    "MERGE (n:Term {name: row.name}) "
+    "SET n += row.props "
+    "RETURN count(n) AS written"
+)
+
+
+def escape_identifier(identifier):
+    """Quote a label or relationship type for Cypher (backticks inside are doubled)."""
+    return "`" + str(identifier).replace("`", "``") + "`"
+
+
+# Provenance accumulated on every upsert of a relationship (r is the merged
+# relationship): the source_uris it was seen in, when it was first and last
+# seen, and occurrences, the number of distinct documents it was seen in (so
+# re-ingesting a document leaves it unchanged). Legacy relationships without
+# provenance are upgraded in place. Returns the number of rows merged, which
+# excludes rows whose source or target node was not found.
+RELATIONSHIP_PROVENANCE_SET = (
+    "SET r += row.props, "
+    "r.uuid = coalesce(r.uuid, row.uuid), "
+    "r.first_seen = coalesce(r.first_seen, datetime()), "
+    "r.last_seen = datetime(), "
+    "r.occurrences = CASE "
+    "WHEN r.occurrences IS NULL THEN 1 "
+    "WHEN row.source_uri IS NULL OR row.source_uri IN coalesce(r.source_uris, []) "
+    "THEN r.occurrences "
+    "ELSE r.occurrences + 1 END, "
+    "r.source_uri = coalesce(r.source_uri, row.source_uri), "
+    "r.source_uris = CASE "
+    "WHEN row.source_uri IS NULL OR row.source_uri IN coalesce(r.source_uris, []) "
+    "THEN coalesce(r.source_uris, []) "
+    "ELSE coalesce(r.source_uris, []) + row.source_uri END "
+    "RETURN count(r) AS written"
+)
+
+
+@lru_cache(maxsize=None)
+def relationship_upsert_query(relation, match_key="name", use_apoc=False):
+    """
+    UNWIND query upserting a batch of relationships of one type on their
+    natural key (source, type, target), so writing the same relationship again
+    only updates its provenance (see RELATIONSHIP_PROVENANCE_SET).
+
+    The relationship type cannot be a query parameter in plain Cypher, so there
+    is one query text (and one cached plan) per type. With APOC the type is
+    passed as $relation and every type shares a single query.
+
+    :param relation: Relationship type
+    :param match_key: Term property the rows' source/target values refer to
+    :param use_apoc: Use apoc.merge.relationship instead of MERGE
+    """
+    if match_key not in MATCH_KEYS:
+        raise ValueError(f"Unsupported match key: {match_key}")
+    match_clause = (
+        "UNWIND $rows AS row "
+        f"MATCH (source:Term {{{match_key}: row.source}}), (target:Term {{{match_key}: row.target}}) "
+    )
+    if use_apoc:
+        merge_clause = "CALL apoc.merge.relationship(source, $relation, {}, {}, target, {}) YIELD rel AS r "
+    else:
+        merge_clause = f"MERGE (source)-[r:{escape_identifier(relation)}]->(target) "
+    return match_clause + merge_clause + RELATIONSHIP_PROVENANCE_SET
+
+
+def _write_batches(tx, batches):
+    """Run the batches; returns the rows each wrote and the (nodes, relationships) created."""
+    written = []
+    nodes_created = relationships_created = 0
+    for query, parameters in batches:
+        result = tx.run(query, **parameters)
+        written.append(result.single()["written"])
+        counters = result.consume().counters
+        nodes_created += counters.nodes_created
+        relationships_created += counters.relationships_created
+    return written, nodes_created, relationships_created
+
+
+class BulkGraphWriter:
+    """
+    Buffers node and relationship upserts and writes them in UNWIND batches
+    over the connection pool of a shared Neo4jDriver.
+
+    Nodes are written before relationships so relationships can match them.
+    Relationships are grouped by type, so each group reuses one query plan,
+    and merged on (source, type, target): writing the same data twice does
+    not grow the graph.
+
+    Usage:
+        with Neo4jDriver() as driver:
+            writer = BulkGraphWriter(driver, batch_size=1000)
+            writer.ensure_constraints()
+            for name, properties in nodes:
+                writer.add_node(name, properties)
+            for source, relation, target, source_uri in edges:
+                writer.add_relationship(source, relation, target, source_uri)
+            writer.flush()
+    """
+
+    def __init__(self, graph_driver, batch_size=DEFAULT_BATCH_SIZE,
+                 batches_per_commit=DEFAULT_BATCHES_PER_COMMIT, use_apoc=False):
+        """
+        :param graph_driver: An open Neo4jDriver; its driver is reused for every batch
+        :param batch_size: Number of rows per UNWIND batch
+        :param batches_per_commit: Number of batches committed in one transaction
+            (rows are also buffered until batch_size * batches_per_commit are queued)
+        :param use_apoc: Merge relationships with apoc.merge.relationship
+        """
+        self.graph_driver = graph_driver
+        self.batch_size = max(1, int(batch_size))
+        self.batches_per_commit = max(1, int(batches_per_commit))
+        self.use_apoc = use_apoc
+        self._node_rows = []
+        self._relationship_rows = {}  # (match_key, relation) -> rows
+        self._pending_relationships = 0
+        self.stats = {
+            'nodes_written': 0,
+            'nodes_created': 0,
+            'relationships_written': 0,  # Rows merged (endpoints found)
+            'relationships_created': 0,
+            'relationships_skipped': 0,  # Rows whose source or target was missing
+            'batches': 0,
+            'transactions': 0,
+        }
+
+    @property
+    def _flush_threshold(self):
+        return self.batch_size * self.batches_per_commit
+
+    def ensure_constraints(self):
+        """
+        Create the unique constraint on Term.name and the index on Term.uuid;
+        the batched MERGE/MATCH clauses need them to be index lookups.
+        """
+        self.graph_driver.run_query(TERM_NAME_CONSTRAINT_QUERY)
+        self.graph_driver.run_query(TERM_UUID_INDEX_QUERY)
+
+    def _commit(self, batches):
+        """
+        Write (query, parameters) batches, batches_per_commit per managed
+        transaction; returns the number of rows the queries reported written.
+        """
+        total_written = 0
+        for start in range(0, len(batches), self.batches_per_commit):
+            transaction_batches = batches[start:start + self.batches_per_commit]
+            # Managed transaction: retried by the driver on transient errors
+            with self.graph_driver.driver.session() as session:
+                written, nodes_created, relationships_created = session.execute_write(
+                    _write_batches, transaction_batches
+                )
+            total_written += sum(written)
+            self.stats['nodes_created'] += nodes_created
+            self.stats['relationships_created'] += relationships_created
+            self.stats['batches'] += len(transaction_batches)
+            self.stats['transactions'] += 1
+        return total_written
+
+    def _row_batches(self, rows):
+        return [rows[i:i + self.batch_size] for i in range(0, len(rows), self.batch_size)]
+
+    def add_node(self, name, properties):
+        """
+        Queue a node upsert: MERGE (n:Term {name}) SET n += properties.
+
+        :param name: Node name (the merge key)
+        :param properties: Properties to set (values must be Neo4j property types)
+        """
+        self._node_rows.append({'name': name, 'props': properties})
+        if len(self._node_rows) >= self._flush_threshold:
+            self.flush_nodes()
+
+    def add_relationship(self, source, relation, target, source_uri=None, properties=None,
+                         match_key="name"):
+        """
+        Queue a relationship upsert between two Term nodes. A new relationship
+        gets a uuid; an existing one only has its provenance updated.
+
+        :param source: match_key value of the source node
+        :param relation: Relationship type (any string; it is escaped)
+        :param target: match_key value of the target node
+        :param source_uri: Document the relationship was extracted from
+        :param properties: Other properties to set on the relationship
+        :param match_key: Term property used to find the nodes ("name" or "uuid")
+        """
+        if not relation:
+            raise ValueError("Relationship type must not be empty")
+        if match_key not in MATCH_KEYS:
+            raise ValueError(f"Unsupported match key: {match_key}")
+        rows = self._relationship_rows.setdefault((match_key, relation), [])
+        rows.append({
+            'source': source,
+            'target': target,
+            'source_uri': source_uri or None,
+            'uuid': str(uuid.uuid4()),  # Only used if the relationship is created
+            'props': properties or {},
+        })
+        self._pending_relationships += 1
+        if self._pending_relationships >= self._flush_threshold:
+            self.flush_relationships()
+
+    def flush_nodes(self):
+        """Write the queued nodes; returns the number written."""
+        if not self._node_rows:
+            return 0
+        rows = self._node_rows
+        written = self._commit(
+            [(NODE_UPSERT_QUERY, {'rows': batch}) for batch in self._row_batches(rows)]
+        )
+        # Only drop the rows once they are committed
+        self._node_rows = []
+        self.stats['nodes_written'] += written
+        return written
+
+    def flush_relationships(self):
+        """
+        Write the queued nodes, then the queued relationships; returns the
+        number of relationships merged (rows with a missing endpoint are skipped).
+        """
+        self.flush_nodes()
+        written = 0
+        for key in list(self._relationship_rows):
+            match_key, relation = key
+            rows = self._relationship_rows[key]
+            query = relationship_upsert_query(relation, match_key, self.use_apoc)
+            batches = []
+            for batch in self._row_batches(rows):
+                parameters = {'rows': batch}
+                if self.use_apoc:
+                    parameters['relation'] = relation
+                batches.append((query, parameters))
+            group_written = self._commit(batches)
+            del self._relationship_rows[key]
+            self._pending_relationships -= len(rows)
+            self.stats['relationships_written'] += group_written
+            self.stats['relationships_skipped'] += len(rows) - group_written
+            written += group_written
+        return written
+
+    def flush(self):
+        """Write everything still queued."""
+        self.flush_relationships()
+
+    @property
+    def pending(self):
+        return len(self._node_rows) + self._pending_relationships
@@ -3,12 +3,13 @@ import os
 #import re
 from langchain_community.graphs import Neo4jGraph
 from neo4j import GraphDatabase
-import json
 import uuid
 #import networkx as nx
 #import matplotlib.pyplot as plt
 
 from src.vectors.vector_client import VectorStore
+from src.graphs.knowledge_graph import KnowledgeGraph
+from src.graphs.bulk_writer import DEFAULT_BATCH_SIZE, DEFAULT_BATCHES_PER_COMMIT, BulkGraphWriter
 
 
 load_dotenv()
@@ -97,27 +98,42 @@ class Neo4jDriver:
         for item in rels_by_source:
             print(f"  {item['source']}: {item['count']}")
 
-    def import_from_json(self, json_file_path):
+    def import_from_json(self, json_file_path, batch_size=DEFAULT_BATCH_SIZE,
+                         batches_per_commit=DEFAULT_BATCHES_PER_COMMIT, use_apoc=False):
         """
         Import nodes and edges from a JSON file into Neo4j.
         All nodes will be created with the label 'Term'.
         Includes source_uri and uuid as properties for both nodes and relationships.
+        Relationships are merged on (source, type, target) and accumulate
+        provenance (source_uris, first_seen, last_seen, occurrences), so
+        importing the same file again does not duplicate them.
+        Nodes and relationships are written in UNWIND batches of batch_size,
+        relationships grouped by type.
         
         :param json_file_path: Path to the JSON file containing nodes and edges data
+        :param batch_size: Number of nodes / relationships per UNWIND batch
+        :param batches_per_commit: Number of batches committed per transaction
+        :param use_apoc: Merge relationships with apoc.merge.relationship
         :return: Summary of the import operation
         """
         try:
-            # Load JSON data
-            with open(json_file_path, 'r') as file:
-                data = json.load(file)
+            # Load JSON data (duplicate edges are dropped by the graph index)
+            graph = KnowledgeGraph.load_json(json_file_path)
+            
+            writer = BulkGraphWriter(
+                self,
+                batch_size=batch_size,
+                batches_per_commit=batches_per_commit,
+                use_apoc=use_apoc,
+            )
             
             # Create unique constraint if it doesn't exist
-            self.run_query("CREATE CONSTRAINT unique_term_name IF NOT EXISTS FOR (n:Term) REQUIRE n.name IS UNIQUE")
+            writer.ensure_constraints()
             
             # Process nodes
             nodes_count = 0
-            if 'nodes' in data:
-                for node_name, node_data in data.get('nodes', {}).items():
+            if graph.nodes:
+                for node_name, node_data in graph.nodes.items():
                     # Include source_uri and uuid as properties of the node
                     properties = {
                         'name': node_name,
@@ -129,41 +145,33 @@ class Neo4jDriver:
                     for attr_key, attr_value in node_data.get('attributes', {}).items():
                         properties[attr_key] = attr_value
                     
-                    # Create node with all properties including source_uri and uuid
-                    query = (
-                        "MERGE (n:Term {name: $name}) "
-                        "SET n += $properties"
-                    )
-                    self.run_query(query, parameters={'name': node_name, 'properties': properties})
+                    # Queue node with all properties including source_uri and uuid
+                    writer.add_node(node_name, properties)
                     nodes_count += 1
+                
+                # Nodes must exist before the relationships are matched
+                writer.flush()
             
             # Process edges
-            edges_count = 0
-            if 'edges' in data:
-                for edge in data.get('edges', []):
-                    source = edge.get('source')
-                    target = edge.get('target')
-                    relation = edge.get('relation')
-                    source_uri = edge.get('source_uri', '')
+            if graph.edges:
+                for edge in graph.edges:
+                    source = edge.source
+                    target = edge.target
+                    relation = edge.relation
                     
                     if source and target and relation:
-                        # Create relationship with source_uri and uuid as properties
-                        query = (
-                            f"MATCH (source:Term {{name: $source}}), (target:Term {{name: $target}}) "
-                            f"MERGE (source)-[r:`{relation}` {{source_uri: $source_uri, uuid: $uuid}}]->(target)"
-                        )
-                        self.run_query(query, parameters={
-                            'source': source, 
-                            'target': target, 
-                            'source_uri': source_uri,
-                            'uuid': str(uuid.uuid4())  # Add UUID for the relationship
-                        })
-                        edges_count += 1
+                        # Queue relationship upsert; provenance accumulates on re-import
+                        writer.add_relationship(source, relation, target, edge.source_uri)
+                
+                # Write the queued relationships in batches grouped by type
+                writer.flush()
             
             return {
                 'success': True,
                 'nodes_imported': nodes_count,
-                'edges_imported': edges_count
+                'edges_imported': writer.stats['relationships_written'],
+                'edges_created': writer.stats['relationships_created'],
+                'edges_skipped': writer.stats['relationships_skipped']
             }
             
         except Exception as e:
@@ -0,0 +1,215 @@
+import json
+import os
+
+
+class Edge:
+    """A single relation between two nodes of a KnowledgeGraph."""
+
+    __slots__ = ("source", "relation", "target", "source_uri", "properties")
+
+    def __init__(self, source, relation, target, source_uri=None, properties=None):
+        self.source = source
+        self.relation = relation
+        self.target = target
+        self.source_uri = source_uri
+        self.properties = properties  # Any extra keys found in the JSON edge
+
+    @property
+    def key(self):
+        return (self.source, self.relation, self.target)
+
+    def to_dict(self):
+        edge = {
+            "source": self.source,
+            "relation": self.relation,
+            "target": self.target,
+        }
+        if self.source_uri is not None:
+            edge["source_uri"] = self.source_uri
+        if self.properties:
+            edge.update(self.properties)
+        return edge
+
+    def __repr__(self):
+        return f"Edge({self.source!r} -[{self.relation}]-> {self.target!r})"
+
+
+class KnowledgeGraph:
+    """
+    Nodes (entities with attributes) and edges (relations) of a knowledge graph.
+
+    Edges are indexed by (source, relation, target) and by node, so duplicate
+    checks and neighbor lookups do not scan the edge list. Serializes to the
+    {"nodes": {...}, "edges": [...]} JSON shape used in tmp_knowledge_graph/.
+    """
+
+    def __init__(self):
+        self.nodes = {}  # node name -> {"attributes": {...}, ...}
+        self.edges = []  # Edge records in insertion order
+        self._edge_index = {}  # (source, relation, target) -> Edge
+        self._outgoing = {}  # node name -> {edge key: Edge}
+        self._incoming = {}  # node name -> {edge key: Edge}
+
+    def __contains__(self, node_name):
+        return node_name in self.nodes
+
+    @property
+    def num_nodes(self):
+        return len(self.nodes)
+
+    @property
+    def num_edges(self):
+        return len(self.edges)
+
+    # --- Nodes ---
+    def add_node(self, node_name, attributes=None, **properties):
+        """
+        Add a node if it does not exist yet and return its data dict.
+
+        :param node_name: Name of the node (entity)
+        :param attributes: Optional attributes merged into the node
+        :param properties: Other node properties, e.g. source_uri
+        :return: The node data dict
+        """
+        node = self.nodes.get(node_name)
+        if node is None:
+            node = {"attributes": {}}
+            self.nodes[node_name] = node
+        if attributes:
+            node["attributes"].update(attributes)
+        node.update(properties)
+        return node
+
+    def has_node(self, node_name):
+        return node_name in self.nodes
+
+    def update_attributes(self, node_name, attributes):
+        """Merge attributes into an existing node. Returns False if the node is unknown."""
+        node = self.nodes.get(node_name)
+        if node is None:
+            return False
+        node.setdefault("attributes", {}).update(attributes)
+        return True
+
+    # --- Edges ---
+    def add_edge(self, source, relation, target, source_uri=None, properties=None):
+        """
+        Add an edge unless an identical (source, relation, target) edge exists.
+
+        :return: The new Edge, or None if the edge was already in the graph
+        """
+        key = (source, relation, target)
+        if key in self._edge_index:
+            return None
+        edge = Edge(source, relation, target, source_uri, properties)
+        self.edges.append(edge)
+        self._edge_index[key] = edge
+        self._outgoing.setdefault(source, {})[key] = edge
+        self._incoming.setdefault(target, {})[key] = edge
+        return edge
+
+    def has_edge(self, source, relation, target):
+        return (source, relation, target) in self._edge_index
+
+    def get_edge(self, source, relation, target):
+        return self._edge_index.get((source, relation, target))
+
+    def out_edges(self, node_name):
+        return list(self._outgoing.get(node_name, {}).values())
+
+    def in_edges(self, node_name):
+        return list(self._incoming.get(node_name, {}).values())
+
+    def edges_of(self, node_name):
+        """All edges touching the node, outgoing first."""
+        return self.out_edges(node_name) + [
+            edge for edge in self.in_edges(node_name) if edge.source != node_name
+        ]
+
+    def neighbors(self, node_name):
+        """Names of all nodes connected to the node in either direction."""
+        neighbors = {edge.target for edge in self._outgoing.get(node_name, {}).values()}
+        neighbors.update(
+            edge.source for edge in self._incoming.get(node_name, {}).values()
+        )
+        return neighbors
+
+    # --- Whole graph ---
+    def set_source_uri(self, source_uri):
+        """Set source_uri on every node and edge."""
+        for node in self.nodes.values():
+            node["source_uri"] = source_uri
+        for edge in self.edges:
+            edge.source_uri = source_uri
+
+    def merge(self, other):
+        """
+        Merge another KnowledgeGraph into this one.
+
+        :param other: KnowledgeGraph whose nodes, attributes and edges are added
+        :return: Number of edges that were new to this graph
+        """
+        for node_name, node_data in other.nodes.items():
+            node = self.add_node(node_name)
+            for key, value in node_data.items():
+                if key == "attributes":
+                    node["attributes"].update(value)
+                else:
+                    node[key] = value
+        new_edges = 0
+        for edge in other.edges:
+            if self.add_edge(
+                edge.source,
+                edge.relation,
+                edge.target,
+                edge.source_uri,
+                dict(edge.properties) if edge.properties else None,
+            ):
+                new_edges += 1
+        return new_edges
+
+    # --- Serialization ---
+    def to_dict(self):
+        return {
+            "nodes": self.nodes,
+            "edges": [edge.to_dict() for edge in self.edges],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a graph from the {"nodes": {...}, "edges": [...]} shape.
+        Duplicate edges and edges missing source, relation or target are dropped.
+        """
+        graph = cls()
+        for node_name, node_data in data.get("nodes", {}).items():
+            node = dict(node_data)
+            node["attributes"] = dict(node.get("attributes") or {})
+            graph.nodes[node_name] = node
+        for edge in data.get("edges", []):
+            source = edge.get("source")
+            relation = edge.get("relation")
+            target = edge.get("target")
+            if not (source and relation and target):
+                continue
+            properties = {
+                key: value
+                for key, value in edge.items()
+                if key not in ("source", "relation", "target", "source_uri")
+            }
+            graph.add_edge(
+                source, relation, target, edge.get("source_uri"), properties or None
+            )
+        return graph
+
+    @classmethod
+    def load_json(cls, json_file_path):
+        with open(json_file_path, "r", encoding="utf-8") as file:
+            return cls.from_dict(json.load(file))
+
+    def save_json(self, json_file_path, indent=2):
+        # Write next to the target and rename, so a failed save leaves no partial file
+        tmp_path = f"{json_file_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=indent)
+        os.replace(tmp_path, json_file_path)
@@ -0,0 +1,232 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.llms.basic_agent import BasicAgent
+from src.llms.rate_limiter import set_process_share
+from src.llms.response_cache import ResponseCache
+from src.ingestion_scripts.file_iterator import (
+    SUPPORTED_EXTENSIONS,
+    extract_kg_from_doc,
+)
+from src.ingestion_scripts.checkpoint import content_hashed_name, file_content_hash
+
+
+# --- Constants ---
+MANIFEST_FILE_NAME = "manifest.json"
+
+
+# --- Manifest ---
+def load_manifest(manifest_path: str) -> dict:
+    """Loads the batch manifest, or returns an empty one if it does not exist."""
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: Could not read manifest {manifest_path}, starting a new one: {e}")
+    return {"documents": {}}
+
+
+def save_manifest(manifest: dict, manifest_path: str):
+    """Writes the manifest atomically so an interrupted run never leaves it half written."""
+    manifest["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def output_name_for(file_path: str, content_hash: str) -> str:
+    """JSON name of a document's graph; the hash keeps same-named documents apart."""
+    return content_hashed_name(file_path, content_hash, ".json")
+
+
+def is_already_extracted(manifest: dict, content_hash: str) -> bool:
+    """
+    True if a document with this content was extracted and its output still exists.
+    Outputs not named after the content hash (older runs) may have been overwritten
+    by a document with the same name, so they are not trusted.
+    """
+    entry = manifest["documents"].get(content_hash)
+    return bool(
+        entry
+        and entry.get("status") == "done"
+        and entry.get("output_file")
+        and os.path.basename(entry["output_file"])
+        == output_name_for(entry.get("file_path", ""), content_hash)
+        and os.path.exists(entry["output_file"])
+    )
+
+
+# --- Worker ---
+def _init_worker(num_workers: int):
+    """Each worker has its own rate limiter, so it gets 1 / num_workers of the limits."""
+    set_process_share(1.0 / num_workers)
+
+
+def _extract_document(
+    file_path: str, content_hash: str, extraction_kwargs: dict, llm_cache_path: str = None
+) -> dict:
+    """Extracts one document in a worker process and returns its manifest entry."""
+    llm_agent = BasicAgent(
+        cache=ResponseCache(llm_cache_path) if llm_cache_path else None
+    )
+    output_dir = extraction_kwargs.get("output_dir", "tmp_knowledge_graph")
+    output_name = output_name_for(file_path, content_hash)
+    output_file = os.path.join(output_dir, output_name)
+    entry = {
+        "file_path": file_path,
+        "content_hash": content_hash,
+        "size_bytes": os.path.getsize(file_path),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    start_time = time.perf_counter()
+    try:
+        # Drop a leftover from an earlier failed run, so only a fresh save counts
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        knowledge_graph = extract_kg_from_doc(
+            file_path=file_path,
+            llm_agent=llm_agent,
+            output_name=output_name,
+            **extraction_kwargs,
+        )
+        if knowledge_graph and os.path.exists(output_file):
+            entry["status"] = "done"
+            entry["output_file"] = output_file
+            entry["num_nodes"] = knowledge_graph.num_nodes
+            entry["num_edges"] = knowledge_graph.num_edges
+        elif knowledge_graph:
+            entry["status"] = "failed"
+            entry["error"] = f"Knowledge graph was not saved to {output_file}"
+        else:
+            entry["status"] = "failed"
+            entry["error"] = "No knowledge graph extracted"
+    except Exception as e:
+        entry["status"] = "failed"
+        entry["error"] = str(e)
+    entry["duration_s"] = round(time.perf_counter() - start_time, 3)
+    entry["token_usage"] = dict(llm_agent.usage)
+    # The worker's telemetry spans all its documents, so keep only this one
+    entry["llm_telemetry"] = llm_agent.telemetry.summary(
+        ("phase",), document=os.path.basename(file_path)
+    )
+    if llm_agent.cache is not None:
+        entry["cache"] = {"hits": llm_agent.cache.hits, "misses": llm_agent.cache.misses}
+        llm_agent.cache.close()
+    return entry
+
+
+# --- Batch Driver ---
+def run_batch(
+    source_directory: str,
+    output_dir: str = "tmp_knowledge_graph",
+    max_workers: int = 4,
+    manifest_path: str = None,
+    llm_cache_path: str = None,
+    **extraction_kwargs,
+):
+    """
+    Extract knowledge graphs for every supported document in a directory.
+
+    Documents are scheduled largest first across worker processes, which
+    split the 'llm_rate_limits' of llm_config.yaml evenly. Documents
+    whose content hash is already recorded as extracted in the manifest are
+    skipped. The manifest is saved after every finished document.
+
+    Args:
+        source_directory: Directory containing the documents
+        output_dir: Directory to save the knowledge graphs (and the manifest)
+        max_workers: Number of worker processes
+        manifest_path: Manifest location (default: <output_dir>/manifest.json)
+        llm_cache_path: SQLite LLM response cache shared by the workers (None disables)
+        **extraction_kwargs: Passed on to extract_kg_from_doc (llm_model, ...)
+
+    Returns:
+        dict: The updated manifest
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if manifest_path is None:
+        manifest_path = os.path.join(output_dir, MANIFEST_FILE_NAME)
+    manifest = load_manifest(manifest_path)
+    extraction_kwargs["output_dir"] = output_dir
+
+    # Collect documents, largest first to balance the load across workers
+    file_paths = [
+        entry.path
+        for entry in os.scandir(source_directory)
+        if entry.is_file() and entry.name.lower().endswith(SUPPORTED_EXTENSIONS)
+    ]
+    file_paths.sort(key=os.path.getsize, reverse=True)
+
+    pending = {}  # content hash -> file path
+    skipped = 0
+    for file_path in file_paths:
+        content_hash = file_content_hash(file_path)
+        if is_already_extracted(manifest, content_hash) or content_hash in pending:
+            skipped += 1
+            continue
+        pending[content_hash] = file_path
+
+    num_workers = max(1, min(max_workers, len(pending)))
+    print(
+        f"Batch extraction: {len(file_paths)} documents, {skipped} already extracted, "
+        f"{len(pending)} to process with {num_workers} workers"
+    )
+
+    batch_start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=num_workers, initializer=_init_worker, initargs=(num_workers,)
+    ) as executor:
+        futures = {
+            executor.submit(
+                _extract_document, file_path, content_hash, extraction_kwargs, llm_cache_path
+            ): (
+                content_hash,
+                file_path,
+            )
+            for content_hash, file_path in pending.items()
+        }
+        for done_count, future in enumerate(as_completed(futures), start=1):
+            content_hash, file_path = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:  # Worker process died
+                entry = {
+                    "file_path": file_path,
+                    "content_hash": content_hash,
+                    "status": "failed",
+                    "error": str(e),
+                }
+            manifest["documents"][content_hash] = entry
+            save_manifest(manifest, manifest_path)
+            print(
+                f"[{done_count}/{len(futures)}] {entry['status']}: {file_path} "
+                f"({entry.get('duration_s', 0)}s, tokens: {entry.get('token_usage')})"
+            )
+
+    print(f"Batch extraction finished in {time.perf_counter() - batch_start:.1f}s")
+    return manifest
+
+
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    # --- Parameters ---
+    source_directory = "sources"  # Directory containing files
+    output_dir = "tmp_knowledge_graph"  # Directory to save the knowledge graphs
+    max_workers = 4  # Number of documents processed in parallel
+
+    run_batch(
+        source_directory=source_directory,
+        output_dir=output_dir,
+        max_workers=max_workers,
+        llm_cache_path="llm_cache/responses.sqlite",
+        llm_model="gemini-2.0-flash",
+        secondary_llm_model="gpt-4o",
+        max_tokens_per_window=4000,
+        num_runs_per_function=1,
+        overlap_tokens=50,
+        entity_mode="map",
+    )
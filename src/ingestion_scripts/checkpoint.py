@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import threading
+
+
+# --- Constants ---
+HASH_CHUNK_BYTES = 1 << 20
+HASH_PREFIX_CHARS = 12  # Content hash characters in per-document file names
+CHECKPOINT_DIR_NAME = "checkpoints"
+
+
+def file_content_hash(file_path: str) -> str:
+    """Returns the sha256 hex digest of a file's content."""
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def content_hashed_name(file_path: str, content_hash: str, suffix: str) -> str:
+    """
+    "<file name>.<hash prefix><suffix>": per-document file names that stay
+    apart for documents with the same name in different folders.
+    """
+    return f"{os.path.basename(file_path)}.{content_hash[:HASH_PREFIX_CHARS]}{suffix}"
+
+
+def checkpoint_path_for(output_dir: str, file_path: str, content_hash: str = None) -> str:
+    """
+    Location of the checkpoint log of a document inside the output directory.
+
+    Args:
+        output_dir: Output directory of the extraction
+        file_path: The document
+        content_hash: file_content_hash of the document (computed if None)
+    """
+    if content_hash is None:
+        content_hash = file_content_hash(file_path)
+    return os.path.join(
+        output_dir,
+        CHECKPOINT_DIR_NAME,
+        content_hashed_name(file_path, content_hash, ".ckpt.jsonl"),
+    )
+
+
+class ExtractionCheckpoint:
+    """
+    Append-only log of completed windows for one document.
+
+    The first line is a header with the extraction config. Every following line
+    holds the result of one window, keyed by (phase, run, window_num). A log whose
+    header does not match the current config is discarded, and a trailing line
+    cut off by a crash is ignored.
+
+    Args:
+        path: Path of the JSON lines log
+        config: Settings the recorded results depend on (file hash, T, O, models...)
+    """
+
+    def __init__(self, path: str, config: dict):
+        self.path = path
+        self.config = config
+        self._results = {}  # (phase, run, window_num) -> result
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            self._start_log()
+            return
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        try:
+            header = json.loads(lines[0]) if lines else {}
+        except json.JSONDecodeError:
+            header = {}
+        if header.get("config") != self.config:
+            print(f"  - Checkpoint {self.path} does not match the current settings, starting over")
+            self._start_log()
+            return
+
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partially written line from an interrupted run
+            key = (record["phase"], record["run"], record["window"])
+            self._results[key] = record["result"]
+        print(f"  - Loaded checkpoint with {len(self._results)} completed windows: {self.path}")
+
+    def _start_log(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"type": "header", "config": self.config}) + "\n")
+        self._results = {}
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, phase: int, run: int, window_num: int):
+        """Returns the recorded result of a window, or None if it was not completed."""
+        return self._results.get((phase, run, window_num))
+
+    def record(self, phase: int, run: int, window_num: int, result):
+        """Appends the result of a completed window to the log."""
+        line = json.dumps(
+            {"phase": phase, "run": run, "window": window_num, "result": result}
+        )
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._results[(phase, run, window_num)] = result
+
+    def remove(self):
+        """Deletes the log once the document has been saved."""
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._results = {}
@@ -2,19 +2,109 @@
 import os
 import tiktoken
 from pypdf import PdfReader 
-import io
 
 import json
-import sys
+import re
+import tempfile
+import threading
 import os
+from collections import deque
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+    FIRST_COMPLETED,
+)
 
 from src.llms.basic_agent import BasicAgent
+from src.llms.incremental_json import IncrementalKGParser
+from src.llms.telemetry import submit_in_context, telemetry_scope
+from src.utils.mention_index import EntityMentionIndex
+from src.graphs.knowledge_graph import KnowledgeGraph
+from src.ingestion_scripts.prompt_registry import PromptRegistry, count_tokens_cached
+from src.ingestion_scripts.checkpoint import (
+    ExtractionCheckpoint,
+    checkpoint_path_for,
+    file_content_hash,
+)
 
 
 
 # --- Constants ---
 ENCODING_NAME = "o200k_base"
 SUPPORTED_EXTENSIONS = (".txt", ".md", ".pdf")
+TEXT_READ_CHUNK_CHARS = 1 << 20  # Chars read per piece from .txt/.md files
+PDF_PAGES_PER_TASK = 16  # Pages extracted per process pool task
+PROMPT_PLACEHOLDERS = {
+    "entities_prompt.txt": {"file_name", "current_entities", "window_text"},
+    "relations_prompt.txt": {
+        "window_num",
+        "total_windows",
+        "file_name",
+        "entity_list",
+        "existing_relations_text",
+    },
+    "relations_packed_prompt.txt": {
+        "window_nums",
+        "total_windows",
+        "file_name",
+        "entity_list",
+        "existing_relations_text",
+        "window_sections",
+    },
+}
+# JSON schema of the phase 2 response of one window
+KG_WINDOW_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "entities": {
+            "type": "object",
+            "additionalProperties": {
+                "type": "object",
+                "properties": {"attributes": {"type": "object"}},
+            },
+        },
+        "relations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "source": {"type": "string"},
+                    "relation": {"type": "string"},
+                    "target": {"type": "string"},
+                },
+                "required": ["source", "relation", "target"],
+            },
+        },
+    },
+    "required": ["relations"],
+}
+# JSON schema of the phase 2 response of several packed windows
+KG_PACKED_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "sections": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "window": {"type": "integer"},
+                    **KG_WINDOW_SCHEMA["properties"],
+                },
+                "required": ["window", "relations"],
+            },
+        },
+    },
+    "required": ["sections"],
+}
+PACKED_RESPONSE_RESERVE_TOKENS = 100  # Reserved per window in a packed prompt
+# Prompt fields that are lists of items recurring across windows (entity names,
+# relation lines); their tokens are counted per item from a cache
+PROMPT_LIST_FIELD_SEPARATORS = {"entity_list": ", ", "existing_relations_text": "\n"}
+PROMPT_REGISTRY = PromptRegistry(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts"),
+    required_placeholders=PROMPT_PLACEHOLDERS,
+)
 
 
 # --- Token Counting ---
@@ -26,83 +116,423 @@ def num_tokens_from_string(string: str, encoding: tiktoken.Encoding) -> int:
 
 
 # --- Text Extraction ---
-def extract_text(file_path: str) -> str:
-    """Extracts text from txt, md, or pdf files."""
+def _extract_pdf_page_range(file_path: str, start: int, end: int) -> list:
+    """Extracts the text of pages [start, end) of a PDF (process pool worker)."""
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def iter_text(file_path: str, pdf_workers: int = None):
+    """
+    Streams the text of txt, md, or pdf files piece by piece.
+
+    Text files are yielded in chunks of TEXT_READ_CHUNK_CHARS, PDFs page by page.
+    With pdf_workers > 1, page ranges of larger PDFs are extracted in a process
+    pool while pages are still yielded in order.
+
+    Read errors are printed and re-raised: a stream that stops midway must not
+    pass for the whole document.
+
+    Args:
+        file_path: Path to the file
+        pdf_workers: Number of processes for PDF extraction (None or 1 = in process)
+    """
     _, extension = os.path.splitext(file_path)
-    text = ""
     try:
         if extension in [".txt", ".md"]:
             with open(file_path, "r", encoding="utf-8") as f:
-                text = f.read()
+                while True:
+                    piece = f.read(TEXT_READ_CHUNK_CHARS)
+                    if not piece:
+                        break
+                    yield piece
         elif extension == ".pdf":
             reader = PdfReader(file_path)
-            string_io = io.StringIO()
-            for page in reader.pages:
-                string_io.write(page.extract_text() or "")  # Handle None return
-            text = string_io.getvalue()
+            num_pages = len(reader.pages)
+            if not pdf_workers or pdf_workers <= 1 or num_pages <= PDF_PAGES_PER_TASK:
+                for page in reader.pages:
+                    yield page.extract_text() or ""  # Handle None return
+                return
+
+            page_ranges = [
+                (start, min(start + PDF_PAGES_PER_TASK, num_pages))
+                for start in range(0, num_pages, PDF_PAGES_PER_TASK)
+            ]
+            with ProcessPoolExecutor(max_workers=pdf_workers) as executor:
+                # Keep a bounded number of page ranges in flight, yield in order
+                in_flight = deque()
+                for start, end in page_ranges:
+                    in_flight.append(
+                        executor.submit(_extract_pdf_page_range, file_path, start, end)
+                    )
+                    if len(in_flight) >= 2 * pdf_workers:
+                        yield from in_flight.popleft().result()
+                while in_flight:
+                    yield from in_flight.popleft().result()
         else:
             print(f"Warning: Unsupported file type skipped: {file_path}")
     except FileNotFoundError:
         print(f"Error: File not found: {file_path}")
+        raise
     except Exception as e:
         print(f"Error reading file {file_path}: {e}")
-    return text
+        raise
+
+
+def extract_text(file_path: str) -> str:
+    """Extracts text from txt, md, or pdf files (raises on read errors)."""
+    return "".join(iter_text(file_path))
 
 
 # --- Window Generation ---
-def generate_text_windows(
-    text: str, encoding: tiktoken.Encoding, max_tokens: int, overlap_tokens: int
+class TextWindow:
+    """
+    A window of a document: its token ids, decoded text and offsets.
+
+    Token offsets index the token array of the whole document, char offsets
+    index the extracted document text.
+    """
+
+    __slots__ = ("tokens", "text", "token_start", "token_end", "char_start", "char_end")
+
+    def __init__(
+        self,
+        tokens: list,
+        text: str,
+        token_start: int,
+        token_end: int,
+        char_start: int,
+        char_end: int,
+    ):
+        self.tokens = tokens
+        self.text = text
+        self.token_start = token_start
+        self.token_end = token_end
+        self.char_start = char_start
+        self.char_end = char_end
+
+    @property
+    def num_tokens(self) -> int:
+        return len(self.tokens)
+
+    def preview(self, length: int = 50) -> str:
+        return self.text[:length] + "..." if len(self.text) > length else self.text
+
+    def truncated_text(self, max_tokens: int, encoding: tiktoken.Encoding) -> str:
+        """Returns the window text cut to at most max_tokens tokens."""
+        if len(self.tokens) <= max_tokens:
+            return self.text
+        return encoding.decode(self.tokens[:max_tokens])
+
+    def __str__(self):
+        return self.text
+
+
+def generate_text_windows_from_stream(
+    pieces, encoding: tiktoken.Encoding, max_tokens: int, overlap_tokens: int
 ):
-    """Generates overlapping text windows based on token count."""
-    if not text:
-        return
+    """
+    Generates overlapping TextWindows from an iterable of text pieces.
 
-    tokens = encoding.encode(text)
-    total_tokens = len(tokens)
-    start = 0
+    Pieces are encoded as they arrive and only the tokens that can still end up
+    in a window are kept, so memory is bounded by about one window plus a piece.
+    """
     step = max_tokens - overlap_tokens
     if step <= 0:
         print("Warning: Overlap is >= max_tokens. Setting step to 1.")
         step = 1  # Avoid infinite loop or no progress
 
-    while start < total_tokens:
-        end = min(start + max_tokens, total_tokens)
-        window_tokens = tokens[start:end]
+    buffer = []  # Pending tokens, buffer[pos] is the next window start
+    pos = 0
+    token_start = 0  # Document token offset of buffer[pos]
+    char_start = 0  # Document char offset of buffer[pos]
+    emitted_end = 0  # Document token offset where the last window ended
+
+    def make_window(end):
+        window_tokens = buffer[pos:end]
         # Decode the tokens back to a string for the window
         window_text = encoding.decode(window_tokens)
-        yield window_text
-        if end == total_tokens:
-            break  # Reached the end
-        start += step
+        return TextWindow(
+            window_tokens,
+            window_text,
+            token_start,
+            token_start + len(window_tokens),
+            char_start,
+            char_start + len(window_text),
+        )
+
+    for piece in pieces:
+        if not piece:
+            continue
+        buffer.extend(encoding.encode(piece))
+        while len(buffer) - pos >= max_tokens:
+            window = make_window(pos + max_tokens)
+            emitted_end = window.token_end
+            yield window
+            # Advance the offsets by the tokens we step over
+            char_start += len(encoding.decode(buffer[pos : pos + step]))
+            token_start += step
+            pos += step
+            if pos > len(buffer) // 2:
+                del buffer[:pos]
+                pos = 0
+
+    # Last (shorter) window, unless its tokens were all covered already
+    if token_start + len(buffer) - pos > emitted_end:
+        yield make_window(len(buffer))
+
+
+def generate_text_windows(
+    text: str, encoding: tiktoken.Encoding, max_tokens: int, overlap_tokens: int
+):
+    """Generates overlapping TextWindows based on token count."""
+    if not text:
+        return
+    yield from generate_text_windows_from_stream(
+        [text], encoding, max_tokens, overlap_tokens
+    )
+
+
+class DocumentWindows:
+    """
+    Lazy, re-iterable windows of a document.
+
+    Every iteration streams the text again through generate_text_windows_from_stream,
+    so no pass holds the whole document. Text files are simply re-read. PDFs are
+    parsed once, by the first pass, into a temporary spill file (one JSON-encoded
+    page per line, so every pass sees the same pieces and windows) that later
+    passes stream from. total_windows is known once a pass has run to completion.
+    close() deletes the spill file.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        encoding: tiktoken.Encoding,
+        max_tokens: int,
+        overlap_tokens: int,
+        pdf_workers: int = None,
+    ):
+        self.file_path = file_path
+        self.encoding = encoding
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.pdf_workers = pdf_workers
+        self.total_windows = None
+        self._spill_path = None
+        self._spill_lock = threading.Lock()
+
+    def _ensure_spill(self) -> str:
+        """Parses the PDF into the spill file once; concurrent passes wait for it."""
+        with self._spill_lock:
+            if self._spill_path is None:
+                fd, path = tempfile.mkstemp(prefix="document_windows_", suffix=".jsonl")
+                try:
+                    with os.fdopen(fd, "w", encoding="utf-8") as f:
+                        for piece in iter_text(self.file_path, pdf_workers=self.pdf_workers):
+                            f.write(json.dumps(piece) + "\n")
+                except BaseException:
+                    os.remove(path)
+                    raise
+                self._spill_path = path
+            return self._spill_path
+
+    def _iter_pieces(self):
+        if os.path.splitext(self.file_path)[1] != ".pdf":
+            yield from iter_text(self.file_path, pdf_workers=self.pdf_workers)
+            return
+        with open(self._ensure_spill(), "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def __iter__(self):
+        count = 0
+        for window in generate_text_windows_from_stream(
+            self._iter_pieces(),
+            self.encoding,
+            self.max_tokens,
+            self.overlap_tokens,
+        ):
+            count += 1
+            yield window
+        self.total_windows = count
+
+    def close(self):
+        """Deletes the spill file (a later pass parses the PDF again)."""
+        with self._spill_lock:
+            if self._spill_path is not None:
+                try:
+                    os.remove(self._spill_path)
+                except OSError:
+                    pass
+                self._spill_path = None
+
+    def __del__(self):
+        self.close()
+
+
+def _known_window_count(windows):
+    """Number of windows if it is known without iterating them, else None."""
+    if isinstance(windows, DocumentWindows):
+        return windows.total_windows
+    return len(windows)
 
 
 # --- Load Prompt Templates ---
 def load_prompt_template(template_file):
-    """Load a prompt template from a file."""
-    prompt_path = os.path.join(
-        os.path.dirname(os.path.abspath(__file__)), "prompts", template_file
-    )
+    """Load a prompt template from a file (cached by the prompt registry)."""
     try:
-        with open(prompt_path, "r", encoding="utf-8") as f:
-            return f.read()
+        return PROMPT_REGISTRY.get(template_file).text
     except Exception as e:
         print(f"Error loading prompt template '{template_file}': {e}")
         # Return a basic template as fallback
         return "ERROR LOADING TEMPLATE: {0}"
 
 
+# --- Window-Scoped Entity Context ---
+def format_entity_context(window_entities: set, total_entities: int) -> str:
+    """
+    Lists the entities relevant to a window plus a short digest of the others.
+
+    Args:
+        window_entities: Entities mentioned in the window
+        total_entities: Number of entities known for the whole document
+
+    Returns:
+        str: e.g. "A, B (+120 other entities found elsewhere in the document)"
+    """
+    other_entities = total_entities - len(window_entities)
+    entity_context = ", ".join(sorted(window_entities)) if window_entities else "None"
+    if other_entities > 0:
+        entity_context += (
+            f" (+{other_entities} other entities found elsewhere in the document)"
+        )
+    return entity_context
+
+
 # --- Knowledge Graph Extraction Per Window ---
+def select_relation_context(
+    knowledge_graph: KnowledgeGraph,
+    mentioned_entities: set,
+    encoding: tiktoken.Encoding,
+    max_relation_tokens: int = None,
+) -> str:
+    """
+    Describe the known relations for a prompt, one "source relation target" per line.
+
+    With mentioned_entities, only relations touching those entities are listed,
+    relations between two mentioned entities first. Lines are added until
+    max_relation_tokens is reached.
+
+    Args:
+        knowledge_graph: The graph built so far
+        mentioned_entities: Entities found in the window, or None for all relations
+        encoding: Tiktoken encoding
+        max_relation_tokens: Token cap for the relation lines (None = no cap)
+
+    Returns:
+        str: The relation lines, or "None" if there are none
+    """
+    if mentioned_entities is None:
+        candidate_edges = knowledge_graph.edges
+    else:
+        both_mentioned = {}
+        one_mentioned = {}
+        for entity in sorted(mentioned_entities):
+            for edge in knowledge_graph.edges_of(entity):
+                if edge.source in mentioned_entities and edge.target in mentioned_entities:
+                    both_mentioned[edge.key] = edge
+                else:
+                    one_mentioned[edge.key] = edge
+        candidate_edges = list(both_mentioned.values()) + list(one_mentioned.values())
+
+    relation_lines = []
+    used_tokens = 0
+    for edge in candidate_edges:
+        line = f"{edge.source} {edge.relation} {edge.target}"
+        if max_relation_tokens is not None:
+            # +1 for the newline joining the lines
+            line_tokens = count_tokens_cached(line, encoding.name) + 1
+            if used_tokens + line_tokens > max_relation_tokens:
+                break
+            used_tokens += line_tokens
+        relation_lines.append(line)
+
+    return "\n".join(relation_lines) if relation_lines else "None"
+
+
+def apply_window_kg_data(knowledge_graph: KnowledgeGraph, kg_data: dict) -> int:
+    """
+    Merge the parsed LLM result of one window into the knowledge graph.
+
+    Args:
+        knowledge_graph: The graph to update
+        kg_data: Parsed JSON with "entities" (attributes) and "relations"
+
+    Returns:
+        int: Number of relations that were new to the graph
+    """
+    # Update knowledge graph with attributes
+    if "entities" in kg_data:
+        for entity, data in kg_data["entities"].items():
+            if "attributes" in data:
+                # Merge new attributes with existing ones
+                knowledge_graph.update_attributes(entity, data["attributes"])
+
+    # Add relations to knowledge graph
+    new_edges = 0
+    if "relations" in kg_data:
+        for relation in kg_data["relations"]:
+            if "source" in relation and "target" in relation and "relation" in relation:
+                # Only add relation if both source and target entities exist
+                if knowledge_graph.has_node(relation["source"]) and knowledge_graph.has_node(
+                    relation["target"]
+                ):
+                    # add_edge skips relations already in the graph
+                    if knowledge_graph.add_edge(
+                        relation["source"], relation["relation"], relation["target"]
+                    ):
+                        new_edges += 1
+    return new_edges
+
+
+def apply_streamed_kg_record(knowledge_graph: KnowledgeGraph, record: tuple) -> int:
+    """
+    Merge one record of a streamed window result (see IncrementalKGParser)
+    into the knowledge graph.
+
+    Returns:
+        int: 1 if the record was a relation new to the graph, else 0
+    """
+    if record[0] == "entity":
+        _, entity, data = record
+        if entity is None or not isinstance(data, dict):
+            return 0
+        return apply_window_kg_data(knowledge_graph, {"entities": {entity: data}})
+    relation = record[1]
+    if not isinstance(relation, dict):
+        return 0
+    return apply_window_kg_data(knowledge_graph, {"relations": [relation]})
+
+
 def extract_window_relations_and_attributes(
     llm_agent,
     llm_model: str,
     file_path: str,
-    window_text: str,
+    window: TextWindow,
     window_num: int,
     total_windows: int,
     entities: set,
     encoding: tiktoken.Encoding,
     max_tokens: int,
-    current_knowledge_graph: dict = None,
+    current_knowledge_graph: KnowledgeGraph = None,
+    checkpoint: ExtractionCheckpoint = None,
+    run: int = 1,
+    mention_index: EntityMentionIndex = None,
+    max_relation_tokens: int = None,
+    relevant_relations_only: bool = True,
+    window_scoped_entities: bool = True,
+    stream_response: bool = False,
 ):
     """
     Extract relations between entities and attributes from a single text window
@@ -112,26 +542,35 @@ def extract_window_relations_and_attributes(
         llm_agent: The LLM agent to use for extraction
         llm_model: The LLM model name
         file_path: Path to the file being processed
-        window_text: Text of the current window
+        window: The current TextWindow
         window_num: Current window number
         total_windows: Total number of windows
         entities: Set of entities found in the document
         encoding: Tiktoken encoding
         max_tokens: Maximum tokens for LLM context
         current_knowledge_graph: Existing knowledge graph to build upon
+        checkpoint: Optional checkpoint log to replay and record the window result
+        run: Run number (1 or 2) used as the checkpoint key
+        mention_index: Index of the entities, used to find those mentioned in the window
+        max_relation_tokens: Token cap for the relations put in the prompt
+        relevant_relations_only: With a mention_index, only relations touching
+            entities mentioned in the window are put in the prompt
+        window_scoped_entities: With a mention_index, the prompt lists only the
+            entities mentioned in the window plus a digest of the others
+        stream_response: Stream the LLM response and merge each entity and
+            relation into the graph as soon as it is complete. The full response
+            is still validated; if it is invalid the window is not recorded, but
+            the records merged so far stay in the graph.
 
     Returns:
-        dict: Updated knowledge graph with nodes (entities+attributes) and edges (relations)
+        KnowledgeGraph: Updated knowledge graph with nodes (entities+attributes) and edges (relations)
     """
     # Initialize or use existing knowledge graph
     if current_knowledge_graph is None:
-        knowledge_graph = {
-            "nodes": {},  # Will store entities and their attributes
-            "edges": [],  # Will store relations between entities
-        }
+        knowledge_graph = KnowledgeGraph()
         # Create initial nodes for all entities
         for entity in entities:
-            knowledge_graph["nodes"][entity] = {"attributes": {}}
+            knowledge_graph.add_node(entity)
     else:
         knowledge_graph = current_knowledge_graph
 
@@ -139,35 +578,57 @@ def extract_window_relations_and_attributes(
     if not entities:
         return knowledge_graph
 
-    # Get window token count
-    window_token_count = num_tokens_from_string(window_text, encoding)
-    window_preview = window_text[:50] + "..." if len(window_text) > 50 else window_text
+    # Replay the window if it was completed by an earlier, interrupted run
+    if checkpoint is not None:
+        recorded_kg_data = checkpoint.get(2, run, window_num)
+        if recorded_kg_data is not None:
+            new_edges = apply_window_kg_data(knowledge_graph, recorded_kg_data)
+            print(
+                f"  - Window {window_num}: Replayed from checkpoint, added {new_edges} new relations"
+            )
+            return knowledge_graph
 
-    # Calculate how much of the text we can include for context
-    entity_list = ", ".join(sorted(list(entities)))
+    # Get window token count
+    window_token_count = window.num_tokens
+    window_preview = window.preview()
 
-    # Describe the current state of the knowledge graph
-    existing_relations = []
-    for edge in knowledge_graph["edges"]:
-        existing_relations.append(
-            f"{edge['source']} {edge['relation']} {edge['target']}"
-        )
+    mentioned_entities = (
+        mention_index.find(window.text) if mention_index is not None else None
+    )
 
-    existing_relations_text = "None"
-    if existing_relations:
-        existing_relations_text = "\n".join(existing_relations)
+    # Entities to show: those in the window, or the whole document set
+    if mentioned_entities is not None and window_scoped_entities:
+        entity_list = format_entity_context(mentioned_entities, len(entities))
+    else:
+        entity_list = ", ".join(sorted(list(entities)))
+
+    # Describe the relevant part of the current knowledge graph
+    existing_relations_text = select_relation_context(
+        knowledge_graph,
+        mentioned_entities if relevant_relations_only else None,
+        encoding,
+        max_relation_tokens,
+    )
 
     # Load and format the prompt template
-    prompt_template = load_prompt_template("relations_prompt.txt")
-    prompt_template = prompt_template.format(
-        window_num=window_num,
-        total_windows=total_windows,
-        file_name=os.path.basename(file_path),
-        entity_list=entity_list,
-        existing_relations_text=existing_relations_text,
+    try:
+        relations_template = PROMPT_REGISTRY.get("relations_prompt.txt")
+    except Exception as e:
+        print(f"  - Error loading prompt template 'relations_prompt.txt': {e}")
+        return knowledge_graph
+    prompt_fields = {
+        "window_num": window_num,
+        "total_windows": total_windows,
+        "file_name": os.path.basename(file_path),
+        "entity_list": entity_list,
+        "existing_relations_text": existing_relations_text,
+    }
+    prompt_template = relations_template.format(**prompt_fields)
+
+    # Cached template overhead plus the placeholder values
+    template_tokens = relations_template.count_tokens(
+        encoding, field_separators=PROMPT_LIST_FIELD_SEPARATORS, **prompt_fields
     )
-
-    template_tokens = num_tokens_from_string(prompt_template, encoding)
     available_tokens = (
         max_tokens - template_tokens - 100
     )  # Reserve 100 tokens for response
@@ -177,10 +638,7 @@ def extract_window_relations_and_attributes(
         return knowledge_graph
 
     # Truncate text to fit available tokens
-    text_tokens = encoding.encode(window_text)
-    if len(text_tokens) > available_tokens:
-        text_tokens = text_tokens[:available_tokens]
-        window_text = encoding.decode(text_tokens)
+    window_text = window.truncated_text(available_tokens, encoding)
 
     # Create the full prompt
     prompt = prompt_template + window_text + "\n---"
@@ -188,146 +646,606 @@ def extract_window_relations_and_attributes(
     print(
         f'  - Extracting relations and attributes for window {window_num}/{total_windows} ({window_token_count} tokens): "{window_preview}"'
     )
+    streamed = {"records": 0, "new_edges": 0}
+    on_chunk = None
+    if stream_response:
+        parser = IncrementalKGParser()
+
+        def on_chunk(text: str):
+            # Merge records while the rest of the response is being generated
+            for record in parser.feed(text):
+                streamed["records"] += 1
+                streamed["new_edges"] += apply_streamed_kg_record(knowledge_graph, record)
+
     try:
-        ai_response = llm_agent.get_text_response_from_llm(
+        ai_response = llm_agent.get_json_response_from_llm(
             llm_model_input=llm_model,
             messages=prompt,
+            schema=KG_WINDOW_SCHEMA,
+            on_chunk=on_chunk,
         )
-        response_text = ai_response.get("text_response", "").strip()
+        kg_data = ai_response["data"]
+        if kg_data is None:
+            # Leave the window unrecorded so a rerun retries it
+            response_text = ai_response.get("text_response") or ""
+            print(
+                f"  - Failed to get a valid knowledge graph JSON for window {window_num}: {ai_response['errors'][:3]}"
+            )
+            if response_text:
+                print(f"  - Response was: {response_text[:200]}...")
+            return knowledge_graph
 
-        # Try to parse JSON response
-        try:
-            # Find JSON content (it might be surrounded by explanatory text)
-            json_start = response_text.find("{")
-            json_end = response_text.rfind("}") + 1
-            if json_start >= 0 and json_end > json_start:
-                json_content = response_text[json_start:json_end]
-                kg_data = json.loads(json_content)
-
-                # Update knowledge graph with attributes
-                if "entities" in kg_data:
-                    for entity, data in kg_data["entities"].items():
-                        if entity in knowledge_graph["nodes"]:
-                            if "attributes" in data:
-                                # Merge new attributes with existing ones
-                                if "attributes" not in knowledge_graph["nodes"][entity]:
-                                    knowledge_graph["nodes"][entity]["attributes"] = {}
-                                knowledge_graph["nodes"][entity]["attributes"].update(
-                                    data["attributes"]
-                                )
-
-                # Add relations to knowledge graph
-                new_edges = 0
-                if "relations" in kg_data:
-                    for relation in kg_data["relations"]:
-                        if (
-                            "source" in relation
-                            and "target" in relation
-                            and "relation" in relation
-                        ):
-                            # Only add relation if both source and target entities exist
-                            if (
-                                relation["source"] in knowledge_graph["nodes"]
-                                and relation["target"] in knowledge_graph["nodes"]
-                            ):
-                                # Check if this relation is already in the graph
-                                relation_exists = False
-                                for edge in knowledge_graph["edges"]:
-                                    if (
-                                        edge["source"] == relation["source"]
-                                        and edge["target"] == relation["target"]
-                                        and edge["relation"] == relation["relation"]
-                                    ):
-                                        relation_exists = True
-                                        break
-
-                                if not relation_exists:
-                                    knowledge_graph["edges"].append(
-                                        {
-                                            "source": relation["source"],
-                                            "relation": relation["relation"],
-                                            "target": relation["target"],
-                                        }
-                                    )
-                                    new_edges += 1
+        # Records merged while streaming are skipped here as duplicates
+        new_edges = streamed["new_edges"] + apply_window_kg_data(knowledge_graph, kg_data)
+        if checkpoint is not None:
+            checkpoint.record(2, run, window_num, kg_data)
 
-                print(
-                    f"  - Window {window_num}: Added {new_edges} new relations, knowledge graph now has {len(knowledge_graph['edges'])} relations total"
-                )
-            else:
-                print(
-                    f"  - Failed to locate JSON in LLM response for window {window_num}"
-                )
-        except json.JSONDecodeError as e:
+        streamed_note = (
+            f" ({streamed['records']} records merged while streaming)" if stream_response else ""
+        )
+        print(
+            f"  - Window {window_num}: Added {new_edges} new relations{streamed_note}, knowledge graph now has {knowledge_graph.num_edges} relations total"
+        )
+    except Exception as e:
+        print(f"  - Error extracting relations for window {window_num}: {e}")
+
+    return knowledge_graph
+
+
+# --- Packed Knowledge Graph Extraction ---
+def _window_section(window_num: int, text: str) -> str:
+    return f"=== WINDOW {window_num} ===\n{text}\n=== END WINDOW {window_num} ===\n"
+
+
+def _format_window_sections(packed_windows: list) -> str:
+    """Delimited window sections of a packed phase 2 prompt."""
+    return "".join(
+        _window_section(window_num, window.text) for window_num, window in packed_windows
+    )
+
+
+def _packed_prompt_fields(
+    packed_windows: list,
+    total_windows: int,
+    file_path: str,
+    entities: set,
+    knowledge_graph: KnowledgeGraph,
+    encoding: tiktoken.Encoding,
+    mention_index: EntityMentionIndex = None,
+    max_relation_tokens: int = None,
+    relevant_relations_only: bool = True,
+    window_scoped_entities: bool = True,
+) -> dict:
+    """Prompt fields of a packed request, with the context of all its windows."""
+    mentioned_entities = None
+    if mention_index is not None:
+        mentioned_entities = set()
+        for _, window in packed_windows:
+            mentioned_entities.update(mention_index.find(window.text))
+
+    if mentioned_entities is not None and window_scoped_entities:
+        entity_list = format_entity_context(mentioned_entities, len(entities))
+    else:
+        entity_list = ", ".join(sorted(list(entities)))
+
+    return {
+        "window_nums": ", ".join(str(window_num) for window_num, _ in packed_windows),
+        "total_windows": total_windows,
+        "file_name": os.path.basename(file_path),
+        "entity_list": entity_list,
+        "existing_relations_text": select_relation_context(
+            knowledge_graph,
+            mentioned_entities if relevant_relations_only else None,
+            encoding,
+            max_relation_tokens,
+        ),
+        "window_sections": _format_window_sections(packed_windows),
+    }
+
+
+def extract_packed_windows_relations_and_attributes(
+    llm_agent,
+    llm_model: str,
+    file_path: str,
+    packed_windows: list,
+    total_windows: int,
+    entities: set,
+    encoding: tiktoken.Encoding,
+    max_tokens: int,
+    knowledge_graph: KnowledgeGraph,
+    checkpoint: ExtractionCheckpoint = None,
+    run: int = 1,
+    mention_index: EntityMentionIndex = None,
+    max_relation_tokens: int = None,
+    relevant_relations_only: bool = True,
+    window_scoped_entities: bool = True,
+):
+    """
+    Extract relations and attributes of several windows with a single LLM request.
+
+    The windows are sent as delimited sections and the response holds one
+    result per window, which is applied and checkpointed like the result of a
+    single-window request. Windows missing from the response are retried on
+    their own.
+
+    Args:
+        llm_agent: The LLM agent to use for extraction
+        llm_model: The LLM model name
+        file_path: Path to the file being processed
+        packed_windows: List of (window_num, TextWindow) sent together
+        total_windows: Total number of windows
+        entities: Set of entities found in the document
+        encoding: Tiktoken encoding
+        max_tokens: Maximum tokens of a single-window prompt (for the retries)
+        knowledge_graph: The evolving knowledge graph
+        checkpoint: Optional checkpoint log to record the window results
+        run: Run number (1 or 2) used as the checkpoint key
+        mention_index: Index of the entities, used to find those mentioned in the windows
+        max_relation_tokens: Token cap for the relations put in the prompt
+        relevant_relations_only: Only relations touching entities mentioned in
+            the windows are put in the prompt
+        window_scoped_entities: The prompt lists only the entities mentioned in
+            the windows plus a digest of the others
+
+    Returns:
+        KnowledgeGraph: Updated knowledge graph
+    """
+    window_options = {
+        "entities": entities,
+        "encoding": encoding,
+        "mention_index": mention_index,
+        "max_relation_tokens": max_relation_tokens,
+        "relevant_relations_only": relevant_relations_only,
+        "window_scoped_entities": window_scoped_entities,
+    }
+    sections = {}
+    try:
+        packed_template = PROMPT_REGISTRY.get("relations_packed_prompt.txt")
+        prompt_fields = _packed_prompt_fields(
+            packed_windows,
+            total_windows,
+            file_path,
+            entities,
+            knowledge_graph,
+            encoding,
+            mention_index,
+            max_relation_tokens,
+            relevant_relations_only,
+            window_scoped_entities,
+        )
+        print(
+            f"  - Extracting relations and attributes for windows {prompt_fields['window_nums']}/{total_windows} in one request"
+        )
+        ai_response = llm_agent.get_json_response_from_llm(
+            llm_model_input=llm_model,
+            messages=packed_template.format(**prompt_fields),
+            schema=KG_PACKED_SCHEMA,
+        )
+        if ai_response["data"] is None:
             print(
-                f"  - Failed to parse knowledge graph JSON for window {window_num}: {e}"
+                f"  - Failed to get a valid packed knowledge graph JSON: {ai_response['errors'][:3]}"
             )
-            print(f"  - Response was: {response_text[:200]}...")
+        else:
+            for section in ai_response["data"]["sections"]:
+                sections.setdefault(section["window"], section)
     except Exception as e:
-        print(f"  - Error extracting relations for window {window_num}: {e}")
+        print(f"  - Error extracting relations for windows {[n for n, _ in packed_windows]}: {e}")
 
+    for window_num, window in packed_windows:
+        section = sections.get(window_num)
+        if section is None:
+            print(f"  - Window {window_num}: Missing from the packed response, sending it alone")
+            knowledge_graph = extract_window_relations_and_attributes(
+                llm_agent=llm_agent,
+                llm_model=llm_model,
+                file_path=file_path,
+                window=window,
+                window_num=window_num,
+                total_windows=total_windows,
+                max_tokens=max_tokens,
+                current_knowledge_graph=knowledge_graph,
+                checkpoint=checkpoint,
+                run=run,
+                **window_options,
+            )
+            continue
+
+        kg_data = {
+            "entities": section.get("entities", {}),
+            "relations": section.get("relations", []),
+        }
+        new_edges = apply_window_kg_data(knowledge_graph, kg_data)
+        if checkpoint is not None:
+            checkpoint.record(2, run, window_num, kg_data)
+        print(
+            f"  - Window {window_num}: Added {new_edges} new relations, knowledge graph now has {knowledge_graph.num_edges} relations total"
+        )
+    return knowledge_graph
+
+
+def extract_relations_packed(
+    llm_agent,
+    llm_model: str,
+    file_path: str,
+    windows,
+    total_windows: int,
+    entities: set,
+    encoding: tiktoken.Encoding,
+    max_tokens: int,
+    pack_token_budget: int,
+    knowledge_graph: KnowledgeGraph = None,
+    checkpoint: ExtractionCheckpoint = None,
+    run: int = 1,
+    mention_index: EntityMentionIndex = None,
+    max_relation_tokens: int = None,
+    relevant_relations_only: bool = True,
+    window_scoped_entities: bool = True,
+    max_windows_per_request: int = 8,
+):
+    """
+    Phase 2 over all windows, packing consecutive windows into shared requests.
+
+    Windows are packed next-fit in document order: a window joins the current
+    pack while the full packed prompt (template, context, all sections and a
+    response reserve per window) stays within pack_token_budget. Keeping
+    document order means every pack sees the relations of the packs before it,
+    as in the window-by-window mode. A pack of a single window is sent with
+    the regular single-window prompt.
+
+    Limits: every window but the last holds max_tokens (T) tokens, so a pack
+    of n windows needs a budget above n * T plus the prompt overhead; with a
+    budget below 2 * T at most the short last window is packed. Packing works
+    within one document: it saves requests on long documents split into small
+    windows, not on many short documents (those are one window each).
+
+    Args:
+        windows: TextWindows to process (a list or DocumentWindows)
+        max_tokens: Maximum tokens of a single-window prompt (T)
+        pack_token_budget: Maximum tokens of a packed prompt (must exceed max_tokens)
+        max_windows_per_request: Upper bound on windows per request (bounds the
+            size of the response)
+        (other arguments as in extract_packed_windows_relations_and_attributes)
+
+    Returns:
+        KnowledgeGraph: The knowledge graph after all windows
+    """
+    if knowledge_graph is None:
+        knowledge_graph = KnowledgeGraph()
+        for entity in entities:
+            knowledge_graph.add_node(entity)
+    if not entities:
+        return knowledge_graph
+
+    if pack_token_budget <= max_tokens:
+        raise ValueError(
+            f"pack_token_budget ({pack_token_budget}) must exceed the window size "
+            f"T={max_tokens}, or no two windows fit into one request"
+        )
+    packed_template = PROMPT_REGISTRY.get("relations_packed_prompt.txt")
+    window_options = {
+        "entities": entities,
+        "encoding": encoding,
+        "mention_index": mention_index,
+        "max_relation_tokens": max_relation_tokens,
+        "relevant_relations_only": relevant_relations_only,
+        "window_scoped_entities": window_scoped_entities,
+    }
+
+    def packed_prompt_tokens(candidate: list) -> int:
+        prompt_fields = _packed_prompt_fields(
+            candidate,
+            total_windows,
+            file_path,
+            entities,
+            knowledge_graph,
+            encoding,
+            mention_index,
+            max_relation_tokens,
+            relevant_relations_only,
+            window_scoped_entities,
+        )
+        # Window texts are counted from their known token counts
+        prompt_fields["window_sections"] = ""
+        section_tokens = sum(
+            window.num_tokens + len(encoding.encode(_window_section(window_num, "")))
+            for window_num, window in candidate
+        )
+        return (
+            packed_template.count_tokens(
+                encoding, field_separators=PROMPT_LIST_FIELD_SEPARATORS, **prompt_fields
+            )
+            + section_tokens
+            + PACKED_RESPONSE_RESERVE_TOKENS * len(candidate)
+        )
+
+    def send(pack: list):
+        nonlocal knowledge_graph
+        if len(pack) == 1:
+            window_num, window = pack[0]
+            knowledge_graph = extract_window_relations_and_attributes(
+                llm_agent=llm_agent,
+                llm_model=llm_model,
+                file_path=file_path,
+                window=window,
+                window_num=window_num,
+                total_windows=total_windows,
+                max_tokens=max_tokens,
+                current_knowledge_graph=knowledge_graph,
+                checkpoint=checkpoint,
+                run=run,
+                **window_options,
+            )
+        else:
+            packing["requests"] += 1
+            packing["windows"] += len(pack)
+            knowledge_graph = extract_packed_windows_relations_and_attributes(
+                llm_agent=llm_agent,
+                llm_model=llm_model,
+                file_path=file_path,
+                packed_windows=pack,
+                total_windows=total_windows,
+                max_tokens=max_tokens,
+                knowledge_graph=knowledge_graph,
+                checkpoint=checkpoint,
+                run=run,
+                **window_options,
+            )
+
+    pack = []
+    requests = 0
+    packing = {"requests": 0, "windows": 0}  # Requests holding several windows
+    for i, window in enumerate(windows):
+        window_num = i + 1
+        recorded_kg_data = (
+            checkpoint.get(2, run, window_num) if checkpoint is not None else None
+        )
+        if recorded_kg_data is not None:
+            # Replayed in order; windows before it that are not sent yet go first
+            if pack:
+                send(pack)
+                requests += 1
+                pack = []
+            new_edges = apply_window_kg_data(knowledge_graph, recorded_kg_data)
+            print(
+                f"  - Window {window_num}: Replayed from checkpoint, added {new_edges} new relations"
+            )
+            continue
+
+        candidate = pack + [(window_num, window)]
+        if pack and (
+            len(candidate) > max_windows_per_request
+            or packed_prompt_tokens(candidate) > pack_token_budget
+        ):
+            send(pack)
+            requests += 1
+            candidate = [(window_num, window)]
+        pack = candidate
+
+    if pack:
+        send(pack)
+        requests += 1
+    print(
+        f"  - [PHASE 2] Sent {requests} requests for {total_windows} windows, "
+        f"{packing['windows']} windows in {packing['requests']} packed requests "
+        f"(packing budget {pack_token_budget} tokens, T={max_tokens})"
+    )
+    if not packing["requests"] and requests > 1:
+        print("  - Warning: No windows were packed; pack_token_budget must exceed 2 * T plus the prompt overhead")
     return knowledge_graph
 
 
 # --- Entity Extraction From Windows ---
+def parse_entity_response(ai_text_response: str) -> set:
+    """Parses the newline separated entity list returned by the LLM."""
+    if not ai_text_response or ai_text_response.lower() == "none":
+        return set()
+    # Split by newline, strip whitespace, filter out empty lines
+    return {
+        entity.strip() for entity in ai_text_response.split("\n") if entity.strip()
+    }
+
+
+_LIST_MARKER_PATTERN = re.compile(r"^\s*(?:[-*\u2022]+|\d+[.)])\s*")
+
+
+def canonicalize_entities(entity_sets: list) -> set:
+    """
+    Reduce step of the map mode: merges per-window entity sets into one set.
+
+    Entities are cleaned from list markers, quotes and extra whitespace, then
+    grouped case-insensitively. Each group is represented by its most frequent
+    surface form (first seen wins ties).
+
+    Args:
+        entity_sets: Per-window entity sets, in window order
+
+    Returns:
+        set: Set of unique, canonical entities
+    """
+    counts = {}  # casefolded key -> {surface form: count}
+    for entity_set in entity_sets:
+        for entity in entity_set:
+            cleaned = _LIST_MARKER_PATTERN.sub("", entity)
+            cleaned = " ".join(cleaned.strip("\"'`*").split()).rstrip(".,;:")
+            if not cleaned or cleaned.lower() == "none":
+                continue
+            forms = counts.setdefault(cleaned.casefold(), {})
+            forms[cleaned] = forms.get(cleaned, 0) + 1
+
+    canonical_entities = set()
+    for forms in counts.values():
+        # max() keeps the first maximal element, dicts keep insertion order
+        canonical_entities.add(max(forms, key=forms.get))
+    return canonical_entities
+
+
+def _extract_entities_from_window(
+    llm_agent, llm_model: str, prompt: str, window_num: int
+):
+    """
+    Runs a single entity extraction prompt and parses the result.
+    Returns None if the LLM call failed, so the window is not checkpointed.
+    """
+    try:
+        ai_response = llm_agent.get_text_response_from_llm(
+            llm_model_input=llm_model,
+            messages=prompt,
+        )
+    except Exception as e:
+        print(f"      - Error calling LLM for window {window_num}: {e}")
+        return None
+    if ai_response.get("text_response") is None:
+        print(f"      - No LLM response for window {window_num}")
+        return None
+    ai_text_response = ai_response["text_response"].strip()
+    return parse_entity_response(ai_text_response)
+
+
 def extract_entities_from_windows(
-    llm_agent, llm_model: str, file_path: str, windows: list
+    llm_agent,
+    llm_model: str,
+    file_path: str,
+    windows: list,
+    mode: str = "sequential",
+    max_concurrency: int = None,
+    checkpoint: ExtractionCheckpoint = None,
+    run: int = 1,
+    window_scoped_entities: bool = True,
 ):
     """
     Extract entities from a list of text windows.
 
+    In "sequential" mode windows are processed one after another and every prompt
+    contains the entities found so far (with window_scoped_entities, only those
+    mentioned in the window plus a digest of the others). In "map" mode all window prompts are sent
+    concurrently (without the running entity list) and the per-window results are
+    reduced with `canonicalize_entities`.
+
     Args:
         llm_agent: The LLM agent to use for extraction
         llm_model: The LLM model name
         file_path: Path to the file being processed
-        windows: List of text windows to process
+        windows: TextWindows to process (a list or DocumentWindows)
+        mode: "sequential" or "map"
+        max_concurrency: Requests in flight in map mode (defaults to the
+            provider limit from llm_config.yaml)
+        checkpoint: Optional checkpoint log to replay and record window results
+        run: Run number (1 or 2) used as the checkpoint key
+        window_scoped_entities: Sequential mode only lists the known entities
+            that are mentioned in the window
 
     Returns:
         set: Set of unique entities found in the document
     """
+    if mode not in ("sequential", "map"):
+        raise ValueError(f"Unknown entity extraction mode: {mode}")
+
     current_file_entities = set()  # Initialize entities for this file
-    encoding = tiktoken.get_encoding(ENCODING_NAME)  # Get encoding for token counting
 
-    print(f"  - [PHASE 1] Starting entity extraction...")
+    print(f"  - [PHASE 1] Starting entity extraction (mode: {mode})...")
 
     # Load the entities prompt template
     entities_prompt_template = load_prompt_template("entities_prompt.txt")
 
-    for i, window in enumerate(windows):
-        # Get window token count and preview
-        window_token_count = num_tokens_from_string(window, encoding)
-        window_preview = window[:50] + "..." if len(window) > 50 else window
-
-        # Format the prompt template
-        prompt = entities_prompt_template.format(
-            file_name=os.path.basename(file_path),
-            current_entities=sorted(list(current_file_entities)),
-            window_text=window,
-        )
+    if mode == "map":
+        if max_concurrency is None:
+            max_concurrency = llm_agent.get_max_concurrency(llm_model)
+        print(f"    - Sending window prompts with concurrency {max_concurrency}")
 
-        print(
-            f'    - Processing window {i+1}/{len(windows)} for entities ({window_token_count} tokens): "{window_preview}"'
+        window_entities = {}  # window index -> set of entities
+
+        def collect(future):
+            i = in_flight.pop(future)
+            new_entities = future.result()
+            if new_entities is not None:
+                window_entities[i] = new_entities
+                if checkpoint is not None:
+                    checkpoint.record(1, run, i + 1, sorted(new_entities))
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            in_flight = {}
+            for i, window in enumerate(windows):
+                recorded_entities = (
+                    checkpoint.get(1, run, i + 1) if checkpoint is not None else None
+                )
+                if recorded_entities is not None:
+                    window_entities[i] = set(recorded_entities)
+                    continue
+
+                # Keep at most max_concurrency prompts queued or running
+                if len(in_flight) >= max_concurrency:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+
+                print(
+                    f"    - Queued window {i+1} for entities ({window.num_tokens} tokens)"
+                )
+                prompt = entities_prompt_template.format(
+                    file_name=os.path.basename(file_path),
+                    current_entities="None",
+                    window_text=window.text,
+                )
+                # Keep the telemetry scope (document, phase) in the worker threads
+                future = submit_in_context(
+                    executor,
+                    _extract_entities_from_window,
+                    llm_agent,
+                    llm_model,
+                    prompt,
+                    i + 1,
+                )
+                in_flight[future] = i
+
+            for future in wait(in_flight).done:
+                collect(future)
+
+        current_file_entities = canonicalize_entities(
+            [window_entities[i] for i in sorted(window_entities)]
         )
-        try:
-            ai_response = llm_agent.get_text_response_from_llm(
-                llm_model_input=llm_model,
-                messages=prompt,
+    else:
+        total_windows = _known_window_count(windows) or "?"
+        mention_index = EntityMentionIndex() if window_scoped_entities else None
+        for i, window in enumerate(windows):
+            recorded_entities = (
+                checkpoint.get(1, run, i + 1) if checkpoint is not None else None
             )
-            ai_text_response = ai_response.get("text_response", "").strip()
-        except Exception as e:
-            print(f"      - Error calling LLM for window {i+1}: {e}")
-            ai_text_response = ""  # Treat as no response on error
-
-        if ai_text_response and ai_text_response.lower() != "none":
-            # Split by newline, strip whitespace, filter out empty lines
-            new_entities = {
-                entity.strip()
-                for entity in ai_text_response.split("\n")
-                if entity.strip()
-            }
+            if recorded_entities is not None:
+                # Replay the window completed by an earlier, interrupted run
+                current_file_entities.update(recorded_entities)
+                if mention_index is not None:
+                    mention_index.add(recorded_entities)
+                continue
+
+            if mention_index is not None:
+                current_entities = format_entity_context(
+                    mention_index.find(window.text), len(current_file_entities)
+                )
+            else:
+                current_entities = sorted(list(current_file_entities))
+
+            # Format the prompt template
+            prompt = entities_prompt_template.format(
+                file_name=os.path.basename(file_path),
+                current_entities=current_entities,
+                window_text=window.text,
+            )
+
+            print(
+                f'    - Processing window {i+1}/{total_windows} for entities ({window.num_tokens} tokens): "{window.preview()}"'
+            )
+            new_entities = _extract_entities_from_window(
+                llm_agent, llm_model, prompt, i + 1
+            )
+            if new_entities is None:
+                continue
+            if checkpoint is not None:
+                checkpoint.record(1, run, i + 1, sorted(new_entities))
             if new_entities:
                 print(f"      - Found new entities in window {i+1}: {new_entities}")
                 current_file_entities.update(new_entities)
+                if mention_index is not None:
+                    mention_index.add(new_entities)
 
     print(f"  - [PHASE 1] Finished entity extraction.")
     print(f"  - Total unique entities found: {len(current_file_entities)}")
@@ -339,6 +1257,27 @@ def extract_entities_from_windows(
 
 
 # --- Process Single File Function ---
+def print_telemetry_summary(llm_agent, document_name: str):
+    """Prints the LLM calls, tokens, latency and cost of a document per phase and model."""
+    telemetry = getattr(llm_agent, "telemetry", None)
+    if telemetry is None:
+        return
+    summary = telemetry.summary(("phase", "provider", "model"), document=document_name)
+    for group, totals in summary.items():
+        latency = (
+            f", {totals['latency_seconds_sum']:.1f}s in calls (p50 <= {totals['latency_p50']}s, "
+            f"p95 <= {totals['latency_p95']}s)"
+            if totals["calls"]
+            else ""
+        )
+        print(
+            f"  - [TELEMETRY] {group}: {totals['calls']} calls, {totals['cache_hits']} cache hits, "
+            f"{totals['errors']} errors, {totals['retries']} retries, "
+            f"{totals['prompt_tokens']}+{totals['completion_tokens']} tokens{latency}, "
+            f"${totals['cost_usd']:.4f}"
+        )
+
+
 def search_docs_for_kg(
     llm_model: str,
     secondary_llm_model: str,
@@ -346,6 +1285,18 @@ def search_docs_for_kg(
     T: int,
     N: int,
     O: int,
+    entity_mode: str = "sequential",
+    pdf_workers: int = None,
+    llm_agent: BasicAgent = None,
+    checkpoint: ExtractionCheckpoint = None,
+    relevant_relations_only: bool = True,
+    max_relation_tokens: int = 1000,
+    window_scoped_entities: bool = True,
+    parallel_runs: bool = True,
+    phase2_mode: str = "chained",
+    pack_token_budget: int = None,
+    max_windows_per_request: int = 8,
+    stream_phase2: bool = False,
 ):
     """
     Process a single file, extract entities and build a knowledge graph.
@@ -357,10 +1308,33 @@ def search_docs_for_kg(
         T (int): Maximum tokens per window.
         N (int): Number of runs for each function per file (1 or 2).
         O (int): Overlap tokens between windows.
+        entity_mode (str): Phase 1 mode, "sequential" or "map" (concurrent windows).
+        pdf_workers (int): Processes used to extract PDF pages (None = in process).
+        llm_agent (BasicAgent): Agent to use (a new one is created if None).
+        checkpoint (ExtractionCheckpoint): Log of completed windows to resume from.
+        relevant_relations_only (bool): Put only relations touching entities
+            mentioned in the window into phase 2 prompts.
+        max_relation_tokens (int): Token cap for the relations in phase 2 prompts
+            (None = no cap).
+        window_scoped_entities (bool): Prompts of both phases list only the known
+            entities mentioned in the window plus a digest of the others.
+        parallel_runs (bool): With N=2, run the two models' passes concurrently.
+        phase2_mode (str): With N=2, "chained" (run 2 refines the run 1 graph) or
+            "independent" (each model builds a graph, merged at the end).
+        pack_token_budget (int): If set, phase 2 packs consecutive windows of this
+            document into requests of at most this many prompt tokens (None = one
+            window per request). Needs at least 2 * T to pack full windows; smaller
+            budgets turn packing off with a warning.
+        max_windows_per_request (int): Upper bound on windows packed into one request.
+        stream_phase2 (bool): Stream single-window phase 2 responses and merge
+            relations into the graph while they are generated.
 
     Returns:
-        dict: The knowledge graph for the file or None if processing failed
+        KnowledgeGraph: The knowledge graph for the file or None if processing failed
     """
+    if phase2_mode not in ("chained", "independent"):
+        raise ValueError(f"Unknown phase 2 mode: {phase2_mode}")
+
     try:
         encoding = tiktoken.get_encoding(ENCODING_NAME)
     except Exception as e:
@@ -368,9 +1342,12 @@ def search_docs_for_kg(
         print("Please ensure 'tiktoken' is installed.")
         return None
 
-    llm_agent = BasicAgent()  # Instantiate the agent
+    if llm_agent is None:
+        llm_agent = BasicAgent()  # Instantiate the agent
     final_knowledge_graph = None
 
+    document_name = os.path.basename(file_path)
+
     print(f"\nProcessing file: {file_path}")
     print(f"  - Primary LLM: {llm_model}")
     if N == 2:
@@ -381,51 +1358,52 @@ def search_docs_for_kg(
             N = 1  # Fallback to single run
         else:
             print(f"  - Secondary LLM: {secondary_llm_model}")
+    # Windows are streamed on every pass over them (PDFs are parsed only once)
+    windows = DocumentWindows(file_path, encoding, T, O, pdf_workers=pdf_workers)
     try:
-        text = extract_text(file_path)
-        if not text:
-            print(f"  - No text extracted or file empty: {file_path}")
-            return None
+        print(f"  - Streaming windows (T={T}, O={O})")
 
-        # Generate windows once per file
-        windows = list(generate_text_windows(text, encoding, T, O))
-        if not windows:
+        # --- PHASE 1: Entity Extraction ---
+        def run_phase1(run_llm_model: str, run: int) -> set:
             print(
-                f"  - No windows generated (text might be shorter than T): {file_path}"
+                f"  - [PHASE 1] Starting entity extraction (Run {run} - Model: {run_llm_model})..."
             )
-            return None
-
-        print(f"  - Generated {len(windows)} windows (T={T}, O={O})")
-
-        # --- PHASE 1: Entity Extraction ---
-        print(
-            f"  - [PHASE 1] Starting entity extraction (Run 1 - Model: {llm_model})..."
-        )
-        entities_run1 = extract_entities_from_windows(
-            llm_agent=llm_agent,
-            llm_model=llm_model,
-            file_path=file_path,
-            windows=windows,
-        )
-
-        final_entities = entities_run1
+            with telemetry_scope(document=document_name, phase="phase1"):
+                return extract_entities_from_windows(
+                    llm_agent=llm_agent,
+                    llm_model=run_llm_model,
+                    file_path=file_path,
+                    windows=windows,
+                    mode=entity_mode,
+                    checkpoint=checkpoint,
+                    run=run,
+                    window_scoped_entities=window_scoped_entities,
+                )
 
         if N == 2 and secondary_llm_model:
-            print(
-                f"  - [PHASE 1] Starting entity extraction (Run 2 - Model: {secondary_llm_model})..."
-            )
-            entities_run2 = extract_entities_from_windows(
-                llm_agent=llm_agent,
-                llm_model=secondary_llm_model,
-                file_path=file_path,
-                windows=windows,
-            )
+            if parallel_runs:
+                # Both runs are independent and usually hit different providers
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    future_run1 = executor.submit(run_phase1, llm_model, 1)
+                    future_run2 = executor.submit(run_phase1, secondary_llm_model, 2)
+                    entities_run1 = future_run1.result()
+                    entities_run2 = future_run2.result()
+            else:
+                entities_run1 = run_phase1(llm_model, 1)
+                entities_run2 = run_phase1(secondary_llm_model, 2)
             final_entities = entities_run1.union(entities_run2)
             print(
                 f"  - [PHASE 1] Combined unique entities from both runs: {len(final_entities)}"
             )
             if final_entities:
                 print(f"  - Combined Entities: {sorted(list(final_entities))}")
+        else:
+            final_entities = run_phase1(llm_model, 1)
+
+        if not windows.total_windows:
+            print(f"  - No text extracted or file empty: {file_path}")
+            return None
+        print(f"  - Processed {windows.total_windows} windows (T={T}, O={O})")
 
         if not final_entities:
             print(
@@ -434,61 +1412,106 @@ def search_docs_for_kg(
             return None
 
         # --- PHASE 2: Incremental Knowledge Graph Extraction ---
-        print(
-            f"  - [PHASE 2] Starting incremental knowledge graph extraction (Run 1 - Model: {llm_model})..."
+        mention_index = (
+            EntityMentionIndex(final_entities)
+            if relevant_relations_only or window_scoped_entities
+            else None
         )
-        kg_run1 = None  # Initialize empty knowledge graph for run 1
-
-        for i, window in enumerate(windows):
-            kg_run1 = extract_window_relations_and_attributes(
-                llm_agent=llm_agent,
-                llm_model=llm_model,
-                file_path=file_path,
-                window_text=window,
-                window_num=i + 1,
-                total_windows=len(windows),
-                entities=final_entities,  # Use combined entities
-                encoding=encoding,
-                max_tokens=T,
-                current_knowledge_graph=kg_run1,
+        if pack_token_budget and pack_token_budget < 2 * T:
+            print(
+                f"  - Warning: pack_token_budget={pack_token_budget} cannot hold two windows "
+                f"of T={T} tokens; sending one window per request"
             )
 
-        final_knowledge_graph = kg_run1  # Start with the result of run 1
-
-        if N == 2 and secondary_llm_model:
+        def run_phase2(
+            run_llm_model: str, run: int, knowledge_graph: KnowledgeGraph = None
+        ) -> KnowledgeGraph:
             print(
-                f"  - [PHASE 2] Starting incremental knowledge graph extraction (Run 2 - Model: {secondary_llm_model})..."
+                f"  - [PHASE 2] Starting incremental knowledge graph extraction (Run {run} - Model: {run_llm_model})..."
             )
-            # Run 2 refines the graph from Run 1
-            kg_run2 = kg_run1  # Start Run 2 with the graph from Run 1
-            for i, window in enumerate(windows):
-                kg_run2 = extract_window_relations_and_attributes(
-                    llm_agent=llm_agent,
-                    llm_model=secondary_llm_model,
-                    file_path=file_path,
-                    window_text=window,
-                    window_num=i + 1,  # Still use original window numbers for context
-                    total_windows=len(windows),
-                    entities=final_entities,  # Use combined entities
-                    encoding=encoding,
-                    max_tokens=T,
-                    current_knowledge_graph=kg_run2,  # Pass the evolving graph from this run
-                )
-            final_knowledge_graph = kg_run2  # The final graph is the result of run 2
+            with telemetry_scope(document=document_name, phase="phase2"):
+                if pack_token_budget and pack_token_budget >= 2 * T:
+                    return extract_relations_packed(
+                        llm_agent=llm_agent,
+                        llm_model=run_llm_model,
+                        file_path=file_path,
+                        windows=windows,
+                        total_windows=windows.total_windows,
+                        entities=final_entities,
+                        encoding=encoding,
+                        max_tokens=T,
+                        pack_token_budget=pack_token_budget,
+                        knowledge_graph=knowledge_graph,
+                        checkpoint=checkpoint,
+                        run=run,
+                        mention_index=mention_index,
+                        max_relation_tokens=max_relation_tokens,
+                        relevant_relations_only=relevant_relations_only,
+                        window_scoped_entities=window_scoped_entities,
+                        max_windows_per_request=max_windows_per_request,
+                    )
+                for i, window in enumerate(windows):
+                    knowledge_graph = extract_window_relations_and_attributes(
+                        llm_agent=llm_agent,
+                        llm_model=run_llm_model,
+                        file_path=file_path,
+                        window=window,
+                        window_num=i + 1,  # Same window numbers in both runs
+                        total_windows=windows.total_windows,
+                        entities=final_entities,  # Use combined entities
+                        encoding=encoding,
+                        max_tokens=T,
+                        current_knowledge_graph=knowledge_graph,  # The evolving graph
+                        checkpoint=checkpoint,
+                        run=run,
+                        mention_index=mention_index,
+                        max_relation_tokens=max_relation_tokens,
+                        relevant_relations_only=relevant_relations_only,
+                        window_scoped_entities=window_scoped_entities,
+                        stream_response=stream_phase2,
+                    )
+                return knowledge_graph
+
+        if N == 2 and secondary_llm_model and phase2_mode == "independent":
+            # Each model builds its own graph, the graphs are merged at the end
+            if parallel_runs:
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    future_run1 = executor.submit(run_phase2, llm_model, 1)
+                    future_run2 = executor.submit(run_phase2, secondary_llm_model, 2)
+                    kg_run1 = future_run1.result()
+                    kg_run2 = future_run2.result()
+            else:
+                kg_run1 = run_phase2(llm_model, 1)
+                kg_run2 = run_phase2(secondary_llm_model, 2)
+            new_edges = kg_run1.merge(kg_run2)
+            print(
+                f"  - [PHASE 2] Merged run 2 graph into run 1 graph ({new_edges} relations only found in run 2)"
+            )
+            final_knowledge_graph = kg_run1
+        else:
+            kg_run1 = run_phase2(llm_model, 1)
+            final_knowledge_graph = kg_run1  # Start with the result of run 1
+
+            if N == 2 and secondary_llm_model:
+                # Run 2 refines the graph from Run 1
+                final_knowledge_graph = run_phase2(secondary_llm_model, 2, kg_run1)
 
         # Print summary of the final knowledge graph
         if final_knowledge_graph:
-            num_entities = len(final_knowledge_graph.get("nodes", {}))
-            num_relations = len(final_knowledge_graph.get("edges", []))
+            num_entities = final_knowledge_graph.num_nodes
+            num_relations = final_knowledge_graph.num_edges
             print(
                 f"  - [PHASE 2] Final knowledge graph completed with {num_entities} nodes and {num_relations} relations"
             )
+        print_telemetry_summary(llm_agent, document_name)
 
         return final_knowledge_graph
 
     except Exception as e:
         print(f"Error processing file {file_path}: {e}")
         return None
+    finally:
+        windows.close()
 
 
 def extract_kg_from_doc(
@@ -498,7 +1521,20 @@ def extract_kg_from_doc(
     max_tokens_per_window: int = 4000,
     num_runs_per_function: int = 1,
     overlap_tokens: int = 50,
-    output_dir: str = "tmp_knowledge_graph"
+    output_dir: str = "tmp_knowledge_graph",
+    entity_mode: str = "sequential",
+    pdf_workers: int = None,
+    llm_agent: BasicAgent = None,
+    use_checkpoint: bool = True,
+    relevant_relations_only: bool = True,
+    max_relation_tokens: int = 1000,
+    window_scoped_entities: bool = True,
+    parallel_runs: bool = True,
+    phase2_mode: str = "chained",
+    pack_token_budget: int = None,
+    max_windows_per_request: int = 8,
+    stream_phase2: bool = False,
+    output_name: str = None,
 ):
     """
     Extract knowledge graph from a document and save it to JSON.
@@ -511,15 +1547,59 @@ def extract_kg_from_doc(
         num_runs_per_function (int): Number of runs per function (N)
         overlap_tokens (int): Token overlap between windows (O)
         output_dir (str): Directory to save the knowledge graph
+        entity_mode (str): Phase 1 mode, "sequential" or "map" (concurrent windows)
+        pdf_workers (int): Processes used to extract PDF pages (None = in process)
+        llm_agent (BasicAgent): Agent to use (a new one is created if None)
+        use_checkpoint (bool): Record completed windows in <output_dir>/checkpoints
+            and resume from them if an earlier run was interrupted (the log is
+            discarded if the settings or prompt templates changed)
+        relevant_relations_only (bool): Only relations touching entities mentioned
+            in the window go into phase 2 prompts
+        max_relation_tokens (int): Token cap for the relations in phase 2 prompts
+        window_scoped_entities (bool): Prompts list only the entities mentioned in
+            the window plus a digest of the others
+        parallel_runs (bool): With N=2, run the two models' passes concurrently
+        phase2_mode (str): With N=2, "chained" or "independent" phase 2 runs
+        pack_token_budget (int): Pack several phase 2 windows into requests of at
+            most this many prompt tokens (None = one window per request, needs
+            at least 2 * max_tokens_per_window)
+        max_windows_per_request (int): Upper bound on windows per packed request
+        stream_phase2 (bool): Stream single-window phase 2 responses and merge
+            relations while they are generated
+        output_name (str): File name of the JSON in output_dir
+            (default: "<file name>.json")
         
     Returns:
-        dict: The extracted knowledge graph
+        KnowledgeGraph: The extracted knowledge graph
     """
     print(f"\nExtracting knowledge graph from: {file_path}")
     print(f"Parameters: T={max_tokens_per_window}, N={num_runs_per_function}, O={overlap_tokens}")
     print(f"Primary LLM: {llm_model}")
     if num_runs_per_function == 2 and secondary_llm_model:
         print(f"Secondary LLM: {secondary_llm_model}")
+
+    checkpoint = None
+    if use_checkpoint and os.path.exists(file_path):
+        file_hash = file_content_hash(file_path)
+        checkpoint = ExtractionCheckpoint(
+            checkpoint_path_for(output_dir, file_path, file_hash),
+            config={
+                "file_hash": file_hash,
+                "llm_model": llm_model,
+                "secondary_llm_model": secondary_llm_model,
+                "T": max_tokens_per_window,
+                "N": num_runs_per_function,
+                "O": overlap_tokens,
+                "entity_mode": entity_mode,
+                "phase2_mode": phase2_mode,
+                "relevant_relations_only": relevant_relations_only,
+                "max_relation_tokens": max_relation_tokens,
+                "window_scoped_entities": window_scoped_entities,
+                "pack_token_budget": pack_token_budget,
+                "max_windows_per_request": max_windows_per_request,
+                "prompts": PROMPT_REGISTRY.versions(PROMPT_PLACEHOLDERS),
+            },
+        )
     
     # Process the file to extract knowledge graph
     knowledge_graph = search_docs_for_kg(
@@ -529,28 +1609,34 @@ def extract_kg_from_doc(
         T=max_tokens_per_window,
         N=num_runs_per_function,
         O=overlap_tokens,
+        entity_mode=entity_mode,
+        pdf_workers=pdf_workers,
+        llm_agent=llm_agent,
+        checkpoint=checkpoint,
+        relevant_relations_only=relevant_relations_only,
+        max_relation_tokens=max_relation_tokens,
+        window_scoped_entities=window_scoped_entities,
+        parallel_runs=parallel_runs,
+        phase2_mode=phase2_mode,
+        pack_token_budget=pack_token_budget,
+        max_windows_per_request=max_windows_per_request,
+        stream_phase2=stream_phase2,
     )
     
     # Save the knowledge graph if it was created
     if knowledge_graph:
         # Add source_uri to all nodes and edges
         base_name = os.path.basename(file_path)
-        
-        # Add source_uri to each node
-        for node_id in knowledge_graph["nodes"]:
-            knowledge_graph["nodes"][node_id]["source_uri"] = base_name
-        
-        # Add source_uri to each edge
-        for edge in knowledge_graph["edges"]:
-            edge["source_uri"] = base_name
+        knowledge_graph.set_source_uri(base_name)
             
         os.makedirs(output_dir, exist_ok=True)
-        output_file = os.path.join(output_dir, f"{base_name}.json")
+        output_file = os.path.join(output_dir, output_name or f"{base_name}.json")
         
         try:
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump(knowledge_graph, f, indent=2)
+            knowledge_graph.save_json(output_file)
             print(f"Saved knowledge graph to {output_file}")
+            if checkpoint is not None:
+                checkpoint.remove()
         except Exception as e:
             print(f"Error saving knowledge graph: {e}")
     
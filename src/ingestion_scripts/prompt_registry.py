@@ -0,0 +1,138 @@
+import hashlib
+import os
+import string
+import threading
+from functools import lru_cache
+
+import tiktoken
+
+
+@lru_cache(maxsize=16384)
+def count_tokens_cached(text: str, encoding_name: str) -> int:
+    """
+    Token count of a small prompt fragment reused across windows (an entity
+    name, a relation line). Do not pass whole variable fields: they rarely
+    repeat, so they would only fill the cache.
+    """
+    return len(tiktoken.get_encoding(encoding_name).encode(text))
+
+
+def count_tokens_by_parts(text: str, separator: str, encoding_name: str) -> int:
+    """
+    Estimates the tokens of a separator-joined list (e.g. "A, B, C") as the
+    sum of the cached counts of its items and separators.
+    """
+    parts = text.split(separator)
+    return sum(count_tokens_cached(part, encoding_name) for part in parts) + (
+        len(parts) - 1
+    ) * count_tokens_cached(separator, encoding_name)
+
+
+class PromptTemplate:
+    """A prompt template loaded from disk with its placeholders and cached token counts."""
+
+    def __init__(self, name: str, path: str, text: str, mtime: float):
+        self.name = name
+        self.path = path
+        self.text = text
+        self.mtime = mtime
+        # Content hash, changes whenever the template text is edited
+        self.version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        # Placeholder name -> number of occurrences ("{{" escapes are not fields)
+        self.placeholders = {}
+        for _, field_name, _, _ in string.Formatter().parse(text):
+            if field_name is not None:
+                self.placeholders[field_name] = self.placeholders.get(field_name, 0) + 1
+        self._static_tokens = {}  # encoding name -> token count
+
+    def format(self, **kwargs) -> str:
+        return self.text.format(**kwargs)
+
+    def static_token_count(self, encoding: tiktoken.Encoding) -> int:
+        """Tokens of the template itself, with every placeholder left empty."""
+        if encoding.name not in self._static_tokens:
+            empty_fields = {field_name: "" for field_name in self.placeholders}
+            self._static_tokens[encoding.name] = len(
+                encoding.encode(self.text.format(**empty_fields))
+            )
+        return self._static_tokens[encoding.name]
+
+    def count_tokens(
+        self, encoding: tiktoken.Encoding, field_separators: dict = None, **kwargs
+    ) -> int:
+        """
+        Estimates the token count of the formatted prompt.
+
+        Uses the cached static overhead plus the token counts of the placeholder
+        values, so the formatted prompt never has to be tokenized as a whole.
+        Fields listed in field_separators (field name -> separator) are lists
+        whose items recur across prompts; they are counted item by item from
+        the cache. Other values are tokenized directly.
+        """
+        field_separators = field_separators or {}
+        total = self.static_token_count(encoding)
+        for field_name, occurrences in self.placeholders.items():
+            value = str(kwargs.get(field_name, ""))
+            if not value:
+                continue
+            if field_name in field_separators:
+                value_tokens = count_tokens_by_parts(
+                    value, field_separators[field_name], encoding.name
+                )
+            else:
+                value_tokens = len(encoding.encode(value))
+            total += occurrences * value_tokens
+        return total
+
+
+class PromptRegistry:
+    """
+    Loads prompt templates once and reloads them only when the file's mtime changes.
+
+    Args:
+        prompts_dir: Directory containing the template files
+        required_placeholders: Optional mapping template file -> set of placeholder
+            names the template must contain (and may not go beyond)
+    """
+
+    def __init__(self, prompts_dir: str, required_placeholders: dict = None):
+        self.prompts_dir = prompts_dir
+        self.required_placeholders = required_placeholders or {}
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def get(self, template_file: str) -> PromptTemplate:
+        """
+        Returns the template, loading or reloading it from disk if needed.
+
+        Raises:
+            OSError: If the template file cannot be read
+            ValueError: If the template placeholders do not match the expected ones
+        """
+        prompt_path = os.path.join(self.prompts_dir, template_file)
+        mtime = os.stat(prompt_path).st_mtime
+        with self._lock:
+            template = self._templates.get(template_file)
+            if template is None or template.mtime != mtime:
+                with open(prompt_path, "r", encoding="utf-8") as f:
+                    template = PromptTemplate(template_file, prompt_path, f.read(), mtime)
+                self._validate(template)
+                self._templates[template_file] = template
+            return template
+
+    def versions(self, template_files) -> dict:
+        """Template file -> version, e.g. to invalidate results made with older prompts."""
+        return {template_file: self.get(template_file).version for template_file in template_files}
+
+    def _validate(self, template: PromptTemplate):
+        expected = self.required_placeholders.get(template.name)
+        if expected is None:
+            return
+        found = set(template.placeholders)
+        missing = set(expected) - found
+        unexpected = found - set(expected)
+        if missing or unexpected:
+            raise ValueError(
+                f"Prompt template '{template.name}' has missing placeholders {sorted(missing)} "
+                f"and unexpected placeholders {sorted(unexpected)}"
+            )
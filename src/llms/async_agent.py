@@ -0,0 +1,382 @@
+import asyncio
+import time
+import typing
+
+from src.llms.basic_agent import (
+    OPENAI_COMPATIBLE_LOCATIONS,
+    BasicAgent,
+    translate_messages_from_openai_to_gemini,
+)
+from src.llms.llm_clients import create_async_llm_client, resolve_model_location
+from src.llms.response_cache import ResponseCache
+from src.llms.structured_output import build_repair_prompt, parse_structured_response
+from src.llms.retry_policy import CircuitOpenError, get_circuit_breaker, llm_retry
+from src.llms.telemetry import begin_call, current_retries
+
+
+class AsyncBasicAgent(BasicAgent):
+    """
+    Asyncio version of BasicAgent.
+
+    Uses the same configuration, model routing, response cache and usage
+    counters as BasicAgent, but talks to the providers through their async
+    clients. get_text_response_from_llm is a coroutine here. The number of
+    requests in flight per location is capped by a semaphore sized from
+    'llm_concurrency' (or the concurrency override).
+
+    Clients and semaphores are bound to the event loop they are first used
+    in, so an agent should be used from a single event loop (one asyncio.run).
+
+    Args:
+        cache: Optional ResponseCache; identical calls are then answered from disk.
+        concurrency: Optional mapping location -> max requests in flight,
+            overriding 'llm_concurrency' from the config.
+        **kwargs: Other BasicAgent options (rate_limiter, hedge_percentile, ...)
+    """
+
+    def __init__(self, cache: ResponseCache = None, concurrency: dict = None, **kwargs):
+        super().__init__(cache=cache, **kwargs)
+        if concurrency:
+            self.llm_concurrency = {**self.llm_concurrency, **concurrency}
+        self._async_clients = {}  # (location, model) -> async client
+        self._semaphores = {}  # location -> asyncio.Semaphore
+
+    def _get_async_client(self, llm_model_input: str):
+        """Returns the async client for a model, creating it on first use."""
+        model_location, resolved_model_name = resolve_model_location(
+            llm_model_input, self.llm_model_dict
+        )
+        if model_location is None:
+            return None, None, None
+        key = (model_location, resolved_model_name)
+        if key not in self._async_clients:
+            client, _, _ = create_async_llm_client(
+                f"{model_location}:{resolved_model_name}", self.llm_model_dict
+            )
+            if client is None:
+                return None, None, None
+            if hasattr(client, "with_options"):
+                # Retries are handled by the agent's retry policy (retry_policy.py)
+                client = client.with_options(max_retries=0)
+            self._async_clients[key] = client
+        return self._async_clients[key], model_location, resolved_model_name
+
+    def _get_semaphore(self, model_location: str) -> asyncio.Semaphore:
+        if model_location not in self._semaphores:
+            self._semaphores[model_location] = asyncio.Semaphore(
+                self._location_concurrency(model_location)
+            )
+        return self._semaphores[model_location]
+
+    async def get_text_response_from_llm(
+        self,
+        llm_model_input: str,
+        messages: typing.Union[str, list[dict[str, str]]],
+        code_tag: str = None,
+        json_mode: bool = False,
+        accept_response: typing.Callable[[str], bool] = None,
+    ) -> dict:
+        """
+        Gets a text response from the specified LLM without blocking the event loop.
+
+        Args:
+            llm_model_input: The model identifier string (e.g., "azure_openai:gpt-4", "gpt-4").
+            messages: A single prompt string or a list of message dictionaries (OpenAI format).
+            code_tag: Optional tag to extract code blocks from the response.
+            json_mode: Ask the provider for a JSON object (native JSON output mode).
+            accept_response: Optional check of the response text; responses it
+                rejects are not cached (see BasicAgent.get_text_response_from_llm).
+
+        Returns:
+            A dictionary containing the 'text_response' and potentially 'reasoning_content'.
+            Returns {'text_response': None, 'reasoning_content': None} on failure.
+        """
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        begin_call()  # Each task has its own context, so its own retry counter
+
+        llm_client, model_location, llm_model_name_resolved = self._get_async_client(
+            llm_model_input
+        )
+        if llm_client is None:
+            print(f"Failed to create async LLM client for {llm_model_input}. Aborting request.")
+            return {"text_response": None, "reasoning_content": None}
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = ResponseCache.make_key(
+                model_location,
+                llm_model_name_resolved,
+                messages,
+                self._generation_params(model_location, json_mode),
+            )
+            # SQLite calls can block on locks held by other processes, so they
+            # run in a worker thread instead of on the event loop
+            cached_response = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached_response is not None and not self._is_accepted(
+                cached_response.get("text_response"), accept_response
+            ):
+                await asyncio.to_thread(self.cache.delete, cache_key)
+                cached_response = None
+            if cached_response is not None:
+                self.telemetry.record_cache_hit(model_location, llm_model_name_resolved)
+                return self._finalize_response(
+                    cached_response.get("text_response"),
+                    cached_response.get("reasoning_content"),
+                    code_tag,
+                )
+
+        try:
+            hedge_targets = self._hedge_targets(model_location, llm_model_name_resolved)
+            if hedge_targets:
+                text_content, reasoning_content = await self._send_hedged_request_async(
+                    llm_client,
+                    model_location,
+                    llm_model_name_resolved,
+                    hedge_targets[0],
+                    messages,
+                    json_mode,
+                )
+            else:
+                text_content, reasoning_content = await self._send_request_async(
+                    llm_client, model_location, llm_model_name_resolved, messages, json_mode
+                )
+        except CircuitOpenError as e:
+            print(f"Skipping async LLM call for {model_location} ({llm_model_name_resolved}): {e}")
+            self.telemetry.record_error(model_location, llm_model_name_resolved)
+            return {"text_response": None, "reasoning_content": None}
+        except Exception as e:
+            self.telemetry.record_error(
+                model_location, llm_model_name_resolved, current_retries()
+            )
+            print(
+                f"Error during async LLM API call for {model_location} ({llm_model_name_resolved}): {type(e).__name__}: {e}"
+            )
+            return {"text_response": None, "reasoning_content": None}
+
+        if cache_key is not None and self._is_accepted(text_content, accept_response):
+            await asyncio.to_thread(
+                self.cache.put,
+                cache_key,
+                {"text_response": text_content, "reasoning_content": reasoning_content},
+            )
+
+        return self._finalize_response(text_content, reasoning_content, code_tag)
+
+    @llm_retry()
+    async def _send_request_async(
+        self,
+        llm_client,
+        model_location: str,
+        llm_model_name_resolved: str,
+        messages,
+        json_mode: bool = False,
+    ):
+        """Async version of BasicAgent._send_request; one request per attempt."""
+        circuit_breaker = get_circuit_breaker(model_location)
+        circuit_breaker.before_call()
+        reasoning_content = None
+        used_tokens = None
+        reservation = None
+        generation_params = self._generation_params(model_location, json_mode)
+
+        try:
+            async with self._get_semaphore(model_location):
+                reservation = await self.rate_limiter.acquire_async(
+                    model_location, llm_model_name_resolved, messages
+                )
+                start_time = time.perf_counter()
+                if model_location in OPENAI_COMPATIBLE_LOCATIONS:
+                    my_response = await llm_client.chat.completions.create(
+                        model=llm_model_name_resolved,
+                        messages=messages,
+                        **generation_params,
+                    )
+                    text_content = my_response.choices[0].message.content
+                    usage = getattr(my_response, "usage", None)
+                    used_tokens = self._record_usage(
+                        getattr(usage, "prompt_tokens", 0),
+                        getattr(usage, "completion_tokens", 0),
+                    )
+                    if hasattr(my_response.choices[0].message, "reasoning_content"):
+                        reasoning_content = my_response.choices[0].message.reasoning_content
+
+                elif model_location == "google_ai_studio":
+                    gemini_messages, last_message = (
+                        translate_messages_from_openai_to_gemini(messages)
+                    )
+                    chat_session = llm_client.start_chat(history=gemini_messages)
+                    response = await chat_session.send_message_async(
+                        last_message, generation_config=generation_params
+                    )
+                    text_content = response.text
+                    usage = getattr(response, "usage_metadata", None)
+                    used_tokens = self._record_usage(
+                        getattr(usage, "prompt_token_count", 0),
+                        getattr(usage, "candidates_token_count", 0),
+                    )
+
+                else:
+                    raise ValueError(
+                        f"Unsupported model location '{model_location}' encountered in get_text_response."
+                    )
+        except Exception as e:
+            circuit_breaker.record_failure(e)
+            if reservation is not None:
+                # Refund the tokens so a retry does not pay twice
+                self.rate_limiter.reconcile(reservation, 0)
+            raise
+
+        end_time = time.perf_counter()
+        circuit_breaker.record_success()
+        self.latency_tracker.record(
+            model_location, llm_model_name_resolved, end_time - start_time
+        )
+        self._record_call_metrics(
+            model_location,
+            llm_model_name_resolved,
+            start_time,
+            None,
+            end_time,
+            getattr(usage, "prompt_tokens", None) or getattr(usage, "prompt_token_count", 0),
+            getattr(usage, "completion_tokens", None)
+            or getattr(usage, "candidates_token_count", 0),
+            streamed=False,
+        )
+        self.rate_limiter.reconcile(reservation, used_tokens or None)
+        return text_content, reasoning_content
+
+    async def _send_to_async(self, llm_model_input: str, messages, json_mode: bool = False):
+        """Sends a request to a "location:model" deployment."""
+        llm_client, model_location, llm_model_name_resolved = self._get_async_client(
+            llm_model_input
+        )
+        if llm_client is None:
+            raise ValueError(f"Failed to create async LLM client for {llm_model_input}")
+        return await self._send_request_async(
+            llm_client, model_location, llm_model_name_resolved, messages, json_mode
+        )
+
+    async def _send_hedged_request_async(
+        self,
+        llm_client,
+        model_location: str,
+        llm_model_name_resolved: str,
+        hedge_target: str,
+        messages,
+        json_mode: bool = False,
+    ):
+        """
+        Async version of BasicAgent._send_hedged_request. The slower request
+        is cancelled as soon as the other one has answered.
+        """
+        delay = self._hedge_delay(model_location, llm_model_name_resolved)
+        primary = asyncio.ensure_future(
+            self._send_request_async(
+                llm_client, model_location, llm_model_name_resolved, messages, json_mode
+            )
+        )
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done and primary.exception() is None:
+            return primary.result()
+
+        if done:
+            print(f"    - Primary {model_location} failed, failing over to {hedge_target}")
+            self._count_hedge("failovers")
+        else:
+            print(f"    - No answer from {model_location} after {delay:.1f}s, hedging to {hedge_target}")
+            self._count_hedge("hedged")
+        hedge = asyncio.ensure_future(
+            self._send_to_async(hedge_target, messages, json_mode)
+        )
+
+        pending = {primary, hedge}
+        first_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count_hedge("hedge_wins")
+                        return task.result()
+                    first_error = first_error or task.exception()
+            raise first_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def get_json_response_from_llm(
+        self,
+        llm_model_input: str,
+        messages: typing.Union[str, list[dict[str, str]]],
+        schema: dict = None,
+        repair_attempts: int = 1,
+    ) -> dict:
+        """Async version of BasicAgent.get_json_response_from_llm."""
+
+        def is_valid(text):
+            return not parse_structured_response(text, schema)[1]
+
+        ai_response = await self.get_text_response_from_llm(
+            llm_model_input, messages, json_mode=True, accept_response=is_valid
+        )
+        text_response = ai_response.get("text_response")
+        data, errors = parse_structured_response(text_response, schema)
+
+        attempts = 0
+        while errors and text_response is not None and attempts < repair_attempts:
+            attempts += 1
+            print(f"    - Invalid JSON response ({errors[0]}), requesting a repair")
+            ai_response = await self.get_text_response_from_llm(
+                llm_model_input,
+                build_repair_prompt(text_response, errors, schema),
+                json_mode=True,
+                accept_response=is_valid,
+            )
+            if ai_response.get("text_response") is None:
+                break
+            text_response = ai_response["text_response"]
+            data, errors = parse_structured_response(text_response, schema)
+
+        return {
+            "data": None if errors else data,
+            "text_response": text_response,
+            "errors": errors,
+            "repair_attempts": attempts,
+        }
+
+    async def gather_responses(
+        self,
+        llm_model_input: str,
+        prompts: list,
+        code_tag: str = None,
+    ) -> list[dict]:
+        """
+        Sends all prompts concurrently and returns the responses in prompt order.
+
+        Every prompt is started at once; the per-location semaphore keeps the
+        number of requests actually in flight within the configured limit.
+
+        Args:
+            llm_model_input: The model identifier string (e.g., "azure_openai:gpt-4", "gpt-4").
+            prompts: Prompt strings or message lists (OpenAI format).
+            code_tag: Optional tag to extract code blocks from the responses.
+
+        Returns:
+            list[dict]: One response dict per prompt.
+        """
+        return await asyncio.gather(
+            *(
+                self.get_text_response_from_llm(llm_model_input, prompt, code_tag)
+                for prompt in prompts
+            )
+        )
+
+    async def aclose(self):
+        """Closes the async clients and their connection pools."""
+        for client in self._async_clients.values():
+            close = getattr(client, "close", None)
+            if close is not None and asyncio.iscoroutinefunction(close):
+                await close()
+        self._async_clients = {}
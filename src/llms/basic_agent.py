@@ -3,10 +3,54 @@ import re
 import typing
 import yaml
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 # import re
 
-from tenacity import retry, wait_random_exponential, stop_after_attempt, wait_fixed
-from src.llms.llm_clients import create_llm_client
+from src.llms.llm_clients import (
+    GEMINI_GENERATION_CONFIG,
+    resolve_model_location,
+)
+from src.llms.response_cache import ResponseCache
+from src.llms.client_registry import LLMClientRegistry, get_client_registry
+from src.llms.rate_limiter import RateLimiter, get_rate_limiter
+from src.llms.retry_policy import (
+    CircuitOpenError,
+    StreamInterruptedError,
+    get_circuit_breaker,
+    llm_retry,
+)
+from src.llms.structured_output import build_repair_prompt, parse_structured_response
+from src.llms.hedging import (
+    DEFAULT_HEDGE_DELAY_SECONDS,
+    find_equivalents,
+    get_latency_tracker,
+)
+from src.llms.telemetry import (
+    LLMTelemetry,
+    begin_call,
+    current_retries,
+    get_telemetry,
+    submit_in_context,
+)
+
+# Threads running hedged requests (primary plus hedge per call)
+HEDGE_MAX_WORKERS = 32
+# Locations served through the OpenAI chat completions interface
+OPENAI_COMPATIBLE_LOCATIONS = [
+    "azure_openai",
+    "dbrx",
+    "groq",
+    "openrouter",
+    "priv_openai",
+    "deepseek",
+]
+# Locations known to accept stream_options={"include_usage": True}
+STREAM_USAGE_LOCATIONS = {"priv_openai", "deepseek", "openrouter"}
+# Latest calls kept for time-to-first-token / tokens-per-second metrics
+CALL_METRICS_WINDOW = 1000
 
 
 def translate_messages_from_openai_to_gemini(
@@ -30,41 +74,157 @@ def translate_messages_from_openai_to_gemini(
 
 
 class BasicAgent:
-    def __init__(self):
-        """Initializes the BasicAgent, loading configuration. brraaa"""
+    def __init__(
+        self,
+        cache: ResponseCache = None,
+        client_registry: LLMClientRegistry = None,
+        rate_limiter: RateLimiter = None,
+        hedge_percentile: float = None,
+        hedge_default_delay: float = DEFAULT_HEDGE_DELAY_SECONDS,
+        telemetry: LLMTelemetry = None,
+    ):
+        """
+        Initializes the BasicAgent, loading configuration. brraaa
+
+        Args:
+            cache: Optional ResponseCache; identical calls are then answered from disk.
+            client_registry: Optional LLMClientRegistry (default: the process-wide one).
+            rate_limiter: Optional RateLimiter (default: the process-wide one built
+                from 'llm_rate_limits').
+            hedge_percentile: Enables hedged requests: if the primary deployment has
+                not answered within this latency percentile (e.g. 0.95) of its recent
+                calls, the request is also sent to an equivalent deployment from
+                'llm_equivalents' and the first answer wins. None disables hedging.
+            hedge_default_delay: Hedge delay in seconds while too few latencies are known.
+            telemetry: Optional LLMTelemetry (default: the process-wide one, priced
+                from 'llm_pricing').
+        """
         config_path = os.path.join("src", "llms", "llm_config.yaml")
         try:
             with open(config_path, "r") as file:
                 config = yaml.safe_load(file)
             self.llm_model_dict = config.get("llm_location", {})
+            self.llm_concurrency = config.get("llm_concurrency", {}) or {}
+            self.llm_rate_limits = config.get("llm_rate_limits", {}) or {}
+            self.llm_equivalents = config.get("llm_equivalents", []) or []
+            self.llm_pricing = config.get("llm_pricing", {}) or {}
             if not self.llm_model_dict:
                 print(f"Warning: 'llm_location' not found or empty in {config_path}")
         except FileNotFoundError:
             print(f"Error: Configuration file not found at {config_path}")
             self.llm_model_dict = {}
+            self.llm_concurrency = {}
+            self.llm_rate_limits = {}
+            self.llm_equivalents = []
+            self.llm_pricing = {}
         except yaml.YAMLError as e:
             print(f"Error parsing YAML configuration file {config_path}: {e}")
             self.llm_model_dict = {}
+            self.llm_concurrency = {}
+            self.llm_rate_limits = {}
+            self.llm_equivalents = []
+            self.llm_pricing = {}
 
-        # Client state - initialized on first use or when model changes
-        self.llm_client = None
-        self.model_location = None
-        self.llm_model_name = None
-        self._current_llm_input = (
-            None  # Tracks the input string used to create the current client
+        # Clients are created on first use and shared by all agents in the process
+        self.client_registry = client_registry or get_client_registry(
+            self.llm_model_dict, self.llm_concurrency
         )
+        # Requests and tokens per minute, shared by all agents in the process
+        self.rate_limiter = rate_limiter or get_rate_limiter(self.llm_rate_limits)
+        # Per call tokens, latency, retries, cache hits and cost by document/phase
+        self.telemetry = telemetry or get_telemetry(self.llm_pricing)
+
+        # Token usage summed over all calls made by this agent
+        self.usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self._usage_lock = threading.Lock()
+        # Time to first token and tokens per second of the latest calls
+        self.call_metrics = deque(maxlen=CALL_METRICS_WINDOW)
+
+        self.cache = cache
+
+        # Hedged requests across equivalent deployments
+        self.hedge_percentile = hedge_percentile
+        self.hedge_default_delay = hedge_default_delay
+        self.latency_tracker = get_latency_tracker()
+        self.hedge_stats = {"hedged": 0, "hedge_wins": 0, "failovers": 0}
+        self._hedge_executor = None
+        self._hedge_lock = threading.Lock()
+
+    def _record_usage(self, prompt_tokens, completion_tokens) -> int:
+        """Adds a call's usage to the counters and returns its total tokens."""
+        with self._usage_lock:
+            self.usage["calls"] += 1
+            self.usage["prompt_tokens"] += prompt_tokens or 0
+            self.usage["completion_tokens"] += completion_tokens or 0
+        return (prompt_tokens or 0) + (completion_tokens or 0)
 
     # Removed set_llm_client method
 
-    @retry(
-        wait=wait_fixed(2) + wait_random_exponential(multiplier=1, max=40),
-        stop=stop_after_attempt(3),
-    )
+    def _count_hedge(self, name: str):
+        with self._hedge_lock:
+            self.hedge_stats[name] += 1
+
+    def _hedge_targets(self, model_location: str, llm_model_name_resolved: str) -> list:
+        """Equivalent deployments to hedge to (empty if hedging is off)."""
+        if self.hedge_percentile is None:
+            return []
+        return find_equivalents(
+            self.llm_equivalents, model_location, llm_model_name_resolved
+        )
+
+    def _hedge_delay(self, model_location: str, llm_model_name_resolved: str) -> float:
+        """Seconds to wait for the primary before hedging."""
+        delay = self.latency_tracker.percentile(
+            model_location, llm_model_name_resolved, self.hedge_percentile
+        )
+        return self.hedge_default_delay if delay is None else delay
+
+    @staticmethod
+    def _generation_params(model_location: str, json_mode: bool = False) -> dict:
+        """
+        Generation parameters sent with calls to the location (part of the cache key).
+
+        json_mode maps onto the provider's native JSON output: response_format
+        json_object for the OpenAI-compatible APIs, response_mime_type
+        application/json for Gemini.
+        """
+        if model_location == "google_ai_studio":
+            generation_config = dict(GEMINI_GENERATION_CONFIG)
+            if json_mode:
+                generation_config["response_mime_type"] = "application/json"
+            return generation_config
+        if json_mode:
+            return {"response_format": {"type": "json_object"}}
+        return {}
+
+    def get_max_concurrency(self, llm_model_input: str) -> int:
+        """
+        Returns how many requests may be kept in flight for the location serving the model.
+
+        Args:
+            llm_model_input: The model identifier string (e.g., "azure_openai:gpt-4", "gpt-4").
+
+        Returns:
+            The configured 'llm_concurrency' limit for the model's location,
+            falling back to the 'default' entry (or 1 if nothing is configured).
+        """
+        model_location, _ = resolve_model_location(llm_model_input, self.llm_model_dict)
+        return self._location_concurrency(model_location)
+
+    def _location_concurrency(self, model_location: str) -> int:
+        limit = self.llm_concurrency.get(
+            model_location, self.llm_concurrency.get("default", 1)
+        )
+        return max(1, int(limit))
+
     def get_text_response_from_llm(
         self,
         llm_model_input: str,  # Renamed parameter for clarity
         messages: typing.Union[str, list[dict[str, str]]],
         code_tag: str = None,
+        json_mode: bool = False,
+        on_chunk: typing.Callable[[str], None] = None,
+        accept_response: typing.Callable[[str], bool] = None,
     ) -> dict:
         """
         Gets a text response from the specified LLM, handling client initialization.
@@ -73,6 +233,13 @@ class BasicAgent:
             llm_model_input: The model identifier string (e.g., "azure_openai:gpt-4", "gpt-4").
             messages: A single prompt string or a list of message dictionaries (OpenAI format).
             code_tag: Optional tag to extract code blocks from the response.
+            json_mode: Ask the provider for a JSON object (native JSON output mode).
+            on_chunk: Streams the response: called with each piece of text as it
+                arrives (once with the whole text on a cache hit). Streamed calls
+                are not hedged.
+            accept_response: Optional check of the response text; responses it
+                rejects are not cached (and rejected cache entries are dropped),
+                so a bad answer is requested again on the next identical call.
 
         Returns:
             A dictionary containing the 'text_response' and potentially 'reasoning_content'.
@@ -80,90 +247,490 @@ class BasicAgent:
         """
         if isinstance(messages, str):
             messages = [{"role": "user", "content": messages}]
+        begin_call()
 
-        # Check if the client needs to be (re)initialized
-        if self.llm_client is None or llm_model_input != self._current_llm_input:
-            print(f"Initializing LLM client for: {llm_model_input}")
-            client, location, resolved_name = create_llm_client(
+        cache_key = None
+        if self.cache is not None:
+            cache_location, cache_model_name = resolve_model_location(
                 llm_model_input, self.llm_model_dict
             )
-            if client is None:
-                print(
-                    f"Failed to create LLM client for {llm_model_input}. Aborting request."
+            if cache_location is not None:
+                cache_key = ResponseCache.make_key(
+                    cache_location,
+                    cache_model_name,
+                    messages,
+                    self._generation_params(cache_location, json_mode),
                 )
-                # Consider raising an exception here instead of returning None dict
-                return {"text_response": None, "reasoning_content": None}
-
-            self.llm_client = client
-            self.model_location = location
-            self.llm_model_name = resolved_name
-            self._current_llm_input = (
-                llm_model_input  # Store the input that created this client
+                cached_response = self.cache.get(cache_key)
+                if cached_response is not None and not self._is_accepted(
+                    cached_response.get("text_response"), accept_response
+                ):
+                    self.cache.delete(cache_key)
+                    cached_response = None
+                if cached_response is not None:
+                    self.telemetry.record_cache_hit(cache_location, cache_model_name)
+                    if on_chunk is not None and cached_response.get("text_response"):
+                        on_chunk(cached_response["text_response"])
+                    return self._finalize_response(
+                        cached_response.get("text_response"),
+                        cached_response.get("reasoning_content"),
+                        code_tag,
+                    )
+
+        # Clients are shared through the process-wide registry, so switching
+        # models reuses existing clients and their connection pools.
+        llm_client, model_location, llm_model_name_resolved = (
+            self.client_registry.get_client(llm_model_input)
+        )
+        if llm_client is None:
+            print(f"Failed to create LLM client for {llm_model_input}. Aborting request.")
+            # Consider raising an exception here instead of returning None dict
+            return {"text_response": None, "reasoning_content": None}
+
+        try:
+            # Two streams would interleave their chunks, so streamed calls are not hedged
+            hedge_targets = (
+                self._hedge_targets(model_location, llm_model_name_resolved)
+                if on_chunk is None
+                else []
             )
-        else:
-            print(f"Using existing LLM client for: {self._current_llm_input}")
+            if hedge_targets:
+                text_content, reasoning_content = self._send_hedged_request(
+                    llm_client,
+                    model_location,
+                    llm_model_name_resolved,
+                    hedge_targets[0],
+                    messages,
+                    json_mode,
+                )
+            else:
+                text_content, reasoning_content = self._send_request(
+                    llm_client,
+                    model_location,
+                    llm_model_name_resolved,
+                    messages,
+                    json_mode,
+                    on_chunk,
+                )
+        except CircuitOpenError as e:
+            print(f"Skipping LLM call for {model_location} ({llm_model_name_resolved}): {e}")
+            self.telemetry.record_error(model_location, llm_model_name_resolved)
+            return {"text_response": None, "reasoning_content": None}
+        except Exception as e:
+            # Fatal error, or retryable error after the last attempt
+            self.telemetry.record_error(
+                model_location, llm_model_name_resolved, current_retries()
+            )
+            print(
+                f"Error during LLM API call for {model_location} ({llm_model_name_resolved}): {type(e).__name__}: {e}"
+            )
+            return {"text_response": None, "reasoning_content": None}
+
+        if cache_key is not None and self._is_accepted(text_content, accept_response):
+            self.cache.put(
+                cache_key,
+                {"text_response": text_content, "reasoning_content": reasoning_content},
+            )
+
+        return self._finalize_response(text_content, reasoning_content, code_tag)
+
+    @staticmethod
+    def _is_accepted(text_content, accept_response=None) -> bool:
+        """Whether a response may be cached (and served from the cache)."""
+        if text_content is None:
+            return False
+        return accept_response is None or accept_response(text_content)
+
+    @llm_retry()
+    def _send_request(
+        self,
+        llm_client,
+        model_location: str,
+        llm_model_name_resolved: str,
+        messages,
+        json_mode: bool = False,
+        on_chunk: typing.Callable[[str], None] = None,
+    ):
+        """
+        Sends one request and returns (text_content, reasoning_content).
 
-        # Use the instance attributes for the API call
-        llm_client = self.llm_client
-        model_location = self.model_location
-        llm_model_name_resolved = self.llm_model_name
+        Errors are raised, not swallowed, so the retry policy can retry
+        rate limits, server errors and timeouts (honouring Retry-After) and
+        give up immediately on fatal errors. Every attempt passes the
+        provider's circuit breaker and the rate limiter.
+
+        With on_chunk the response is streamed and each text delta is passed to
+        on_chunk as it arrives. A stream that fails after its first delta raises
+        StreamInterruptedError and is not retried.
+        """
+        circuit_breaker = get_circuit_breaker(model_location)
+        circuit_breaker.before_call()
 
+        # Wait for room under the location/model RPM and TPM limits
+        reservation = self.rate_limiter.acquire(
+            model_location, llm_model_name_resolved, messages
+        )
         reasoning_content = None
-        text_content = None
-
-        try:  # Added try-except block for API calls
-            if model_location in [
-                "azure_openai",
-                "dbrx",
-                "groq",
-                "openrouter",
-                "priv_openai",
-                "deepseek",
-            ]:
-                my_response = llm_client.chat.completions.create(
-                    model=llm_model_name_resolved,
-                    messages=messages,
-                    # Add other parameters like temperature, max_tokens if needed
-                )
-                text_content = my_response.choices[0].message.content
-                # Check if reasoning_content exists (might vary by provider/model)
-                if hasattr(my_response.choices[0].message, "reasoning_content"):
-                    reasoning_content = my_response.choices[0].message.reasoning_content
+        generation_params = self._generation_params(model_location, json_mode)
+        timing = {"start": time.perf_counter(), "first_token": None}
 
-            elif model_location == "google_ai_studio":  # Use == for clarity
+        def deliver(delta: str):
+            if timing["first_token"] is None:
+                timing["first_token"] = time.perf_counter()
+            on_chunk(delta)
+
+        try:
+            if model_location in OPENAI_COMPATIBLE_LOCATIONS:
+                if on_chunk is not None:
+                    text_content, reasoning_content, prompt_tokens, completion_tokens = (
+                        self._stream_openai_compatible(
+                            llm_client,
+                            model_location,
+                            llm_model_name_resolved,
+                            messages,
+                            generation_params,
+                            deliver,
+                        )
+                    )
+                else:
+                    my_response = llm_client.chat.completions.create(
+                        model=llm_model_name_resolved,
+                        messages=messages,
+                        **generation_params,
+                    )
+                    text_content = my_response.choices[0].message.content
+                    usage = getattr(my_response, "usage", None)
+                    prompt_tokens = getattr(usage, "prompt_tokens", 0)
+                    completion_tokens = getattr(usage, "completion_tokens", 0)
+                    # Check if reasoning_content exists (might vary by provider/model)
+                    if hasattr(my_response.choices[0].message, "reasoning_content"):
+                        reasoning_content = my_response.choices[0].message.reasoning_content
+
+            elif model_location == "google_ai_studio":
                 gemini_messages, last_message = (
                     translate_messages_from_openai_to_gemini(messages)
                 )
-                # Ensure llm_client is the GenerativeModel instance
-                if hasattr(llm_client, "start_chat"):
-                    chat_session = llm_client.start_chat(history=gemini_messages)
-                    response = chat_session.send_message(last_message)
-                    text_content = response.text
-
+                chat_session = llm_client.start_chat(history=gemini_messages)
+                response = chat_session.send_message(
+                    last_message,
+                    generation_config=generation_params,
+                    stream=on_chunk is not None,
+                )
+                if on_chunk is not None:
+                    text_parts = []
+                    for chunk in response:
+                        # chunk.text raises ValueError on chunks without text parts
+                        # (safety ratings, finish reason or function calls only)
+                        if not (chunk.candidates and chunk.candidates[0].content.parts):
+                            continue
+                        try:
+                            chunk_text = chunk.text
+                        except ValueError:
+                            continue
+                        if chunk_text:
+                            text_parts.append(chunk_text)
+                            deliver(chunk_text)
+                    text_content = "".join(text_parts)
                 else:
-                    print("Error: Gemini client does not have 'start_chat' method.")
-                    # Handle error appropriately
-                    text_content = None  # Or raise exception
+                    text_content = response.text
+                # For a stream, usage_metadata is complete once it has been consumed
+                usage = getattr(response, "usage_metadata", None)
+                prompt_tokens = getattr(usage, "prompt_token_count", 0)
+                completion_tokens = getattr(usage, "candidates_token_count", 0)
 
             else:
-                # Should not happen if create_llm_client worked, but good practice
-                print(
-                    f"Error: Unsupported model location '{model_location}' encountered in get_text_response."
+                # Should not happen if create_llm_client worked
+                raise ValueError(
+                    f"Unsupported model location '{model_location}' encountered in get_text_response."
                 )
-                return {"text_response": None, "reasoning_content": None}
-
         except Exception as e:
-            # Catch potential API errors during the call
-            print(
-                f"Error during LLM API call for {model_location} ({llm_model_name_resolved}): {e}"
+            circuit_breaker.record_failure(e)
+            if timing["first_token"] is not None:
+                # The partial stream used tokens, so the estimate is kept
+                raise StreamInterruptedError(
+                    f"Stream from {model_location} failed after partial output: "
+                    f"{type(e).__name__}: {e}"
+                ) from e
+            # Nothing was generated: refund the tokens so a retry does not pay twice
+            self.rate_limiter.reconcile(reservation, 0)
+            raise
+
+        end_time = time.perf_counter()
+        circuit_breaker.record_success()
+        used_tokens = self._record_usage(prompt_tokens, completion_tokens)
+        self.latency_tracker.record(
+            model_location, llm_model_name_resolved, end_time - timing["start"]
+        )
+        self._record_call_metrics(
+            model_location,
+            llm_model_name_resolved,
+            timing["start"],
+            timing["first_token"],
+            end_time,
+            prompt_tokens,
+            completion_tokens,
+            streamed=on_chunk is not None,
+        )
+        self.rate_limiter.reconcile(reservation, used_tokens or None)
+        return text_content, reasoning_content
+
+    @staticmethod
+    def _stream_openai_compatible(
+        llm_client,
+        model_location: str,
+        llm_model_name_resolved: str,
+        messages,
+        generation_params: dict,
+        deliver: typing.Callable[[str], None],
+    ):
+        """
+        Streams a chat completion, passing each text delta to deliver.
+
+        Returns:
+            A tuple (text_content, reasoning_content, prompt_tokens, completion_tokens).
+            Without usage in the stream, completion tokens are estimated as the
+            number of content chunks (providers send about one token per chunk).
+        """
+        stream_params = dict(generation_params)
+        if model_location in STREAM_USAGE_LOCATIONS:
+            stream_params["stream_options"] = {"include_usage": True}
+        stream = llm_client.chat.completions.create(
+            model=llm_model_name_resolved,
+            messages=messages,
+            stream=True,
+            **stream_params,
+        )
+
+        text_parts, reasoning_parts = [], []
+        usage = None
+        content_chunks = 0
+        for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            x_groq = getattr(chunk, "x_groq", None)  # Groq reports usage here
+            usage = getattr(x_groq, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            reasoning_delta = getattr(delta, "reasoning_content", None)
+            if reasoning_delta:
+                reasoning_parts.append(reasoning_delta)
+            if delta.content:
+                content_chunks += 1
+                text_parts.append(delta.content)
+                deliver(delta.content)
+
+        prompt_tokens = getattr(usage, "prompt_tokens", 0)
+        completion_tokens = getattr(usage, "completion_tokens", None) or content_chunks
+        return (
+            "".join(text_parts),
+            "".join(reasoning_parts) or None,
+            prompt_tokens,
+            completion_tokens,
+        )
+
+    def _record_call_metrics(
+        self,
+        model_location: str,
+        llm_model_name_resolved: str,
+        start_time: float,
+        first_token_time: float,
+        end_time: float,
+        prompt_tokens,
+        completion_tokens,
+        streamed: bool,
+    ):
+        """
+        Records time to first token and output tokens per second of a call,
+        and passes the call to the telemetry.
+
+        Without streaming the first token arrives with the whole response, so
+        the time to first token is not known and the rate covers the full call.
+        """
+        generation_start = first_token_time if first_token_time is not None else start_time
+        generation_seconds = end_time - generation_start
+        metrics = {
+            "location": model_location,
+            "model": llm_model_name_resolved,
+            "streamed": streamed,
+            "latency": end_time - start_time,
+            "ttft": first_token_time - start_time if first_token_time is not None else None,
+            "completion_tokens": completion_tokens or 0,
+            "tokens_per_second": (
+                (completion_tokens or 0) / generation_seconds if generation_seconds > 0 else None
+            ),
+        }
+        with self._usage_lock:
+            self.call_metrics.append(metrics)
+        self.telemetry.record_call(
+            model_location,
+            llm_model_name_resolved,
+            prompt_tokens,
+            completion_tokens,
+            metrics["latency"],
+            ttft=metrics["ttft"],
+            retries=current_retries(),
+        )
+
+    def call_metrics_summary(self) -> dict:
+        """Mean time to first token and tokens per second per 'location:model'."""
+        with self._usage_lock:
+            metrics = list(self.call_metrics)
+        summary = {}
+        for entry in metrics:
+            key = f"{entry['location']}:{entry['model']}"
+            summary.setdefault(key, {"calls": 0, "ttft": [], "tokens_per_second": []})
+            summary[key]["calls"] += 1
+            if entry["ttft"] is not None:
+                summary[key]["ttft"].append(entry["ttft"])
+            if entry["tokens_per_second"] is not None:
+                summary[key]["tokens_per_second"].append(entry["tokens_per_second"])
+        for values in summary.values():
+            for name in ("ttft", "tokens_per_second"):
+                samples = values[name]
+                values[f"mean_{name}"] = sum(samples) / len(samples) if samples else None
+                del values[name]
+        return summary
+
+    def _send_to(self, llm_model_input: str, messages, json_mode: bool = False):
+        """Sends a request to a "location:model" deployment through the registry."""
+        llm_client, model_location, llm_model_name_resolved = (
+            self.client_registry.get_client(llm_model_input)
+        )
+        if llm_client is None:
+            raise ValueError(f"Failed to create LLM client for {llm_model_input}")
+        return self._send_request(
+            llm_client, model_location, llm_model_name_resolved, messages, json_mode
+        )
+
+    def _send_hedged_request(
+        self,
+        llm_client,
+        model_location: str,
+        llm_model_name_resolved: str,
+        hedge_target: str,
+        messages,
+        json_mode: bool = False,
+    ):
+        """
+        Sends the request to the primary deployment and, if it has not answered
+        within the hedge delay (or failed), to the equivalent hedge_target too.
+        Returns the first successful answer.
+
+        A thread cannot abort an HTTP request in flight, so the slower request
+        is abandoned: it finishes in the background and its answer is discarded.
+        """
+        with self._hedge_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=HEDGE_MAX_WORKERS, thread_name_prefix="llm-hedge"
+                )
+        delay = self._hedge_delay(model_location, llm_model_name_resolved)
+
+        # The threads keep the caller's telemetry scope
+        primary = submit_in_context(
+            self._hedge_executor,
+            self._send_request,
+            llm_client,
+            model_location,
+            llm_model_name_resolved,
+            messages,
+            json_mode,
+        )
+        done, _ = wait([primary], timeout=delay)
+        if done and primary.exception() is None:
+            return primary.result()
+
+        if done:
+            print(f"    - Primary {model_location} failed, failing over to {hedge_target}")
+            self._count_hedge("failovers")
+        else:
+            print(f"    - No answer from {model_location} after {delay:.1f}s, hedging to {hedge_target}")
+            self._count_hedge("hedged")
+        hedge = submit_in_context(
+            self._hedge_executor, self._send_to, hedge_target, messages, json_mode
+        )
+
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()  # Only effective if it has not started yet
+                    if future is hedge:
+                        self._count_hedge("hedge_wins")
+                    return future.result()
+                first_error = first_error or future.exception()
+        raise first_error
+
+    def get_json_response_from_llm(
+        self,
+        llm_model_input: str,
+        messages: typing.Union[str, list[dict[str, str]]],
+        schema: dict = None,
+        repair_attempts: int = 1,
+        on_chunk: typing.Callable[[str], None] = None,
+    ) -> dict:
+        """
+        Gets a JSON response using the provider's native JSON output mode.
+
+        The response is parsed and validated against the schema. If that fails,
+        a cheap repair call (the invalid output and the errors, without the
+        original prompt) is made up to repair_attempts times. Only responses that
+        pass validation are cached, so an invalid answer is not replayed on rerun.
+
+        Args:
+            llm_model_input: The model identifier string (e.g., "azure_openai:gpt-4", "gpt-4").
+            messages: A single prompt string or a list of message dictionaries (OpenAI format).
+            schema: Optional JSON schema (subset, see structured_output.validate_json_schema).
+            repair_attempts: Number of repair calls allowed after an invalid response.
+            on_chunk: Streams the first response (see get_text_response_from_llm);
+                repair calls are not streamed.
+
+        Returns:
+            A dictionary with 'data' (the parsed JSON, None if no valid response was
+            obtained), 'text_response' (the last raw response), 'errors' (list of
+            validation errors of the last response) and 'repair_attempts'.
+        """
+        def is_valid(text):
+            return not parse_structured_response(text, schema)[1]
+
+        ai_response = self.get_text_response_from_llm(
+            llm_model_input,
+            messages,
+            json_mode=True,
+            on_chunk=on_chunk,
+            accept_response=is_valid,
+        )
+        text_response = ai_response.get("text_response")
+        data, errors = parse_structured_response(text_response, schema)
+
+        attempts = 0
+        while errors and text_response is not None and attempts < repair_attempts:
+            attempts += 1
+            print(f"    - Invalid JSON response ({errors[0]}), requesting a repair")
+            ai_response = self.get_text_response_from_llm(
+                llm_model_input,
+                build_repair_prompt(text_response, errors, schema),
+                json_mode=True,
+                accept_response=is_valid,
             )
-            # The retry decorator might handle this, but good to log
-            # Depending on retry logic, might want to re-raise or return error state
-            return {"text_response": None, "reasoning_content": None}
+            if ai_response.get("text_response") is None:
+                break
+            text_response = ai_response["text_response"]
+            data, errors = parse_structured_response(text_response, schema)
 
-        # print("heellooo")
-        # print(text_content)
+        return {
+            "data": None if errors else data,
+            "text_response": text_response,
+            "errors": errors,
+            "repair_attempts": attempts,
+        }
 
+    @staticmethod
+    def _finalize_response(text_content, reasoning_content, code_tag: str = None) -> dict:
+        """Builds the response dict, extracting the code block if a code_tag is given."""
         # Process response and extract code if needed
         if text_content is not None and code_tag is not None:
             tool_escaping_pattern = rf"```\s?{code_tag}\s?(.*?)```"
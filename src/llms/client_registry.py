@@ -0,0 +1,177 @@
+import threading
+
+import httpx
+
+from src.llms.llm_clients import create_llm_client, resolve_model_location
+
+
+# --- Constants ---
+# Locations whose SDK clients accept a shared httpx.Client
+HTTPX_LOCATIONS = {"azure_openai", "priv_openai", "dbrx", "openrouter", "deepseek", "groq"}
+DEFAULT_POOL_SIZE = 4
+# Extra connections allowed on top of the keep-alive pool (e.g. N=2 parallel runs)
+POOL_OVERFLOW_FACTOR = 2
+HTTP_TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+
+
+class _TrackedTransport(httpx.HTTPTransport):
+    """HTTP transport that counts requests and the TCP connections it had to open."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.requests = 0
+        self.connections_opened = 0
+        self._stats_lock = threading.Lock()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        previous_trace = request.extensions.get("trace")
+
+        def trace(event_name, info):
+            if event_name.endswith("connect_tcp.complete"):
+                with self._stats_lock:
+                    self.connections_opened += 1
+            if previous_trace is not None:
+                previous_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        with self._stats_lock:
+            self.requests += 1
+        return super().handle_request(request)
+
+    def open_connections(self) -> int:
+        pool = getattr(self, "_pool", None)
+        return len(getattr(pool, "connections", ()))
+
+
+class LLMClientRegistry:
+    """
+    Thread-safe cache of LLM clients keyed by (location, model).
+
+    Clients are created once and reused by every agent and call in the process.
+    The OpenAI-compatible and Groq clients of one location share a single
+    httpx.Client, so their keep-alive connections (and TLS sessions) survive
+    model switches. The keep-alive pool of a location is sized from its
+    'llm_concurrency' limit.
+
+    Args:
+        llm_model_dict: Dictionary mapping locations to lists of supported models.
+        llm_concurrency: Optional mapping location -> max requests in flight.
+    """
+
+    def __init__(self, llm_model_dict: dict, llm_concurrency: dict = None):
+        self.llm_model_dict = llm_model_dict
+        self.llm_concurrency = llm_concurrency or {}
+        self._clients = {}  # (location, model) -> client
+        self._http_clients = {}  # location -> httpx.Client
+        self._transports = {}  # location -> _TrackedTransport
+        self._lock = threading.Lock()
+        self.clients_created = 0
+        self.client_hits = 0
+
+    def _pool_size(self, model_location: str) -> int:
+        limit = self.llm_concurrency.get(
+            model_location, self.llm_concurrency.get("default", DEFAULT_POOL_SIZE)
+        )
+        return max(1, int(limit))
+
+    def _get_http_client(self, model_location: str):
+        """Returns the shared httpx.Client of a location (caller holds the lock)."""
+        if model_location not in HTTPX_LOCATIONS:
+            return None
+        http_client = self._http_clients.get(model_location)
+        if http_client is None:
+            pool_size = self._pool_size(model_location)
+            transport = _TrackedTransport(
+                limits=httpx.Limits(
+                    max_connections=pool_size * POOL_OVERFLOW_FACTOR,
+                    max_keepalive_connections=pool_size,
+                )
+            )
+            http_client = httpx.Client(
+                transport=transport, timeout=HTTP_TIMEOUT, follow_redirects=True
+            )
+            self._transports[model_location] = transport
+            self._http_clients[model_location] = http_client
+        return http_client
+
+    def get_client(self, llm_model_input: str):
+        """
+        Returns the client for a model, creating it on first use.
+
+        Args:
+            llm_model_input: The model identifier string (e.g., "azure_openai:gpt-4", "gpt-4").
+
+        Returns:
+            A tuple (client, model_location, resolved_model_name), or
+            (None, None, None) if the client cannot be created.
+        """
+        model_location, resolved_model_name = resolve_model_location(
+            llm_model_input, self.llm_model_dict
+        )
+        if model_location is None:
+            return None, None, None
+
+        key = (model_location, resolved_model_name)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self.client_hits += 1
+                return client, model_location, resolved_model_name
+
+            client, model_location, resolved_model_name = create_llm_client(
+                f"{model_location}:{resolved_model_name}",
+                self.llm_model_dict,
+                http_client=self._get_http_client(model_location),
+            )
+            if client is not None:
+                if hasattr(client, "with_options"):
+                    # Retries are handled by the agent's retry policy (retry_policy.py)
+                    client = client.with_options(max_retries=0)
+                self._clients[key] = client
+                self.clients_created += 1
+        return client, model_location, resolved_model_name
+
+    def stats(self) -> dict:
+        """Client reuse and per-location connection pool counters."""
+        with self._lock:
+            pools = {}
+            for model_location, transport in self._transports.items():
+                with transport._stats_lock:
+                    requests = transport.requests
+                    connections_opened = transport.connections_opened
+                pools[model_location] = {
+                    "pool_size": self._pool_size(model_location),
+                    "open_connections": transport.open_connections(),
+                    "requests": requests,
+                    "connections_opened": connections_opened,
+                    "connections_reused": max(0, requests - connections_opened),
+                }
+            return {
+                "clients": len(self._clients),
+                "clients_created": self.clients_created,
+                "client_hits": self.client_hits,
+                "pools": pools,
+            }
+
+    def close(self):
+        """Closes the shared connection pools and forgets all clients."""
+        with self._lock:
+            for http_client in self._http_clients.values():
+                http_client.close()
+            self._clients = {}
+            self._http_clients = {}
+            self._transports = {}
+
+
+# --- Process-wide registry ---
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_client_registry(llm_model_dict: dict, llm_concurrency: dict = None) -> LLMClientRegistry:
+    """Returns the registry shared by every agent in the process, creating it on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = LLMClientRegistry(llm_model_dict, llm_concurrency)
+        return _registry
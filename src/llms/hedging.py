@@ -0,0 +1,92 @@
+import math
+import threading
+from collections import deque
+
+
+# --- Constants ---
+LATENCY_WINDOW = 200  # Latest successful calls kept per (location, model)
+MIN_LATENCY_SAMPLES = 20  # Below this the default hedge delay is used
+DEFAULT_HEDGE_DELAY_SECONDS = 20.0
+
+
+class LatencyTracker:
+    """
+    Rolling latency samples of successful LLM calls per (location, model).
+
+    Args:
+        window: Number of latest samples kept per (location, model)
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples = {}  # (location, model) -> deque of seconds
+        self._lock = threading.Lock()
+
+    def record(self, model_location: str, model_name: str, seconds: float):
+        key = (model_location, model_name)
+        with self._lock:
+            if key not in self._samples:
+                self._samples[key] = deque(maxlen=self.window)
+            self._samples[key].append(seconds)
+
+    def percentile(
+        self,
+        model_location: str,
+        model_name: str,
+        q: float,
+        min_samples: int = MIN_LATENCY_SAMPLES,
+    ):
+        """
+        Returns the q-th latency percentile (q in 0..1) in seconds, or None if
+        fewer than min_samples calls have been recorded.
+        """
+        with self._lock:
+            samples = sorted(self._samples.get((model_location, model_name), ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(q * len(samples)) - 1))
+        return samples[index]
+
+    def stats(self) -> dict:
+        """Sample count, p50 and p95 per 'location:model'."""
+        with self._lock:
+            keys = list(self._samples)
+        result = {}
+        for model_location, model_name in keys:
+            result[f"{model_location}:{model_name}"] = {
+                "samples": len(self._samples[(model_location, model_name)]),
+                "p50": self.percentile(model_location, model_name, 0.5, min_samples=1),
+                "p95": self.percentile(model_location, model_name, 0.95, min_samples=1),
+            }
+        return result
+
+
+def find_equivalents(llm_equivalents: list, model_location: str, model_name: str) -> list:
+    """
+    Returns the other deployments of a model, as "location:model" strings.
+
+    Args:
+        llm_equivalents: Groups of interchangeable "location:model" entries
+            (the 'llm_equivalents' section of llm_config.yaml)
+        model_location: Resolved location of the primary request
+        model_name: Resolved model name of the primary request
+    """
+    primary = f"{model_location}:{model_name}"
+    for group in llm_equivalents or []:
+        if primary in group:
+            return [entry for entry in group if entry != primary]
+    return []
+
+
+# --- Process-wide tracker ---
+_latency_tracker = None
+_latency_tracker_lock = threading.Lock()
+
+
+def get_latency_tracker() -> LatencyTracker:
+    """Returns the latency tracker shared by every agent in the process."""
+    global _latency_tracker
+    with _latency_tracker_lock:
+        if _latency_tracker is None:
+            _latency_tracker = LatencyTracker()
+        return _latency_tracker
@@ -0,0 +1,124 @@
+import json
+
+
+class IncrementalKGParser:
+    """
+    Incremental parser for the phase 2 knowledge graph JSON of a streamed response.
+
+    Text is fed as it arrives. As soon as an entry of the top-level "entities"
+    object or an element of the top-level "relations" array is complete, it
+    is returned as a record, so it can be merged into the graph while the rest
+    of the response is still being generated:
+
+        ("entity", name, data)   e.g. ("entity", "GPU", {"attributes": {...}})
+        ("relation", relation)   e.g. ("relation", {"source": ..., "relation": ..., "target": ...})
+
+    Text before the first "{" (such as a ```json fence) is ignored. Records that
+    are not valid JSON on their own are skipped; the caller still validates the
+    complete response at the end.
+    """
+
+    def __init__(self):
+        self._buffer = []  # Characters since the top-level "{"
+        self._started = False
+        self._finished = False
+        self._in_string = False
+        self._escape = False
+        # One frame per open container: [kind, key of the current value]
+        self._stack = []
+        self._string_start = None
+        self._last_string = None
+        self._record_start = None  # Buffer offset of the record being parsed
+        self._record_key = None
+        self.records = []
+
+    def feed(self, text: str) -> list:
+        """Consumes a chunk of the response and returns the records it completed."""
+        completed = []
+        for char in text:
+            if self._finished:
+                break
+            if not self._started:
+                if char != "{":
+                    continue
+                self._started = True
+            self._buffer.append(char)
+            position = len(self._buffer) - 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = "".join(self._buffer[self._string_start : position + 1])
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = position
+            elif char in "{[":
+                self._open(char, position)
+            elif char in "}]":
+                record = self._close(position)
+                if record is not None:
+                    completed.append(record)
+            elif char == ":" and self._stack and self._stack[-1][0] == "{":
+                self._stack[-1][1] = self._decode_key(self._last_string)
+
+        self.records.extend(completed)
+        return completed
+
+    @staticmethod
+    def _decode_key(raw_key):
+        try:
+            return json.loads(raw_key) if raw_key is not None else None
+        except json.JSONDecodeError:
+            return None
+
+    def _section(self):
+        """Name of the top-level section the innermost container belongs to."""
+        return self._stack[0][1] if self._stack else None
+
+    def _open(self, char: str, position: int):
+        depth = len(self._stack)
+        # Depth 2 containers are the entries of "entities" / elements of "relations"
+        if depth == 2 and self._record_start is None:
+            section = self._section()
+            parent = self._stack[1]
+            if section == "entities" and parent[0] == "{" and char == "{":
+                self._record_start = position
+                self._record_key = parent[1]
+            elif section == "relations" and parent[0] == "[" and char == "{":
+                self._record_start = position
+                self._record_key = None
+        self._stack.append([char, None])
+
+    def _close(self, position: int):
+        if not self._stack:
+            return None
+        self._stack.pop()
+        if not self._stack:
+            self._finished = True
+            return None
+        if len(self._stack) != 2 or self._record_start is None:
+            return None
+
+        raw_record = "".join(self._buffer[self._record_start : position + 1])
+        section = self._section()
+        key = self._record_key
+        self._record_start = None
+        self._record_key = None
+        try:
+            value = json.loads(raw_record)
+        except json.JSONDecodeError:
+            return None
+        if section == "entities":
+            return ("entity", key, value)
+        return ("relation", value)
+
+    @property
+    def finished(self) -> bool:
+        """True once the top-level object has been closed."""
+        return self._finished
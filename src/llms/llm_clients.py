@@ -1,30 +1,32 @@
 from dotenv import load_dotenv
 import os
 import yaml
-from openai import AzureOpenAI, OpenAI
-from groq import Groq
+from openai import AsyncAzureOpenAI, AsyncOpenAI, AzureOpenAI, OpenAI
+from groq import AsyncGroq, Groq
 import google.generativeai as genai
 
 load_dotenv()
 
+# Default Gemini generation settings, applied when the client is created
+GEMINI_GENERATION_CONFIG = {
+    "temperature": 0,  # Default, can be overridden
+    "response_mime_type": "text/plain",
+    "max_output_tokens": 8192,  # Default, can be overridden
+}
 
-def create_llm_client(llm_model_input: str, llm_model_dict: dict):
+
+def resolve_model_location(llm_model_input: str, llm_model_dict: dict):
     """
-    Parses the model input string, determines the location and actual model name,
-    and instantiates the appropriate LLM client.
+    Parses the model input string and determines the location and actual model name.
 
     Args:
         llm_model_input: The model identifier string (e.g., "azure_openai:gpt-4", "gpt-4").
         llm_model_dict: Dictionary mapping locations to lists of supported models.
 
     Returns:
-        A tuple containing:
-        - client: The instantiated LLM client object.
-        - model_location: The determined location (e.g., "azure_openai").
-        - resolved_model_name: The specific model name (e.g., "gpt-4").
-        Returns (None, None, None) if configuration is missing or invalid.
+        A tuple (model_location, resolved_model_name).
+        Returns (None, None) if the model cannot be resolved.
     """
-    # 1. Determine model location and name
     if ":" in llm_model_input:
         try:
             model_location, resolved_model_name = llm_model_input.split(":", 1)
@@ -37,7 +39,7 @@ def create_llm_client(llm_model_input: str, llm_model_dict: dict):
             print(
                 f"Error: Invalid model input format '{llm_model_input}'. Expected 'location:model_name' or 'model_name'."
             )
-            return None, None, None
+            return None, None
     else:
         resolved_model_name = llm_model_input
         # Find the location from the dictionary
@@ -50,9 +52,37 @@ def create_llm_client(llm_model_input: str, llm_model_dict: dict):
             print(
                 f"Error: Model '{resolved_model_name}' not found in any location in the config."
             )
-            return None, None, None
+            return None, None
         model_location = llm_locations[0]  # Take the first location found
 
+    return model_location, resolved_model_name
+
+
+def create_llm_client(llm_model_input: str, llm_model_dict: dict, http_client=None):
+    """
+    Parses the model input string, determines the location and actual model name,
+    and instantiates the appropriate LLM client.
+
+    Args:
+        llm_model_input: The model identifier string (e.g., "azure_openai:gpt-4", "gpt-4").
+        llm_model_dict: Dictionary mapping locations to lists of supported models.
+        http_client: Optional httpx.Client shared by the OpenAI-compatible and Groq
+            clients (keeps their connection pool alive across clients).
+
+    Returns:
+        A tuple containing:
+        - client: The instantiated LLM client object.
+        - model_location: The determined location (e.g., "azure_openai").
+        - resolved_model_name: The specific model name (e.g., "gpt-4").
+        Returns (None, None, None) if configuration is missing or invalid.
+    """
+    # 1. Determine model location and name
+    model_location, resolved_model_name = resolve_model_location(
+        llm_model_input, llm_model_dict
+    )
+    if model_location is None:
+        return None, None, None
+
     print(
         f"Attempting to activate client for: location='{model_location}', model='{resolved_model_name}'"
     )
@@ -65,43 +95,45 @@ def create_llm_client(llm_model_input: str, llm_model_dict: dict):
                 azure_endpoint=os.environ.get("AZURE_OPENAI_ENDPOINT"),
                 api_key=os.environ.get("AZURE_OPENAI_API_KEY"),
                 api_version=os.environ.get("OPENAI_API_VERSION"),
+                http_client=http_client,
             )
         elif model_location == "priv_openai":
             client = OpenAI(
                 api_key=os.environ.get("OPENAI_API_KEY"),
+                http_client=http_client,
             )
         elif model_location == "dbrx":
             # Assuming temperature is a default, can be overridden in the call if needed
             client = OpenAI(
                 api_key=os.environ.get("DATABRICKS_TOKEN"),
                 base_url=os.environ.get("DATABRICKS_ENDPOINT"),
+                http_client=http_client,
             )
         elif model_location == "openrouter":
             client = OpenAI(
                 base_url="https://openrouter.ai/api/v1",
                 api_key=os.environ.get("OPENROUTER_API_KEY"),
+                http_client=http_client,
             )
         elif model_location == "deepseek":
             client = OpenAI(
                 base_url="https://api.deepseek.com/",
                 api_key=os.environ.get("DEEPSEEK_API_KEY"),
+                http_client=http_client,
             )
         elif model_location == "groq":
-            client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+            client = Groq(
+                api_key=os.environ.get("GROQ_API_KEY"), http_client=http_client
+            )
         elif model_location == "google_ai_studio":
             api_key = os.environ.get("GEMINI_API_KEY")
             if not api_key:
                 raise ValueError("GEMINI_API_KEY environment variable not set.")
             genai.configure(api_key=api_key)
             # Configuration can be set per-request if needed, simplifying client creation
-            generation_config = {
-                "temperature": 0,  # Default, can be overridden
-                "response_mime_type": "text/plain",
-                "max_output_tokens": 8192,  # Default, can be overridden
-            }
             client = genai.GenerativeModel(
                 model_name=resolved_model_name,
-                generation_config=generation_config,  # Apply default config
+                generation_config=dict(GEMINI_GENERATION_CONFIG),  # Apply default config
             )
         else:
             print(f"Error: Unknown model location '{model_location}'.")
@@ -121,6 +153,79 @@ def create_llm_client(llm_model_input: str, llm_model_dict: dict):
     return client, model_location, resolved_model_name
 
 
+def create_async_llm_client(llm_model_input: str, llm_model_dict: dict):
+    """
+    Asyncio counterpart of create_llm_client, using the SDKs' async clients.
+
+    The Gemini GenerativeModel is returned as is; its chat sessions provide
+    send_message_async.
+
+    Args:
+        llm_model_input: The model identifier string (e.g., "azure_openai:gpt-4", "gpt-4").
+        llm_model_dict: Dictionary mapping locations to lists of supported models.
+
+    Returns:
+        A tuple (client, model_location, resolved_model_name).
+        Returns (None, None, None) if configuration is missing or invalid.
+    """
+    model_location, resolved_model_name = resolve_model_location(
+        llm_model_input, llm_model_dict
+    )
+    if model_location is None:
+        return None, None, None
+
+    print(
+        f"Attempting to activate async client for: location='{model_location}', model='{resolved_model_name}'"
+    )
+
+    client = None
+    try:
+        if model_location == "azure_openai":
+            client = AsyncAzureOpenAI(
+                azure_endpoint=os.environ.get("AZURE_OPENAI_ENDPOINT"),
+                api_key=os.environ.get("AZURE_OPENAI_API_KEY"),
+                api_version=os.environ.get("OPENAI_API_VERSION"),
+            )
+        elif model_location == "priv_openai":
+            client = AsyncOpenAI(
+                api_key=os.environ.get("OPENAI_API_KEY"),
+            )
+        elif model_location == "dbrx":
+            client = AsyncOpenAI(
+                api_key=os.environ.get("DATABRICKS_TOKEN"),
+                base_url=os.environ.get("DATABRICKS_ENDPOINT"),
+            )
+        elif model_location == "openrouter":
+            client = AsyncOpenAI(
+                base_url="https://openrouter.ai/api/v1",
+                api_key=os.environ.get("OPENROUTER_API_KEY"),
+            )
+        elif model_location == "deepseek":
+            client = AsyncOpenAI(
+                base_url="https://api.deepseek.com/",
+                api_key=os.environ.get("DEEPSEEK_API_KEY"),
+            )
+        elif model_location == "groq":
+            client = AsyncGroq(api_key=os.environ.get("GROQ_API_KEY"))
+        elif model_location == "google_ai_studio":
+            api_key = os.environ.get("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY environment variable not set.")
+            genai.configure(api_key=api_key)
+            client = genai.GenerativeModel(
+                model_name=resolved_model_name,
+                generation_config=dict(GEMINI_GENERATION_CONFIG),
+            )
+        else:
+            print(f"Error: Unknown model location '{model_location}'.")
+            return None, None, None
+    except Exception as e:
+        print(f"Error during async client instantiation for {model_location}: {e}")
+        return None, None, None
+
+    return client, model_location, resolved_model_name
+
+
 def get_and_print_openai_models():
     """
     Gets available OpenAI models, sorts them by creation date (newest first),
@@ -0,0 +1,255 @@
+import asyncio
+import threading
+import time
+
+import tiktoken
+
+
+# --- Constants ---
+ENCODING_NAME = "o200k_base"
+# Completion tokens reserved per request before the real usage is known
+DEFAULT_COMPLETION_TOKENS = 512
+# Tokens per message for the role / separators (OpenAI chat format)
+TOKENS_PER_MESSAGE = 4
+CHARS_PER_TOKEN = 4  # Fallback estimate if the tiktoken encoding is unavailable
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                _encoding = tiktoken.get_encoding(ENCODING_NAME)
+            except Exception as e:
+                print(f"Warning: tiktoken encoding '{ENCODING_NAME}' unavailable, estimating by length: {e}")
+                _encoding = False
+        return _encoding or None
+
+
+def estimate_prompt_tokens(messages) -> int:
+    """
+    Estimates the prompt tokens of a request before it is sent.
+
+    Args:
+        messages: A prompt string or a list of message dictionaries (OpenAI format).
+
+    Returns:
+        int: Estimated number of prompt tokens
+    """
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    encoding = _get_encoding()
+    total = 0
+    for message in messages:
+        content = str(message.get("content") or "")
+        if encoding is not None:
+            total += len(encoding.encode(content, disallowed_special=()))
+        else:
+            total += len(content) // CHARS_PER_TOKEN + 1
+        total += TOKENS_PER_MESSAGE
+    return total
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at limit_per_minute / 60 per second.
+
+    The level may go negative when a reservation is reconciled with a larger
+    actual usage; later requests then wait until the debt is paid back.
+    """
+
+    __slots__ = ("capacity", "refill_per_second", "level", "updated_at")
+
+    def __init__(self, limit_per_minute: float):
+        self.capacity = float(limit_per_minute)
+        self.refill_per_second = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(
+            self.capacity, self.level + (now - self.updated_at) * self.refill_per_second
+        )
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until the amount is available (amount is capped at the capacity)."""
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.refill_per_second)
+
+
+class Reservation:
+    """Capacity taken from the buckets of one request, reconciled after the call."""
+
+    __slots__ = ("token_buckets", "reserved_tokens")
+
+    def __init__(self, token_buckets: list, reserved_tokens: int):
+        self.token_buckets = token_buckets
+        self.reserved_tokens = reserved_tokens
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter for LLM calls.
+
+    Limits come from the 'llm_rate_limits' section of llm_config.yaml and can
+    be set per location ("groq") and per model ("groq:llama-3.3-70b-versatile");
+    a call has to fit every limit that applies to it. Before a call, one
+    request and the estimated prompt plus completion tokens are reserved
+    (waiting if needed); afterwards the reservation is corrected with the
+    token usage reported by the provider.
+
+    Args:
+        rate_limits: Mapping location or "location:model" -> {"rpm": ..., "tpm": ...}
+        completion_tokens: Completion tokens reserved per request before the call
+        share: Fraction of the limits this limiter may use, e.g. 1 / N in each
+            of N worker processes calling the same provider account
+    """
+
+    def __init__(
+        self,
+        rate_limits: dict = None,
+        completion_tokens: int = DEFAULT_COMPLETION_TOKENS,
+        share: float = 1.0,
+    ):
+        self.completion_tokens = completion_tokens
+        self.share = share
+        self._request_buckets = {}  # scope -> TokenBucket
+        self._token_buckets = {}  # scope -> TokenBucket
+        for scope, limits in (rate_limits or {}).items():
+            limits = limits or {}
+            if limits.get("rpm"):
+                self._request_buckets[scope] = TokenBucket(limits["rpm"] * share)
+            if limits.get("tpm"):
+                self._token_buckets[scope] = TokenBucket(limits["tpm"] * share)
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _buckets_for(self, model_location: str, model_name: str):
+        scopes = (model_location, f"{model_location}:{model_name}")
+        request_buckets = [self._request_buckets[s] for s in scopes if s in self._request_buckets]
+        token_buckets = [self._token_buckets[s] for s in scopes if s in self._token_buckets]
+        return request_buckets, token_buckets
+
+    def _try_reserve(self, request_buckets, token_buckets, tokens: int) -> float:
+        """Reserves capacity and returns 0, or returns the seconds to wait before retrying."""
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            for bucket in request_buckets:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(1))
+            for bucket in token_buckets:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(tokens))
+            if wait > 0:
+                return wait
+            for bucket in request_buckets:
+                bucket.level -= 1
+            for bucket in token_buckets:
+                bucket.level -= tokens
+            return 0.0
+
+    def _prepare(self, model_location: str, model_name: str, messages):
+        request_buckets, token_buckets = self._buckets_for(model_location, model_name)
+        tokens = 0
+        if token_buckets:
+            tokens = estimate_prompt_tokens(messages) + self.completion_tokens
+        return request_buckets, token_buckets, tokens
+
+    def _record_wait(self, seconds: float):
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds += seconds
+
+    def acquire(self, model_location: str, model_name: str, messages) -> Reservation:
+        """
+        Blocks until the request fits the limits of its location and model.
+
+        Args:
+            model_location: Resolved location (e.g. "groq")
+            model_name: Resolved model name
+            messages: The request messages, used to estimate the prompt tokens
+
+        Returns:
+            Reservation: Pass to reconcile() once the actual usage is known
+        """
+        request_buckets, token_buckets, tokens = self._prepare(
+            model_location, model_name, messages
+        )
+        if not request_buckets and not token_buckets:
+            return Reservation([], 0)
+        while True:
+            wait = self._try_reserve(request_buckets, token_buckets, tokens)
+            if wait == 0:
+                return Reservation(token_buckets, tokens)
+            self._record_wait(wait)
+            time.sleep(wait)
+
+    async def acquire_async(self, model_location: str, model_name: str, messages) -> Reservation:
+        """Asyncio version of acquire(); waits without blocking the event loop."""
+        request_buckets, token_buckets, tokens = self._prepare(
+            model_location, model_name, messages
+        )
+        if not request_buckets and not token_buckets:
+            return Reservation([], 0)
+        while True:
+            wait = self._try_reserve(request_buckets, token_buckets, tokens)
+            if wait == 0:
+                return Reservation(token_buckets, tokens)
+            self._record_wait(wait)
+            await asyncio.sleep(wait)
+
+    def reconcile(self, reservation: Reservation, actual_tokens: int):
+        """
+        Corrects the token buckets with the usage reported for the call.
+
+        Args:
+            reservation: The reservation returned by acquire()
+            actual_tokens: Prompt plus completion tokens of the call; 0 refunds
+                the reservation (the call failed), None keeps the estimate (the
+                provider did not report usage)
+        """
+        if not reservation.token_buckets or actual_tokens is None:
+            return
+        difference = actual_tokens - reservation.reserved_tokens
+        with self._lock:
+            for bucket in reservation.token_buckets:
+                bucket.level = min(bucket.capacity, bucket.level - difference)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"waits": self.waits, "wait_seconds": round(self.wait_seconds, 3)}
+
+
+# --- Process-wide limiter ---
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+_process_share = 1.0
+
+
+def set_process_share(share: float):
+    """
+    Sets the fraction of the configured limits the process-wide limiter may use.
+
+    Each process has its own limiter, so N worker processes calling the same
+    provider account must each take 1 / N of the limits. Call this when a
+    worker starts, before the first agent is created.
+    """
+    global _process_share, _rate_limiter
+    with _rate_limiter_lock:
+        _process_share = share
+        _rate_limiter = None  # Rebuilt with the new share on first use
+
+
+def get_rate_limiter(rate_limits: dict = None) -> RateLimiter:
+    """Returns the limiter shared by every agent in the process, creating it on first use."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(rate_limits, share=_process_share)
+        return _rate_limiter
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    Content-addressed, on-disk cache of LLM responses backed by SQLite.
+
+    Entries are keyed by a hash of the resolved location and model, the messages
+    and the generation parameters. Entries older than ttl_seconds are treated as
+    missing, and once the stored responses exceed max_size_bytes the least
+    recently used entries are evicted. The database can be shared by several
+    processes (e.g. the batch extraction workers).
+
+    Args:
+        path: SQLite database file
+        max_size_bytes: Size budget for the stored responses
+        ttl_seconds: Maximum age of an entry (None = never expires)
+    """
+
+    def __init__(
+        self,
+        path: str = os.path.join("llm_cache", "responses.sqlite"),
+        max_size_bytes: int = 512 * 1024 * 1024,
+        ttl_seconds: float = 30 * 24 * 3600,
+    ):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+        )
+        self._conn.commit()
+        self._size_estimate = self._stored_size()
+
+    @staticmethod
+    def make_key(model_location: str, model_name: str, messages, params: dict = None) -> str:
+        """Hash of everything that determines the response of a call."""
+        payload = json.dumps(
+            {
+                "location": model_location,
+                "model": model_name,
+                "messages": messages,
+                "params": params or {},
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _stored_size(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str):
+        """Returns the cached response dict, or None on a miss or an expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            response, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(response)
+
+    def put(self, key: str, response: dict):
+        """Stores a response dict and evicts old entries if over the size budget."""
+        serialized = json.dumps(response, ensure_ascii=False)
+        size = len(serialized.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, serialized, size, now, now),
+            )
+            self._conn.commit()
+            self._size_estimate += size
+            if self._size_estimate > self.max_size_bytes:
+                self._evict()
+
+    def delete(self, key: str):
+        """Drops an entry (e.g. a response the caller rejected)."""
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM responses WHERE key = ?", (key,)).rowcount
+            self._conn.commit()
+        return deleted > 0
+
+    def _evict(self):
+        """Deletes least recently used entries until the cache fits its budget."""
+        # Other processes may have written too, so start from the stored size
+        stored_size = self._stored_size()
+        while stored_size > self.max_size_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                stored_size -= size
+                self.evictions += 1
+                if stored_size <= self.max_size_bytes:
+                    break
+        self._conn.commit()
+        self._size_estimate = stored_size
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "size_bytes": self._stored_size(),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._size_estimate = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,228 @@
+import email.utils
+import threading
+import time
+
+import httpx
+import openai
+import groq
+from google.api_core import exceptions as google_exceptions
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_fixed,
+    wait_random_exponential,
+)
+from tenacity.wait import wait_base
+
+from src.llms.telemetry import note_retry
+
+
+# --- Constants ---
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+MAX_ATTEMPTS = 4
+MAX_RETRY_AFTER_SECONDS = 60.0
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive retryable failures that open the circuit
+CIRCUIT_RESET_SECONDS = 30.0  # Time an open circuit fails fast before a trial call
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+
+class StreamInterruptedError(Exception):
+    """
+    Raised when a streamed response fails after part of it was delivered.
+    Not retried: the consumer has already processed the partial output.
+    """
+
+
+# --- Error classification ---
+def error_status_code(exc: BaseException):
+    """HTTP status of an SDK error (OpenAI/Groq status_code, Google API code), or None."""
+    status_code = getattr(exc, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code
+    if isinstance(exc, google_exceptions.GoogleAPICallError) and isinstance(exc.code, int):
+        return exc.code
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    True for errors worth retrying: rate limits, server errors, timeouts and
+    connection failures. Client errors (bad request, auth, not found), an
+    open circuit, an interrupted stream and programming errors are fatal.
+    """
+    if isinstance(exc, (CircuitOpenError, StreamInterruptedError)):
+        return False
+    status_code = error_status_code(exc)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    return isinstance(
+        exc,
+        (
+            openai.APIConnectionError,  # Includes APITimeoutError
+            groq.APIConnectionError,
+            google_exceptions.RetryError,
+            httpx.TransportError,
+            TimeoutError,
+            ConnectionError,
+        ),
+    )
+
+
+def retry_after_seconds(exc: BaseException):
+    """
+    Server-requested delay before the next attempt, from the 'retry-after-ms'
+    or 'retry-after' (seconds or HTTP date) response headers. None if absent.
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms is not None:
+            return max(0.0, float(retry_after_ms) / 1000.0)
+        retry_after = headers.get("retry-after")
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(retry_after)
+            return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class wait_retry_after(wait_base):
+    """
+    Tenacity wait strategy that honours the server's Retry-After hint and falls
+    back to another wait strategy when the error carries none.
+
+    Args:
+        fallback: Wait strategy used without a hint
+        max_wait: Upper bound for server-requested delays
+    """
+
+    def __init__(self, fallback: wait_base, max_wait: float = MAX_RETRY_AFTER_SECONDS):
+        self.fallback = fallback
+        self.max_wait = max_wait
+
+    def __call__(self, retry_state) -> float:
+        exc = retry_state.outcome.exception() if retry_state.outcome else None
+        hint = retry_after_seconds(exc) if exc is not None else None
+        if hint is not None:
+            return min(hint, self.max_wait)
+        return self.fallback(retry_state)
+
+
+def _log_retry(retry_state):
+    note_retry()
+    exc = retry_state.outcome.exception()
+    print(
+        f"    - LLM call failed (attempt {retry_state.attempt_number}), retrying in "
+        f"{retry_state.next_action.sleep:.1f}s: {type(exc).__name__}: {exc}"
+    )
+
+
+def llm_retry(max_attempts: int = MAX_ATTEMPTS):
+    """
+    Retry decorator for a single LLM request (sync or async function).
+
+    Only retryable errors are retried; the last error is re-raised once the
+    attempts are used up, fatal errors are raised immediately.
+    """
+    return retry(
+        retry=retry_if_exception(is_retryable),
+        wait=wait_retry_after(
+            wait_fixed(2) + wait_random_exponential(multiplier=1, max=40)
+        ),
+        stop=stop_after_attempt(max_attempts),
+        before_sleep=_log_retry,
+        reraise=True,
+    )
+
+
+# --- Circuit breaker ---
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker.
+
+    After failure_threshold consecutive retryable failures the circuit opens
+    and calls fail fast with CircuitOpenError. Once reset_seconds have passed a
+    single trial call is let through: success closes the circuit, failure
+    opens it again.
+
+    Args:
+        name: Provider (location) name, used in messages
+        failure_threshold: Consecutive failures that open the circuit
+        reset_seconds: Time the circuit stays open before a trial call
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_seconds: float = CIRCUIT_RESET_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raises CircuitOpenError if the provider should not be called now."""
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            remaining = max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+            raise CircuitOpenError(
+                f"Circuit for '{self.name}' is open after {self.consecutive_failures} "
+                f"consecutive failures (next trial in {remaining:.0f}s)"
+            )
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self, exc: BaseException):
+        """Counts retryable failures; fatal errors say nothing about the provider's health."""
+        with self._lock:
+            self._trial_in_flight = False
+            if not is_retryable(exc):
+                if self.state == "half_open":
+                    self.state = "closed"
+                    self.consecutive_failures = 0
+                return
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"    - Opening circuit for '{self.name}' after {type(exc).__name__}")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+_circuit_breakers = {}  # location -> CircuitBreaker
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(model_location: str) -> CircuitBreaker:
+    """Returns the process-wide circuit breaker of a provider location."""
+    with _circuit_breakers_lock:
+        if model_location not in _circuit_breakers:
+            _circuit_breakers[model_location] = CircuitBreaker(model_location)
+        return _circuit_breakers[model_location]
@@ -0,0 +1,133 @@
+import json
+import re
+
+
+# --- Constants ---
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "null": type(None),
+}
+_CODE_FENCE_PATTERN = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.DOTALL)
+MAX_REPORTED_ERRORS = 10
+
+
+def _matches_type(value, expected_type: str) -> bool:
+    if expected_type == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if expected_type == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    python_type = _JSON_TYPES.get(expected_type)
+    return python_type is None or isinstance(value, python_type)
+
+
+def validate_json_schema(data, schema: dict, path: str = "$") -> list:
+    """
+    Validates parsed JSON against a small JSON Schema subset: type, enum,
+    properties, required, additionalProperties and items.
+
+    Args:
+        data: Parsed JSON value
+        schema: The schema (dict)
+        path: Location of data in the document, used in error messages
+
+    Returns:
+        list: Error messages, empty if the data is valid
+    """
+    if not schema:
+        return []
+    errors = []
+
+    expected_types = schema.get("type")
+    if expected_types is not None:
+        if isinstance(expected_types, str):
+            expected_types = [expected_types]
+        if not any(_matches_type(data, t) for t in expected_types):
+            return [f"{path}: expected {' or '.join(expected_types)}, got {type(data).__name__}"]
+
+    if "enum" in schema and data not in schema["enum"]:
+        errors.append(f"{path}: {data!r} is not one of {schema['enum']}")
+
+    if isinstance(data, dict):
+        properties = schema.get("properties", {})
+        for name in schema.get("required", []):
+            if name not in data:
+                errors.append(f"{path}: missing required property '{name}'")
+        additional = schema.get("additionalProperties", True)
+        for name, value in data.items():
+            if name in properties:
+                errors.extend(validate_json_schema(value, properties[name], f"{path}.{name}"))
+            elif additional is False:
+                errors.append(f"{path}: unexpected property '{name}'")
+            elif isinstance(additional, dict):
+                errors.extend(validate_json_schema(value, additional, f"{path}.{name}"))
+
+    if isinstance(data, list) and isinstance(schema.get("items"), dict):
+        for i, item in enumerate(data):
+            errors.extend(validate_json_schema(item, schema["items"], f"{path}[{i}]"))
+
+    return errors
+
+
+def extract_json(text: str):
+    """
+    Parses the JSON document in an LLM response.
+
+    Accepts a bare document, one wrapped in a ```json code fence, or one
+    surrounded by explanatory text (outermost braces).
+
+    Raises:
+        ValueError: If no JSON document can be parsed (json.JSONDecodeError
+            is a ValueError)
+    """
+    text = text.strip()
+    fence_match = _CODE_FENCE_PATTERN.match(text)
+    if fence_match:
+        text = fence_match.group(1)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        json_start = text.find("{")
+        json_end = text.rfind("}") + 1
+        if json_start < 0 or json_end <= json_start:
+            raise ValueError("No JSON object found in the response")
+        return json.loads(text[json_start:json_end])
+
+
+def parse_structured_response(text: str, schema: dict = None):
+    """
+    Parses and validates a structured LLM response.
+
+    Returns:
+        tuple: (data, errors); data is None if the response could not be parsed
+    """
+    if text is None:
+        return None, ["No response from the LLM"]
+    try:
+        data = extract_json(text)
+    except ValueError as e:
+        return None, [f"Invalid JSON: {e}"]
+    return data, validate_json_schema(data, schema)
+
+
+def build_repair_prompt(text: str, errors: list, schema: dict = None) -> str:
+    """
+    Prompt asking the model to fix an invalid structured response.
+
+    Only the invalid output, the errors and the schema are sent (not the
+    original prompt), which keeps the repair call cheap.
+    """
+    error_lines = "\n".join(f"- {error}" for error in errors[:MAX_REPORTED_ERRORS])
+    schema_text = (
+        f"\nIt must match this JSON schema:\n{json.dumps(schema, indent=2)}\n"
+        if schema
+        else ""
+    )
+    return (
+        "The following output should be a single valid JSON object but it has errors:\n"
+        f"{error_lines}\n{schema_text}\n"
+        "Return ONLY the corrected JSON object, keeping all the information it contains.\n\n"
+        f"OUTPUT TO FIX:\n{text}"
+    )
@@ -0,0 +1,325 @@
+import bisect
+import contextlib
+import contextvars
+import json
+import threading
+
+
+# --- Constants ---
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+LABEL_NAMES = ("document", "phase", "provider", "model")
+UNSCOPED = "-"  # Label value of calls made outside a telemetry_scope
+
+# Document and pipeline phase the current call belongs to. Thread pools do not
+# inherit context variables; submit work with submit_in_context to keep them.
+_document = contextvars.ContextVar("llm_telemetry_document", default=UNSCOPED)
+_phase = contextvars.ContextVar("llm_telemetry_phase", default=UNSCOPED)
+# Retry counter of the logical call in progress (a one-item list, shared with
+# the threads of a hedged call)
+_call_retries = contextvars.ContextVar("llm_telemetry_retries", default=None)
+
+
+# --- Scopes ---
+@contextlib.contextmanager
+def telemetry_scope(document: str = None, phase: str = None):
+    """Labels the LLM calls made inside the block with a document and/or phase."""
+    tokens = []
+    if document is not None:
+        tokens.append((_document, _document.set(document)))
+    if phase is not None:
+        tokens.append((_phase, _phase.set(phase)))
+    try:
+        yield
+    finally:
+        for variable, token in reversed(tokens):
+            variable.reset(token)
+
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    """executor.submit that runs fn with a copy of the caller's telemetry scope."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def begin_call():
+    """Starts counting the retries of a new logical LLM call."""
+    _call_retries.set([0])
+
+
+def note_retry():
+    """Counts a retry of the current call (called by the retry policy)."""
+    counter = _call_retries.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def current_retries() -> int:
+    counter = _call_retries.get()
+    return counter[0] if counter is not None else 0
+
+
+# --- Metrics ---
+class Histogram:
+    """Fixed-bucket histogram (upper bounds, Prometheus style)."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: "Histogram"):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q: float):
+        """Upper bound of the bucket holding the q-th quantile (None if empty)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def cumulative_counts(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            yield bound, cumulative
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "buckets": {str(bound): count for bound, count in self.cumulative_counts()},
+        }
+
+
+class _Series:
+    """Counters and histograms of one (document, phase, provider, model)."""
+
+    COUNTERS = (
+        "calls",
+        "cache_hits",
+        "errors",
+        "retries",
+        "prompt_tokens",
+        "completion_tokens",
+        "cost_usd",
+    )
+
+    def __init__(self):
+        self.counters = {name: 0 for name in self.COUNTERS}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.ttft = Histogram(LATENCY_BUCKETS)
+        self.prompt_tokens = Histogram(TOKEN_BUCKETS)
+        self.completion_tokens = Histogram(TOKEN_BUCKETS)
+
+    def histograms(self) -> dict:
+        return {
+            "latency_seconds": self.latency,
+            "ttft_seconds": self.ttft,
+            "prompt_tokens_per_call": self.prompt_tokens,
+            "completion_tokens_per_call": self.completion_tokens,
+        }
+
+    def merge(self, other: "_Series"):
+        for name, value in other.counters.items():
+            self.counters[name] += value
+        own = self.histograms()
+        for name, histogram in other.histograms().items():
+            own[name].merge(histogram)
+
+
+class LLMTelemetry:
+    """
+    In-process telemetry of LLM calls: calls, cache hits, errors, retries,
+    tokens, cost, and latency / time-to-first-token / token histograms per
+    (document, phase, provider, model).
+
+    Args:
+        llm_pricing: Prices in USD per million tokens, keyed by "location:model"
+            or model name: {"input": ..., "output": ...} (the 'llm_pricing'
+            section of llm_config.yaml). Unpriced models cost 0.
+    """
+
+    def __init__(self, llm_pricing: dict = None):
+        self.llm_pricing = llm_pricing or {}
+        self._series = {}  # (document, phase, provider, model) -> _Series
+        self._lock = threading.Lock()
+
+    def _get_series(self, model_location: str, model_name: str) -> _Series:
+        """Series of the current scope (caller holds the lock)."""
+        key = (_document.get(), _phase.get(), model_location or UNSCOPED, model_name or UNSCOPED)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _Series()
+        return series
+
+    def cost(self, model_location: str, model_name: str, prompt_tokens, completion_tokens) -> float:
+        prices = self.llm_pricing.get(f"{model_location}:{model_name}") or self.llm_pricing.get(
+            model_name
+        )
+        if not prices:
+            return 0.0
+        return (
+            (prompt_tokens or 0) * prices.get("input", 0.0)
+            + (completion_tokens or 0) * prices.get("output", 0.0)
+        ) / 1_000_000
+
+    def record_call(
+        self,
+        model_location: str,
+        model_name: str,
+        prompt_tokens,
+        completion_tokens,
+        latency: float,
+        ttft: float = None,
+        retries: int = 0,
+    ):
+        """Records a successful provider call."""
+        cost = self.cost(model_location, model_name, prompt_tokens, completion_tokens)
+        with self._lock:
+            series = self._get_series(model_location, model_name)
+            series.counters["calls"] += 1
+            series.counters["retries"] += retries
+            series.counters["prompt_tokens"] += prompt_tokens or 0
+            series.counters["completion_tokens"] += completion_tokens or 0
+            series.counters["cost_usd"] += cost
+            series.latency.observe(latency)
+            if ttft is not None:
+                series.ttft.observe(ttft)
+            series.prompt_tokens.observe(prompt_tokens or 0)
+            series.completion_tokens.observe(completion_tokens or 0)
+
+    def record_cache_hit(self, model_location: str, model_name: str):
+        with self._lock:
+            self._get_series(model_location, model_name).counters["cache_hits"] += 1
+
+    def record_error(self, model_location: str, model_name: str, retries: int = 0):
+        """Records a call that failed for good (after its retries)."""
+        with self._lock:
+            series = self._get_series(model_location, model_name)
+            series.counters["errors"] += 1
+            series.counters["retries"] += retries
+
+    def summary(self, group_by: tuple = ("document", "phase"), **filters) -> dict:
+        """
+        Rolls the series up by some of the labels.
+
+        Args:
+            group_by: Labels to keep, e.g. ("phase",) or ("provider", "model")
+            **filters: Only series with these label values, e.g. document="a.pdf"
+
+        Returns:
+            dict: "label=value,..." -> counters plus latency p50/p95 (bucket bounds)
+        """
+        for label in tuple(group_by) + tuple(filters):
+            if label not in LABEL_NAMES:
+                raise ValueError(f"Unknown telemetry label: {label}")
+        groups = {}
+        with self._lock:
+            for key, series in self._series.items():
+                labels = dict(zip(LABEL_NAMES, key))
+                if any(labels[name] != value for name, value in filters.items()):
+                    continue
+                group_key = ",".join(f"{name}={labels[name]}" for name in group_by) or "all"
+                if group_key not in groups:
+                    groups[group_key] = _Series()
+                groups[group_key].merge(series)
+
+        result = {}
+        for group_key, series in sorted(groups.items()):
+            entry = dict(series.counters)
+            entry["cost_usd"] = round(entry["cost_usd"], 6)
+            entry["latency_seconds_sum"] = round(series.latency.sum, 3)
+            entry["latency_p50"] = series.latency.quantile(0.5)
+            entry["latency_p95"] = series.latency.quantile(0.95)
+            entry["ttft_p50"] = series.ttft.quantile(0.5)
+            result[group_key] = entry
+        return result
+
+    def to_jsonl(self) -> str:
+        """One JSON object per series: labels, counters and histograms."""
+        lines = []
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                record = dict(zip(LABEL_NAMES, key))
+                record.update(series.counters)
+                record["cost_usd"] = round(record["cost_usd"], 6)
+                for name, histogram in series.histograms().items():
+                    record[name] = histogram.to_dict()
+                lines.append(json.dumps(record))
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def export_jsonl(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_jsonl())
+
+    def to_prometheus(self) -> str:
+        """The series in the Prometheus text exposition format."""
+        with self._lock:
+            items = sorted(self._series.items())
+        lines = []
+        for counter in _Series.COUNTERS:
+            metric = f"llm_{counter}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for key, series in items:
+                lines.append(f"{metric}{{{_format_labels(key)}}} {_format_value(series.counters[counter])}")
+        for name in _Series().histograms():
+            metric = f"llm_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for key, series in items:
+                histogram = series.histograms()[name]
+                labels = _format_labels(key)
+                for bound, count in histogram.cumulative_counts():
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f"{metric}_sum{{{labels}}} {_format_value(histogram.sum)}")
+                lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+
+def _format_labels(key: tuple) -> str:
+    def escape(value: str) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return ",".join(f'{name}="{escape(value)}"' for name, value in zip(LABEL_NAMES, key))
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+# --- Process-wide telemetry ---
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry(llm_pricing: dict = None) -> LLMTelemetry:
+    """Returns the telemetry shared by every agent in the process, creating it on first use."""
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = LLMTelemetry(llm_pricing)
+        return _telemetry
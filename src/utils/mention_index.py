@@ -0,0 +1,116 @@
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Set
+
+
+class EntityMentionIndex:
+    """
+    Finds which known entities are mentioned in a text.
+
+    Entity names are matched case-insensitively with an Aho-Corasick automaton,
+    so a text is scanned once regardless of the number of entities. Matches must
+    start and end at word boundaries ("GPU" does not match inside "GPUs").
+    New entities can be added at any time; the automaton is rebuilt lazily on
+    the next search. The index can be searched from several threads at once.
+    """
+
+    def __init__(self, entities: Iterable[str] = ()):
+        self._names: Dict[str, Set[str]] = {}  # casefolded name -> original names
+        self._dirty = True
+        self._lock = threading.Lock()  # Guards _names, _dirty and rebuilds
+        # (goto, fail, output) tables, replaced as a whole by _build so a
+        # concurrent search always sees a consistent automaton
+        self._automaton = None
+        self.add(entities)
+
+    def __len__(self):
+        return sum(len(names) for names in self._names.values())
+
+    def __contains__(self, entity: str):
+        return entity in self._names.get(entity.casefold(), ())
+
+    def add(self, entities: Iterable[str]):
+        """Adds entity names to the index."""
+        with self._lock:
+            for entity in entities:
+                key = entity.strip().casefold()
+                if not key:
+                    continue
+                names = self._names.setdefault(key, set())
+                if entity not in names:
+                    names.add(entity)
+                    self._dirty = True
+
+    def _build(self):
+        """Builds the automaton into new tables (caller holds the lock)."""
+        goto: List[Dict[str, int]] = [{}]
+        fail_links: List[int] = [0]
+        output: List[List[str]] = [[]]  # state -> casefolded names ending here
+        for key in self._names:
+            state = 0
+            for char in key:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    fail_links.append(0)
+                    output.append([])
+                state = next_state
+            output[state].append(key)
+
+        # Breadth-first pass to set failure links and inherit outputs
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fail = fail_links[state]
+                while fail and char not in goto[fail]:
+                    fail = fail_links[fail]
+                fail_links[next_state] = goto[fail].get(char, 0)
+                if fail_links[next_state] == next_state:
+                    fail_links[next_state] = 0
+                output[next_state] = output[next_state] + output[fail_links[next_state]]
+        self._automaton = (goto, fail_links, output)
+        self._dirty = False
+
+    def _get_automaton(self):
+        with self._lock:
+            if self._dirty:
+                self._build()
+            return self._automaton
+
+    def find(self, text: str) -> Set[str]:
+        """Returns the entity names (original spelling) mentioned in the text."""
+        if not self._names or not text:
+            return set()
+        goto, fail_links, output = self._get_automaton()
+
+        folded = text.casefold()
+        if len(folded) != len(text):
+            # casefold changed the length (e.g. "ß"), fall back to lower()
+            folded = text.lower() if len(text.lower()) == len(text) else text
+        found_keys = set()
+        state = 0
+        for end, char in enumerate(folded):
+            while state and char not in goto[state]:
+                state = fail_links[state]
+            state = goto[state].get(char, 0)
+            for key in output[state]:
+                if key in found_keys:
+                    continue
+                start = end - len(key) + 1
+                if _is_boundary(folded, start - 1) and _is_boundary(folded, end + 1):
+                    found_keys.add(key)
+
+        mentioned = set()
+        with self._lock:
+            for key in found_keys:
+                mentioned.update(self._names[key])
+        return mentioned
+
+
+def _is_boundary(text: str, index: int) -> bool:
+    """True if the position is outside the text or not a word character."""
+    return index < 0 or index >= len(text) or not text[index].isalnum()
@@ -22,10 +22,17 @@ class VectorStore:
     def __init__(self, name):
         self.name = name
 
+    def _restore_interrupted_save(self):
+        """Moves "<name>.old" back if a save stopped after moving it aside"""
+        old_name = f"{self.name}.old"
+        if not os.path.isdir(self.name) and os.path.isdir(old_name):
+            os.replace(old_name, self.name)
+
     def load_vector_store(self, embeddings):
         if embeddings is None:
             print("No embeddings provided")
         else:
+            self._restore_interrupted_save()
             if os.path.isdir(self.name):
                 return FAISS.load_local(
                     self.name, embeddings, allow_dangerous_deserialization=True
@@ -52,6 +59,31 @@ class VectorStore:
             existing_db.save_local(self.name)
             return existing_db
 
+    def save_vector_store(self, db):
+        """
+        Save an in-memory vector store, replacing the one on disk.
+        The store is written next to the old one first and the old one is
+        only deleted once the new one is in place, so an interrupted save
+        leaves either the old or the new store. If it stops right after the
+        old store was moved to "<name>.old", the next load or save moves it
+        back before doing anything else.
+        """
+        import shutil
+
+        tmp_name = f"{self.name}.tmp"
+        old_name = f"{self.name}.old"
+        self._restore_interrupted_save()
+        if os.path.exists(tmp_name):
+            shutil.rmtree(tmp_name)
+        db.save_local(tmp_name)
+        if os.path.exists(self.name):
+            if os.path.exists(old_name):
+                shutil.rmtree(old_name)
+            os.replace(self.name, old_name)
+        os.replace(tmp_name, self.name)
+        if os.path.exists(old_name):
+            shutil.rmtree(old_name)
+
     def drop_vector_store(self):
         """Delete the vector store directory"""
         import shutil